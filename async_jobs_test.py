@@ -0,0 +1,136 @@
+import requests
+import sys
+import time
+
+def test_async_generation_jobs():
+    """Test async job submission, polling, cancellation and SSE streaming for generation endpoints"""
+
+    base_url = "http://localhost:8001"
+    api_url = f"{base_url}/api"
+
+    print("🧪 TESTING ASYNC GENERATION JOBS AND STREAMING")
+    print("=" * 60)
+
+    login_data = {
+        "email": "test@example.com",
+        "password": "password123"
+    }
+
+    print("\n1. Testing Authentication...")
+    try:
+        response = requests.post(f"{api_url}/login", json=login_data, timeout=10)
+        if response.status_code == 200:
+            token = response.json().get('access_token')
+            print(f"✅ Authentication successful")
+            headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+        else:
+            print(f"❌ Authentication failed: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ Authentication error: {str(e)}")
+        return False
+
+    print("\n2. Creating test scenario...")
+    scenario_data = {
+        "title": "Async Job Test Scenario",
+        "description": "Regional flooding disrupting logistics and power supply",
+        "crisis_type": "natural_disaster",
+        "severity_level": 7,
+        "affected_regions": ["Northern Europe"],
+        "key_variables": ["rainfall", "grid capacity"]
+    }
+    try:
+        response = requests.post(f"{api_url}/scenarios", json=scenario_data, headers=headers, timeout=10)
+        if response.status_code == 200:
+            scenario_id = response.json().get('id')
+            print(f"✅ Scenario created: {scenario_id}")
+        else:
+            print(f"❌ Failed to create scenario: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ Scenario creation error: {str(e)}")
+        return False
+
+    print("\n3. Submitting async game book generation...")
+    try:
+        response = requests.post(f"{api_url}/scenarios/{scenario_id}/game-book?async=true", headers=headers, timeout=10)
+        if response.status_code == 202:
+            job_id = response.json().get('job_id')
+            print(f"✅ Job accepted: {job_id} ({response.json().get('status')})")
+        else:
+            print(f"❌ Expected 202, got {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ Job submission error: {str(e)}")
+        return False
+
+    print("\n4. Polling job status...")
+    try:
+        job = {}
+        for _ in range(60):
+            response = requests.get(f"{api_url}/jobs/{job_id}", headers=headers, timeout=10)
+            job = response.json()
+            if job.get('status') in ('completed', 'failed', 'cancelled'):
+                break
+            time.sleep(2)
+        if job.get('status') == 'completed' and job.get('result', {}).get('game_book_content'):
+            print(f"✅ Job completed after {job.get('attempts')} attempt(s)")
+        else:
+            print(f"❌ Job did not complete: {job.get('status')} - {job.get('error')}")
+            return False
+    except Exception as e:
+        print(f"❌ Job polling error: {str(e)}")
+        return False
+
+    print("\n5. Testing job cancellation...")
+    try:
+        response = requests.post(f"{api_url}/scenarios/{scenario_id}/strategy-implementation?async=true", headers=headers, timeout=10)
+        cancel_id = response.json().get('job_id')
+        response = requests.post(f"{api_url}/jobs/{cancel_id}/cancel", headers=headers, timeout=30)
+        if response.status_code == 200 and response.json().get('status') == 'cancelled':
+            print(f"✅ Job cancelled")
+        elif response.status_code == 409:
+            print(f"⚠️ Job finished before it could be cancelled: {response.json().get('detail')}")
+        else:
+            print(f"❌ Cancellation failed: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ Cancellation error: {str(e)}")
+        return False
+
+    print("\n6. Testing SSE streaming mode...")
+    try:
+        response = requests.post(f"{api_url}/scenarios/{scenario_id}/simulate?stream=true", headers=headers, timeout=180, stream=True)
+        events = []
+        for line in response.iter_lines(decode_unicode=True):
+            if line and line.startswith("event: "):
+                events.append(line[len("event: "):])
+        if response.headers.get('content-type', '').startswith('text/event-stream') and events[0] == 'start' and events[-1] == 'done':
+            print(f"✅ Stream delivered {events.count('token')} token event(s)")
+        else:
+            print(f"❌ Unexpected stream: {events}")
+            return False
+    except Exception as e:
+        print(f"❌ Streaming error: {str(e)}")
+        return False
+
+    print("\n7. Testing job access control...")
+    try:
+        response = requests.get(f"{api_url}/jobs/{job_id}", timeout=10)
+        if response.status_code in (401, 403):
+            print(f"✅ Authentication properly enforced")
+        else:
+            print(f"❌ Authentication not enforced - got {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ Access control test error: {str(e)}")
+        return False
+
+    print("\n" + "=" * 60)
+    print("🎉 ALL ASYNC JOB AND STREAMING TESTS PASSED!")
+    print("=" * 60)
+    return True
+
+if __name__ == "__main__":
+    success = test_async_generation_jobs()
+    sys.exit(0 if success else 1)
@@ -1,13 +1,17 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Query, Request, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import Response, StreamingResponse, JSONResponse, PlainTextResponse
+from fastapi.encoders import jsonable_encoder
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Union, ClassVar, Literal
 import uuid
 from datetime import datetime, timezone, timedelta
 from passlib.context import CryptContext
@@ -18,6 +22,19 @@ from docx import Document
 import io
 import json
 import asyncio
+import contextvars
+import hashlib
+import multiprocessing
+import threading
+import math
+import numpy as np
+import random
+import re
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from pathlib import Path
 
 ROOT_DIR = Path(__file__).parent
@@ -42,6 +59,1762 @@ ALGORITHM = "HS256"
 
 # AI Integration Setup
 EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY')
+LLM_DEFAULT_PROVIDER = "anthropic"
+LLM_DEFAULT_MODEL = "claude-3-7-sonnet-20250219"
+LLM_SMALL_MODEL = os.environ.get('LLM_SMALL_MODEL', 'claude-3-5-haiku-20241022')
+LLM_LARGE_MODEL = os.environ.get('LLM_LARGE_MODEL', LLM_DEFAULT_MODEL)
+LLM_DEFAULT_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', '8'))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', '512'))
+LLM_CACHE_DEFAULT_TTL = int(os.environ.get('LLM_CACHE_TTL_SECONDS', '3600'))
+LLM_PROVIDER = os.environ.get('LLM_PROVIDER', 'emergent')  # "emergent" or "fake"
+LLM_CALL_TIMEOUT_SECONDS = float(os.environ.get('LLM_CALL_TIMEOUT_SECONDS', '90'))
+LLM_LATENCY_TARGET_SECONDS = float(os.environ.get('LLM_LATENCY_TARGET_SECONDS', '30'))
+LLM_ADAPTIVE_MAX_LIMIT = int(os.environ.get('LLM_ADAPTIVE_MAX_LIMIT', '32'))
+LLM_LIMITER_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('LLM_LIMITER_QUEUE_TIMEOUT_SECONDS', '10'))
+# Batch and speculative calls have no caller waiting on them, so they queue until a slot frees (0 = no limit)
+LLM_BATCH_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('LLM_BATCH_QUEUE_TIMEOUT_SECONDS', '0'))
+# Calls whose result is stored retry with exponential backoff instead of persisting fallback text
+LLM_PERSIST_RETRY_ATTEMPTS = int(os.environ.get('LLM_PERSIST_RETRY_ATTEMPTS', '3'))
+LLM_PERSIST_RETRY_BASE_DELAY_SECONDS = float(os.environ.get('LLM_PERSIST_RETRY_BASE_DELAY_SECONDS', '5'))
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('LLM_BREAKER_FAILURE_THRESHOLD', '5'))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.environ.get('LLM_BREAKER_COOLDOWN_SECONDS', '30'))
+LLM_PROMPT_CACHE_TTL_SECONDS = float(os.environ.get('LLM_PROMPT_CACHE_TTL_SECONDS', '300'))
+LLM_PROMPT_CACHE_MIN_TOKENS = int(os.environ.get('LLM_PROMPT_CACHE_MIN_TOKENS', '1024'))
+LLM_DISCONNECT_POLL_SECONDS = float(os.environ.get('LLM_DISCONNECT_POLL_SECONDS', '1'))
+# Priority classes share each model's adaptive limit by weighted fair queuing. A class below its
+# floor is admitted first, and other classes leave its unused floor free while it has been active
+# within LLM_PRIORITY_FLOOR_IDLE_SECONDS.
+LLM_PRIORITY_CLASSES = ("interactive", "normal", "batch")
+LLM_PRIORITY_WEIGHTS = {
+    "interactive": float(os.environ.get('LLM_PRIORITY_INTERACTIVE_WEIGHT', '8')),
+    "normal": float(os.environ.get('LLM_PRIORITY_NORMAL_WEIGHT', '4')),
+    "batch": float(os.environ.get('LLM_PRIORITY_BATCH_WEIGHT', '1'))
+}
+LLM_PRIORITY_FLOORS = {
+    "interactive": int(os.environ.get('LLM_PRIORITY_INTERACTIVE_FLOOR', '2')),
+    "normal": int(os.environ.get('LLM_PRIORITY_NORMAL_FLOOR', '1')),
+    "batch": int(os.environ.get('LLM_PRIORITY_BATCH_FLOOR', '1'))
+}
+LLM_PRIORITY_FLOOR_IDLE_SECONDS = float(os.environ.get('LLM_PRIORITY_FLOOR_IDLE_SECONDS', '60'))
+
+# LLM Client Registry
+class LlmProfile:
+    """Named, pre-configured model profile shared by every request that uses it"""
+
+    def __init__(
+        self,
+        name: str,
+        system_message: str,
+        provider: str = LLM_DEFAULT_PROVIDER,
+        model: str = LLM_DEFAULT_MODEL,
+        max_concurrency: int = LLM_DEFAULT_CONCURRENCY,
+        transport: str = "chat",  # "chat" (LlmChat) or "text_generation" (EmergentIntegrations)
+        max_tokens: int = 4000,
+        temperature: float = 0.3,
+        cache_ttl: int = 0,  # Seconds to cache identical prompts; 0 disables caching
+        instructions: str = "",  # Role-specific guidance placed in the variable prompt suffix
+        tier: Optional[str] = None,  # Model tier the profile was routed to; None when the model is pinned
+        priority: str = "normal"  # Default scheduling class: "interactive", "normal" or "batch"
+    ):
+        self.name = name
+        self.system_message = system_message
+        self.provider = provider
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.transport = transport
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.cache_ttl = cache_ttl
+        self.instructions = instructions
+        self.tier = tier
+        self.priority = priority
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.total_calls = 0
+
+    def build_chat(self, session_id: str) -> LlmChat:
+        # LlmChat keeps per-session message history, so each call gets its own lightweight
+        # instance; the profile config, HTTP connection pool and concurrency slots are shared.
+        return LlmChat(
+            api_key=EMERGENT_LLM_KEY,
+            session_id=session_id,
+            system_message=self.system_message
+        ).with_model(self.provider, self.model)
+
+    def stats(self) -> dict:
+        return {
+            "profile": self.name,
+            "provider": self.provider,
+            "model": self.model,
+            "tier": self.tier,
+            "priority": self.priority,
+            "transport": self.transport,
+            "max_concurrency": self.max_concurrency,
+            "cache_ttl": self.cache_ttl,
+            "in_flight": self.in_flight,
+            "total_calls": self.total_calls
+        }
+
+DOCUMENT_ANALYSIS_SYSTEM_MESSAGE = """You are an expert business document analyzer specializing in extracting crisis management insights from business documents.
+
+Your role is to:
+1. Analyze business plans, strategies, and operational documents
+2. Identify key business insights and strategic priorities
+3. Extract potential risk factors and vulnerabilities
+4. Recommend relevant crisis scenarios based on document content
+5. Provide actionable intelligence for crisis planning
+
+Focus on practical insights that will enhance crisis preparedness and business continuity."""
+
+# Shared by the scenario artifact profiles so simulate, game book, action plan and strategy
+# calls on one scenario start with an identical, cacheable prefix; role guidance goes in the suffix
+SCENARIO_ARTIFACT_SYSTEM_MESSAGE = """You are an expert crisis management consultant working inside the Polycrisis Simulator. You produce planning artifacts for a single crisis scenario: simulations, tabletop game books, action plans and strategy implementation plans.
+
+Ground every artifact in the polycrisis framework and the scenario details provided. Consider how the crisis unfolds across timescales, how impacts cascade between economic, environmental, social and technological domains, which feedback loops can amplify or dampen it, and which stakeholders act on it.
+
+Be realistic, specific and actionable, and follow the task instructions given after the scenario."""
+
+LLM_PROFILE_DEFINITIONS = {
+    "scenario_adjustment": {
+        "system_message": """You are an expert scenario analysis consultant specializing in SEPTE framework analysis (Social, Economic, Political, Technological, Environmental) for crisis management.
+
+Your role is to:
+1. Analyze fuzzy logic adjustments to scenario parameters
+2. Provide real-time impact assessments based on percentage changes
+3. Generate concise, actionable insights for scenario planning
+4. Assess overall risk levels and provide strategic recommendations
+
+Focus on short, clear analysis that immediately shows the impact of parameter changes.""",
+        "priority": "interactive"
+    },
+    "ai_genie": {
+        "system_message": """You are the AI Avatar Genie for the Polycrisis Simulator. You are an expert in crisis management, risk assessment, and scenario planning. 
+
+Your role is to:
+1. Help users refine their crisis scenarios with intelligent suggestions
+2. Identify critical monitoring tasks and variables
+3. Suggest appropriate AI avatars for specific tasks
+4. Provide insights on potential risks and mitigation strategies
+
+When responding, always structure your response with:
+- Direct answer to the user's query
+- 3-5 specific suggestions for scenario improvement
+- 3-5 key monitoring tasks that should be tracked
+
+Be practical, actionable, and focus on real-world crisis management principles.""",
+        "priority": "interactive"
+    },
+    "genie_summary": {
+        "system_message": """You maintain the running memory of a conversation between a user and the AI Avatar Genie, a crisis management assistant.
+
+Merge the earlier summary with the new turns into one updated summary. Keep the user's goals, the scenarios and organizations discussed, decisions and preferences they stated, suggestions already given and open questions. Drop pleasantries and repetition. Answer in at most 250 words of plain bullet points.""",
+        "max_tokens": 600,
+        "priority": "batch"
+    },
+    "simulation": {
+        "system_message": SCENARIO_ARTIFACT_SYSTEM_MESSAGE,
+        "instructions": """You are acting as a crisis simulation engine. Cover:
+- Detailed risk assessment
+- Potential impacts and cascading effects
+- Concrete mitigation strategies
+- Key insights and recommendations
+- Confidence score (0.0-1.0) for your analysis
+
+Be thorough, realistic, and provide actionable insights based on real crisis management principles.""",
+        "cache_ttl": LLM_CACHE_DEFAULT_TTL
+    },
+    "game_book": {
+        "system_message": SCENARIO_ARTIFACT_SYSTEM_MESSAGE,
+        "instructions": """You are acting as a crisis management game book creator. The game book should:
+- Show realistic crisis progression
+- Identify critical decision points during the crisis
+- Specify resource requirements and constraints
+- Define timeline phases with clear milestones
+- Establish success metrics and evaluation criteria
+
+Provide structured, actionable game book content that can be used for tabletop exercises and crisis simulations.""",
+        "cache_ttl": LLM_CACHE_DEFAULT_TTL
+    },
+    "action_plan": {
+        "system_message": SCENARIO_ARTIFACT_SYSTEM_MESSAGE,
+        "instructions": """You are acting as a crisis management action plan developer. The plan should:
+- Define immediate actions (0-24 hours)
+- Outline short-term actions (1-30 days)
+- Plan long-term actions (1-12 months)
+- Identify responsible parties and roles
+- Specify resource allocation requirements
+- Assign priority levels based on impact and urgency
+
+Provide practical, implementable action items with clear ownership and timelines.""",
+        "cache_ttl": LLM_CACHE_DEFAULT_TTL
+    },
+    "strategy_implementation": {
+        "system_message": SCENARIO_ARTIFACT_SYSTEM_MESSAGE,
+        "instructions": """You are acting as a strategic crisis management consultant. The strategy should:
+- Set out a strategic implementation framework
+- Recommend organizational changes and improvements
+- Propose policy updates and new procedures
+- Define training and capability development needs
+- Estimate budget and resource requirements
+- Plan stakeholder engagement
+
+Provide strategic guidance that transforms crisis scenarios into organizational resilience capabilities.""",
+        "cache_ttl": LLM_CACHE_DEFAULT_TTL
+    },
+    "complex_systems": {
+        "system_message": """You are an expert in complex adaptive systems analysis, specializing in polycrisis scenarios. 
+
+Your role is to:
+1. Identify system components and their interconnections
+2. Map feedback loops and emergent behaviors
+3. Analyze adaptation mechanisms and tipping points
+4. Model system dynamics and non-linear interactions
+5. Predict cascading effects and system evolution
+
+Provide detailed analysis of how multiple crisis systems interact, adapt, and evolve in complex, non-linear ways.""",
+        "cache_ttl": LLM_CACHE_DEFAULT_TTL
+    },
+    "learning_insights": {
+        "system_message": """You are an adaptive learning AI that analyzes crisis management patterns and generates personalized insights for improved decision-making.
+
+Your role is to:
+1. Identify patterns from scenario interactions
+2. Predict optimal outcomes based on past data
+3. Suggest system optimizations and improvements
+4. Provide personalized recommendations for enhancement
+5. Generate actionable learning insights
+
+Focus on continuous improvement and adaptive learning from crisis management experiences.""",
+        "cache_ttl": LLM_CACHE_DEFAULT_TTL,
+        "priority": "batch"
+    },
+    "monitoring_suggestions": {
+        "system_message": """You are an expert monitoring and intelligence gathering system. Based on crisis scenarios, suggest the most relevant data sources, APIs, and monitoring targets.
+
+Your role is to:
+1. Analyze crisis scenarios and identify critical information sources
+2. Suggest specific APIs, websites, and data feeds to monitor
+3. Recommend keywords and search terms for effective monitoring
+4. Prioritize sources based on relevance and reliability
+5. Consider real-time vs periodic monitoring needs
+
+Provide practical, actionable monitoring suggestions that teams can implement immediately.""",
+        "cache_ttl": LLM_CACHE_DEFAULT_TTL
+    },
+    "source_relevance": {
+        "system_message": "You are an AI that evaluates the relevance of monitoring sources to crisis scenarios. Provide a relevance score from 0.0 to 1.0.",
+        "cache_ttl": LLM_CACHE_DEFAULT_TTL
+    },
+    "data_collection": {
+        "system_message": """You are an AI data collector and analyzer. Simulate realistic data collection from various sources and provide intelligent analysis.
+
+Your role is to:
+1. Simulate realistic data from monitoring sources
+2. Analyze data relevance and sentiment
+3. Determine urgency levels
+4. Provide concise, actionable summaries
+5. Identify keyword matches and patterns
+
+Generate realistic, scenario-appropriate data that would be collected from the specified monitoring sources.""",
+        "priority": "batch"
+    },
+    "website_analysis": {
+        "system_message": """You are an expert business analyst specializing in company website analysis for crisis management and business continuity planning.
+
+Your role is to:
+1. Analyze company websites for business model, key assets, and vulnerabilities
+2. Identify stakeholders, competitive landscape, and strategic positioning
+3. Assess potential crisis scenarios based on company profile
+4. Extract key business information for crisis planning
+
+Provide structured analysis that will help in creating relevant crisis scenarios."""
+    },
+    "document_analysis": {
+        "system_message": DOCUMENT_ANALYSIS_SYSTEM_MESSAGE
+    },
+    "document_chunk_summary": {
+        "system_message": """You summarize one section of a longer business document for a crisis management analyst.
+
+Keep every concrete fact that matters for crisis planning: strategic priorities, dependencies, suppliers, markets, financial figures, risks, vulnerabilities and commitments. Omit boilerplate. Answer in at most 250 words of plain bullet points.""",
+        "max_tokens": 600
+    },
+    "real_time_analysis": {
+        "system_message": "You are an expert crisis management analyst specializing in SEPTE framework analysis and organizational risk assessment.",
+        "priority": "interactive"
+    },
+    "rapid_analysis": {
+        "system_message": """You are an expert rapid business analysis consultant specializing in crisis management and business continuity.
+
+Your role is to:
+1. Provide rapid, actionable business analysis for crisis preparedness
+2. Generate vulnerability assessments and business impact analyses
+3. Recommend scenario-specific crisis management strategies
+4. Deliver competitive analysis with crisis management focus
+5. Provide clear, prioritized recommendations for immediate action
+
+Focus on speed, accuracy, and actionable insights for business decision-makers."""
+    },
+    "avatar_task": {
+        "system_message": "",
+        "model": "claude-3-5-sonnet-20241022",
+        "transport": "text_generation",
+        "max_tokens": 4000,
+        "temperature": 0.3,
+        "priority": "batch"
+    }
+}
+
+# Model tiers: small/fast for scoring, classification and short summaries, large for long-form output
+LLM_MODEL_TIERS = {
+    "small": {"provider": LLM_DEFAULT_PROVIDER, "model": LLM_SMALL_MODEL},
+    "large": {"provider": LLM_DEFAULT_PROVIDER, "model": LLM_LARGE_MODEL}
+}
+
+# Default tier per call site (profile). Profiles that set their own model, like avatar_task, are pinned.
+LLM_ROUTING_TABLE = {
+    "source_relevance": "small",
+    "scenario_adjustment": "small",
+    "real_time_analysis": "small",
+    "data_collection": "small",
+    "document_chunk_summary": "small",
+    "genie_summary": "small",
+    "ai_genie": "large",
+    "simulation": "large",
+    "game_book": "large",
+    "action_plan": "large",
+    "strategy_implementation": "large",
+    "complex_systems": "large",
+    "learning_insights": "large",
+    "monitoring_suggestions": "large",
+    "website_analysis": "large",
+    "document_analysis": "large",
+    "rapid_analysis": "large"
+}
+
+def build_llm_profile(name: str, tier: Optional[str] = None) -> "LlmProfile":
+    definition = LLM_PROFILE_DEFINITIONS[name]
+    tier = tier or LLM_ROUTING_TABLE.get(name)
+    if tier is None or "model" in definition:
+        return LlmProfile(name=name, **definition)
+    return LlmProfile(name=name, tier=tier, **LLM_MODEL_TIERS[tier], **definition)
+
+def build_llm_profiles() -> Dict[str, "LlmProfile"]:
+    """Build every named profile once at startup, on its default tier"""
+    return {name: build_llm_profile(name) for name in LLM_PROFILE_DEFINITIONS}
+
+llm_profiles = build_llm_profiles()
+
+# LLM Model Routing
+# Set per request from the authenticated user's organization, and per job from the job owner's
+llm_tenant = contextvars.ContextVar("llm_tenant", default=None)
+
+class LlmRouter:
+    """Maps each call site to a model tier, with per-tenant overrides stored in llm_routing_overrides"""
+    
+    def __init__(self, table: Dict[str, str]):
+        self.table = dict(table)
+        self.overrides: Dict[str, Dict[str, str]] = {}  # tenant -> {profile name or "*": tier}
+        self.variants: Dict[tuple, LlmProfile] = {}  # (profile name, tier) -> profile off its default tier
+    
+    async def load(self):
+        overrides = {}
+        async for entry in db.llm_routing_overrides.find({}, {"_id": 0}):
+            overrides.setdefault(entry["tenant"], {})[entry["profile"]] = entry["tier"]
+        self.overrides = overrides
+    
+    def tier_for(self, profile_name: str, tenant: Optional[str] = None) -> Optional[str]:
+        default = self.table.get(profile_name)
+        if default is None or "model" in LLM_PROFILE_DEFINITIONS[profile_name]:
+            return None
+        tenant_overrides = self.overrides.get(tenant, {}) if tenant else {}
+        return tenant_overrides.get(profile_name) or tenant_overrides.get("*") or default
+    
+    def resolve(self, profile_name: str) -> LlmProfile:
+        """Profile to use for this call, on the tier chosen for the current tenant"""
+        profile = llm_profiles[profile_name]
+        tier = self.tier_for(profile_name, llm_tenant.get())
+        if tier is None or tier == profile.tier:
+            return profile
+        variant = self.variants.get((profile_name, tier))
+        if variant is None:
+            variant = self.variants[(profile_name, tier)] = build_llm_profile(profile_name, tier)
+        return variant
+    
+    def tier_for_model(self, model: str) -> str:
+        return next((tier for tier, config in LLM_MODEL_TIERS.items() if config["model"] == model), "pinned")
+    
+    def all_profiles(self) -> List[LlmProfile]:
+        return list(llm_profiles.values()) + list(self.variants.values())
+    
+    async def set_override(self, tenant: str, profile_name: str, tier: str):
+        await db.llm_routing_overrides.update_one(
+            {"tenant": tenant, "profile": profile_name},
+            {"$set": {"tenant": tenant, "profile": profile_name, "tier": tier, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        self.overrides.setdefault(tenant, {})[profile_name] = tier
+    
+    async def delete_override(self, tenant: str, profile_name: str) -> bool:
+        result = await db.llm_routing_overrides.delete_one({"tenant": tenant, "profile": profile_name})
+        tenant_overrides = self.overrides.get(tenant, {})
+        tenant_overrides.pop(profile_name, None)
+        if not tenant_overrides:
+            self.overrides.pop(tenant, None)
+        return result.deleted_count > 0
+    
+    def stats(self) -> dict:
+        return {
+            "tiers": LLM_MODEL_TIERS,
+            "routes": {
+                name: self.tier_for(name) or f"pinned ({definition['model']})"
+                for name, definition in LLM_PROFILE_DEFINITIONS.items()
+            },
+            "overrides": self.overrides
+        }
+
+llm_router = LlmRouter(LLM_ROUTING_TABLE)
+_emergent_client = None
+
+def get_emergent_client():
+    """Lazily create the shared EmergentIntegrations client used by text_generation profiles"""
+    global _emergent_client
+    if _emergent_client is None:
+        from emergentintegrations import EmergentIntegrations
+        _emergent_client = EmergentIntegrations(api_key=EMERGENT_LLM_KEY)
+    return _emergent_client
+
+# Prompt Templates
+class LlmPrompt:
+    """User prompt split into a stable prefix shared across calls and a variable per-call suffix.
+    With an output_model the model is asked for one JSON object matching that model's schema."""
+    
+    def __init__(self, prefix: str, suffix: str, output_model=None):
+        self.prefix = prefix
+        self.suffix = suffix
+        self.output_model = output_model
+    
+    @property
+    def text(self) -> str:
+        if self.output_model is None:
+            return f"{self.prefix}\n{self.suffix}"
+        return f"{self.prefix}\n{self.suffix}\n{structured_output_instructions(self.output_model)}"
+    
+    def __str__(self) -> str:
+        return self.text
+
+def prompt_text(prompt) -> str:
+    """Full prompt text for a plain string or an LlmPrompt"""
+    return prompt.text if isinstance(prompt, LlmPrompt) else prompt
+
+def prompt_request(prompt) -> str:
+    """The part of a prompt that says what this particular call asks for"""
+    return prompt.suffix if isinstance(prompt, LlmPrompt) else prompt
+
+@lru_cache(maxsize=None)
+def structured_output_instructions(output_model) -> str:
+    schema = json.dumps(output_model.model_json_schema(), indent=2)
+    return f"""RESPONSE FORMAT
+
+Respond with a single JSON object that conforms to the JSON Schema below, with no code fences and no text before or after it. Put the full response, formatted in Markdown, in the "{output_model.text_field}" field and fill every other field from the same analysis.
+
+{schema}
+"""
+
+def with_output_model(prompt: Union[str, LlmPrompt], output_model) -> LlmPrompt:
+    """The same prompt, asking for a JSON response that fills output_model"""
+    if isinstance(prompt, LlmPrompt):
+        return LlmPrompt(prompt.prefix, prompt.suffix, output_model)
+    return LlmPrompt("", prompt, output_model)
+
+SCENARIO_FRAMEWORK_FALLBACK = """POLYCRISIS FRAMEWORK
+
+Timescales: immediate response (0-24 hours), short-term impact (1 day - 1 month), medium-term adaptation (1 month - 1 year), long-term transformation (1 year - 10+ years).
+Domains: economic, environmental, social and technological, with impacts cascading between them through reinforcing and balancing feedback loops.
+Uncertainty: separate inherent randomness (aleatory) from incomplete knowledge (epistemic) and state confidence explicitly."""
+
+def humanize_key(value: str) -> str:
+    return str(value).replace("_", " ")
+
+def build_scenario_framework_context() -> str:
+    """Polycrisis framework reference placed at the start of every scenario artifact prompt"""
+    enhancements_file = Path(__file__).parent.parent / "polycrisis_enhancements.json"
+    try:
+        with open(enhancements_file, 'r') as f:
+            categories = json.load(f)["polycrisis_enhancements"]["enhancement_categories"]
+        temporal = categories["temporal_dynamics"]
+        cross_domain = categories["cross_domain_impacts"]
+        
+        lines = ["POLYCRISIS FRAMEWORK", "", "Timescales:"]
+        for timescale in temporal["timescales"]:
+            lines.append(f"- {timescale['name']} ({timescale['duration']}): {timescale['focus']}")
+        lines += ["", "Cascade mechanisms:"]
+        for mechanism in temporal.get("cascade_mechanisms", []):
+            lines.append(f"- {mechanism['name']}: {mechanism['description']}")
+        lines += ["", "Domains:"]
+        for domain in cross_domain["domains"]:
+            lines.append(
+                f"- {domain['name']}: subsystems {', '.join(map(humanize_key, domain['subsystems']))}; "
+                f"vulnerable to {', '.join(map(humanize_key, domain['vulnerability_factors']))}; "
+                f"resilience from {', '.join(map(humanize_key, domain['resilience_factors']))}"
+            )
+        lines += ["", "Cross-domain interactions:"]
+        for edge in cross_domain.get("interaction_matrices", []):
+            lines.append(
+                f"- {edge['from_domain']} -> {edge['to_domain']} ({edge['interaction_strength']}, "
+                f"{humanize_key(edge['mechanism'])}): {edge['example']}"
+            )
+        lines += ["", "Feedback loops:"]
+        for loop in cross_domain.get("feedback_loops", []):
+            lines.append(
+                f"- {loop['name']} ({loop['type']}, {loop['loop_strength']}, {humanize_key(loop['time_delay'])}): {loop['description']}"
+            )
+        lines += ["", "Stakeholders:"]
+        for stakeholder in categories.get("stakeholder_interactions", {}).get("stakeholder_types", []):
+            lines.append(
+                f"- {stakeholder['name']}: objectives {', '.join(map(humanize_key, stakeholder['primary_objectives']))}; "
+                f"constraints {', '.join(map(humanize_key, stakeholder['constraints']))}"
+            )
+        lines += ["", "Uncertainty:"]
+        for uncertainty in categories.get("uncertainty_quantification", {}).get("uncertainty_types", []):
+            lines.append(f"- {uncertainty['name']}: {uncertainty['description']} (e.g. {uncertainty['example']})")
+        return "\n".join(lines)
+    except Exception as e:
+        logging.warning(f"Polycrisis framework unavailable for prompts, using the short form: {str(e)}")
+        return SCENARIO_FRAMEWORK_FALLBACK
+
+SCENARIO_FRAMEWORK_CONTEXT = build_scenario_framework_context()
+
+def build_scenario_block(scenario: dict) -> str:
+    return f"""SCENARIO
+
+Title: {scenario['title']}
+Type: {scenario['crisis_type']}
+Description: {scenario['description']}
+Severity Level: {scenario['severity_level']}/10
+Affected Regions: {', '.join(scenario['affected_regions'])}
+Key Variables: {', '.join(scenario['key_variables'])}
+"""
+
+def build_scenario_prompt(profile_name: str, scenario: dict, request: str, output_model=None) -> LlmPrompt:
+    """Framework context and scenario block first, so every artifact for a scenario shares the prefix;
+    the request and the profile's role guidance follow"""
+    profile = llm_profiles[profile_name]
+    return LlmPrompt(
+        prefix=f"{SCENARIO_FRAMEWORK_CONTEXT}\n\n{build_scenario_block(scenario)}",
+        suffix=f"TASK\n\n{request.strip()}\n\n{profile.instructions}\n",
+        output_model=output_model
+    )
+
+class PromptPrefixCache:
+    """Mirrors a provider-side prompt cache: a prefix of at least min_tokens is written on first use and
+    read by later calls with the same model, system message and prefix within the TTL"""
+    
+    def __init__(self, ttl_seconds: float = LLM_PROMPT_CACHE_TTL_SECONDS, min_tokens: int = LLM_PROMPT_CACHE_MIN_TOKENS, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, float]" = OrderedDict()  # key -> last used (monotonic)
+        self.counters = {"hits": 0, "writes": 0, "below_minimum": 0, "uncacheable": 0}
+    
+    def observe(self, profile: "LlmProfile", prompt) -> int:
+        """Prefix tokens served from cache for this call; 0 on a write, a miss or an unsplit prompt"""
+        if not isinstance(prompt, LlmPrompt):
+            self.counters["uncacheable"] += 1
+            return 0
+        prefix_tokens = estimate_tokens(profile.system_message) + estimate_tokens(prompt.prefix)
+        if prefix_tokens < self.min_tokens:
+            self.counters["below_minimum"] += 1
+            return 0
+        
+        key = LlmResponseCache.make_key(profile.model, profile.system_message, prompt.prefix)
+        now = time.monotonic()
+        last_used = self.entries.pop(key, None)
+        # Reads refresh the entry, as provider caches extend the TTL on every hit
+        self.entries[key] = now
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        if last_used is not None and now - last_used <= self.ttl_seconds:
+            self.counters["hits"] += 1
+            return prefix_tokens
+        self.counters["writes"] += 1
+        return 0
+    
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "entries": len(self.entries),
+            "ttl_seconds": self.ttl_seconds,
+            "min_tokens": self.min_tokens
+        }
+
+# Estimates which prefix tokens the provider could serve from its cache; feeds the cached-token metrics
+llm_prompt_prefix_cache = PromptPrefixCache()
+
+# LLM Providers
+class LlmProvider:
+    """Backend that turns a profile and prompt into model text"""
+    name = "base"
+    streaming = False
+    prompt_caching = False  # Whether the LlmPrompt prefix is sent as an explicitly cacheable block
+    
+    async def complete(self, profile: "LlmProfile", prompt, session_id: str) -> str:
+        raise NotImplementedError
+    
+    async def stream(self, profile: "LlmProfile", prompt, session_id: str):
+        yield await self.complete(profile, prompt, session_id)
+    
+    def stats(self) -> dict:
+        return {"provider": self.name, "streaming": self.streaming, "prompt_caching": self.prompt_caching}
+
+class EmergentLlmProvider(LlmProvider):
+    """The hosted emergentintegrations service (LlmChat or text_generation, per profile transport)"""
+    name = "emergent"
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.orphaned_threads = 0  # text_generation threads still running after their caller was cancelled
+        self.abandoned_calls = 0
+        self.skipped_calls = 0  # cancelled before a worker thread picked them up
+    
+    def run_text_generation(self, profile: "LlmProfile", prompt: str, call_state: dict):
+        try:
+            with self.lock:
+                if call_state["cancelled"]:
+                    self.skipped_calls += 1
+                    return None
+            return get_emergent_client().text_generation(
+                prompt=prompt,
+                model=profile.model,
+                max_tokens=profile.max_tokens,
+                temperature=profile.temperature
+            )
+        finally:
+            with self.lock:
+                call_state["finished"] = True
+                if call_state["cancelled"]:
+                    self.orphaned_threads -= 1
+    
+    async def complete(self, profile: "LlmProfile", prompt, session_id: str) -> str:
+        # Neither transport accepts cache_control blocks, so the prompt goes out as plain text. The
+        # stable prefix still comes first, which is what automatic upstream prefix caching keys on.
+        prompt = prompt_text(prompt)
+        if profile.transport == "text_generation":
+            # A blocking call can't be interrupted; on cancellation the caller returns at once (freeing
+            # its concurrency slots) and the thread's result is dropped when it finishes
+            call_state = {"cancelled": False, "finished": False}
+            try:
+                response = await asyncio.to_thread(self.run_text_generation, profile, prompt, call_state)
+            except asyncio.CancelledError:
+                with self.lock:
+                    if not call_state["finished"]:
+                        call_state["cancelled"] = True
+                        self.orphaned_threads += 1
+                        self.abandoned_calls += 1
+                raise
+            return response.get('text', 'Task execution completed but no detailed result available.')
+        
+        chat = profile.build_chat(session_id)
+        return await chat.send_message(UserMessage(text=prompt))
+    
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "orphaned_threads": self.orphaned_threads,
+            "abandoned_calls": self.abandoned_calls,
+            "skipped_calls": self.skipped_calls
+        }
+
+def extract_prompt_sections(prompt: str) -> List[str]:
+    """Numbered items a prompt asks the model to cover, or a generic outline"""
+    sections = [item.strip(" *:") for item in re.findall(r"^\s*\d+\.\s+(.+)$", prompt, re.MULTILINE)]
+    return sections or ["Situation Overview", "Key Risks", "Recommendations"]
+
+FAKE_LLM_VOCABULARY = [
+    "resilience", "cascading", "supply chain", "stakeholders", "liquidity", "infrastructure",
+    "escalation", "mitigation", "exposure", "contingency", "regional", "critical", "monitoring",
+    "coordination", "volatility", "capacity", "dependencies", "recovery", "thresholds", "signals",
+    "governance", "continuity", "workforce", "disruption", "interconnected", "priority", "response"
+]
+
+class FakeLlmProvider(LlmProvider):
+    """Offline stand-in: deterministic prompt-shaped text with configurable latency and failure injection"""
+    name = "fake"
+    streaming = True
+    prompt_caching = True
+    
+    def __init__(
+        self,
+        latency_ms: float = 800.0,
+        jitter_ms: float = 200.0,
+        distribution: str = "lognormal",  # "fixed", "uniform", "normal" or "lognormal"
+        failure_rate: float = 0.0,
+        response_words: int = 300,
+        first_token_fraction: float = 0.2,
+        cached_prefix_speedup: float = 0.5,
+        model_latency_ms: Optional[Dict[str, float]] = None,  # Per-model mean latency, e.g. for the small tier
+        seed: Optional[int] = None
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.distribution = distribution
+        self.failure_rate = failure_rate
+        self.response_words = response_words
+        self.first_token_fraction = first_token_fraction
+        self.cached_prefix_speedup = cached_prefix_speedup
+        self.model_latency_ms = model_latency_ms or {}
+        self.prefix_cache = PromptPrefixCache()
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+    
+    def sample_latency(self) -> float:
+        """Seconds for one call, drawn from the configured distribution"""
+        if self.distribution == "fixed" or self.latency_ms <= 0:
+            latency_ms = self.latency_ms
+        elif self.distribution == "uniform":
+            latency_ms = self.rng.uniform(self.latency_ms - self.jitter_ms, self.latency_ms + self.jitter_ms)
+        elif self.distribution == "normal":
+            latency_ms = self.rng.gauss(self.latency_ms, self.jitter_ms)
+        else:
+            # Right-skewed like real model latencies; jitter_ms is the standard deviation around latency_ms
+            sigma = math.sqrt(math.log(1 + (self.jitter_ms / self.latency_ms) ** 2))
+            latency_ms = self.rng.lognormvariate(math.log(self.latency_ms) - sigma ** 2 / 2, sigma)
+        return max(0.0, latency_ms) / 1000
+    
+    def call_latency(self, profile: "LlmProfile", prompt) -> float:
+        """Sampled latency scaled to the model's mean, shortened in proportion to the share of input tokens read from the prefix cache"""
+        latency = self.sample_latency()
+        if profile.model in self.model_latency_ms and self.latency_ms > 0:
+            latency *= self.model_latency_ms[profile.model] / self.latency_ms
+        cached_tokens = self.prefix_cache.observe(profile, prompt)
+        if cached_tokens:
+            input_tokens = estimate_tokens(profile.system_message) + estimate_tokens(prompt_text(prompt))
+            latency *= 1 - self.cached_prefix_speedup * cached_tokens / input_tokens
+        return latency
+    
+    def maybe_fail(self):
+        if self.failure_rate and self.rng.random() < self.failure_rate:
+            self.failures += 1
+            raise RuntimeError("Fake LLM provider injected failure")
+    
+    def generate(self, profile: "LlmProfile", prompt) -> str:
+        """Same profile and prompt always give the same text, with one section per item the prompt asks for"""
+        digest = hashlib.sha256(f"{profile.model}|{profile.system_message}|{prompt_text(prompt)}".encode()).hexdigest()
+        rng = random.Random(int(digest[:16], 16))
+        
+        request = prompt_request(prompt)
+        sections = extract_prompt_sections(request)
+        title = next((line.strip() for line in request.splitlines() if line.strip()), profile.name)[:120]
+        
+        words_per_section = max(10, self.response_words // len(sections))
+        lines = [f"# {title}", ""]
+        for index, section in enumerate(sections, 1):
+            words = [rng.choice(FAKE_LLM_VOCABULARY) for _ in range(words_per_section)]
+            lines.append(f"## {index}. {section[:100]}")
+            lines.append(" ".join(words).capitalize() + ".")
+            lines.append("")
+        lines.append(f"[fake:{profile.name}:{digest[:12]}]")
+        text = "\n".join(lines)
+        if isinstance(prompt, LlmPrompt) and prompt.output_model is not None:
+            return self.generate_structured(prompt.output_model, text, rng)
+        return text
+    
+    def generate_structured(self, output_model, text: str, rng: random.Random) -> str:
+        """JSON object for the output model's schema, with the prompt-shaped text in its text field"""
+        def phrase(words: int) -> str:
+            return " ".join(rng.choice(FAKE_LLM_VOCABULARY) for _ in range(words)).capitalize()
+        
+        values = {}
+        for name, field in output_model.model_json_schema()["properties"].items():
+            if name == output_model.text_field:
+                values[name] = text
+            elif "enum" in field:
+                values[name] = rng.choice(field["enum"])
+            elif field.get("type") == "array":
+                values[name] = [phrase(6) for _ in range(4)]
+            elif field.get("type") in ("number", "integer"):
+                values[name] = round(rng.uniform(field.get("minimum", 0.0), field.get("maximum", 1.0)), 2)
+            else:
+                values[name] = phrase(12) + "."
+        return json.dumps(values)
+    
+    async def complete(self, profile: "LlmProfile", prompt, session_id: str) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.call_latency(profile, prompt))
+        self.maybe_fail()
+        return self.generate(profile, prompt)
+    
+    async def stream(self, profile: "LlmProfile", prompt, session_id: str):
+        self.calls += 1
+        latency = self.call_latency(profile, prompt)
+        await asyncio.sleep(latency * self.first_token_fraction)
+        self.maybe_fail()
+        
+        text = self.generate(profile, prompt)
+        chunks = chunk_llm_text(text)
+        chunk_delay = latency * (1 - self.first_token_fraction) / len(chunks)
+        for chunk in chunks:
+            yield chunk
+            await asyncio.sleep(chunk_delay)
+    
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "latency_ms": self.latency_ms,
+            "jitter_ms": self.jitter_ms,
+            "distribution": self.distribution,
+            "failure_rate": self.failure_rate,
+            "response_words": self.response_words,
+            "cached_prefix_speedup": self.cached_prefix_speedup,
+            "model_latency_ms": self.model_latency_ms,
+            "calls": self.calls,
+            "injected_failures": self.failures,
+            "prefix_cache": self.prefix_cache.stats()
+        }
+
+def build_llm_provider(name: str) -> LlmProvider:
+    if name == "emergent":
+        return EmergentLlmProvider()
+    if name == "fake":
+        seed = os.environ.get('LLM_FAKE_SEED')
+        return FakeLlmProvider(
+            latency_ms=float(os.environ.get('LLM_FAKE_LATENCY_MS', '800')),
+            jitter_ms=float(os.environ.get('LLM_FAKE_JITTER_MS', '200')),
+            distribution=os.environ.get('LLM_FAKE_LATENCY_DISTRIBUTION', 'lognormal'),
+            failure_rate=float(os.environ.get('LLM_FAKE_FAILURE_RATE', '0')),
+            response_words=int(os.environ.get('LLM_FAKE_RESPONSE_WORDS', '300')),
+            cached_prefix_speedup=float(os.environ.get('LLM_FAKE_CACHED_PREFIX_SPEEDUP', '0.5')),
+            model_latency_ms={LLM_SMALL_MODEL: float(os.environ.get('LLM_FAKE_SMALL_MODEL_LATENCY_MS', '250'))},
+            seed=int(seed) if seed is not None else None
+        )
+    raise ValueError(f"Unknown LLM_PROVIDER: {name}")
+
+llm_provider = build_llm_provider(LLM_PROVIDER)
+
+# LLM Response Cache
+class LlmResponseCache:
+    """Content-addressed response cache: in-process LRU with TTL, backed by the llm_cache collection"""
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at_monotonic, response)
+        self.counters = {"memory_hits": 0, "mongo_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self.profile_counters: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def make_key(model: str, system_message: str, prompt: str) -> str:
+        payload = json.dumps([model, system_message, prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, profile_name: str, counter: str):
+        self.counters[counter] += 1
+        profile_counts = self.profile_counters.setdefault(profile_name, {"hits": 0, "misses": 0})
+        if counter in ("memory_hits", "mongo_hits"):
+            profile_counts["hits"] += 1
+        elif counter == "misses":
+            profile_counts["misses"] += 1
+
+    def _remember(self, key: str, response: str, ttl_seconds: float):
+        self.entries[key] = (time.monotonic() + ttl_seconds, response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    async def contains(self, key: str) -> bool:
+        """Whether a live entry exists, without touching the hit/miss counters"""
+        entry = self.entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            return True
+        try:
+            return await db.llm_cache.find_one({"key": key, "expires_at": {"$gt": datetime.now(timezone.utc)}}, {"_id": 1}) is not None
+        except Exception as e:
+            logging.warning(f"LLM cache lookup failed: {str(e)}")
+            return False
+    
+    async def get(self, key: str, profile_name: str) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry:
+            expires_at, response = entry
+            if expires_at > time.monotonic():
+                self.entries.move_to_end(key)
+                self._count(profile_name, "memory_hits")
+                return response
+            del self.entries[key]
+        
+        try:
+            now = datetime.now(timezone.utc)
+            cached = await db.llm_cache.find_one({"key": key, "expires_at": {"$gt": now}})
+        except Exception as e:
+            logging.warning(f"LLM cache lookup failed: {str(e)}")
+            cached = None
+        
+        if cached:
+            expires_at = cached["expires_at"]
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            self._remember(key, cached["response"], (expires_at - now).total_seconds())
+            self._count(profile_name, "mongo_hits")
+            return cached["response"]
+        
+        self._count(profile_name, "misses")
+        return None
+
+    async def set(self, key: str, profile: "LlmProfile", response: str, ttl_seconds: int):
+        self._remember(key, response, ttl_seconds)
+        self.counters["stores"] += 1
+        now = datetime.now(timezone.utc)
+        try:
+            await db.llm_cache.update_one(
+                {"key": key},
+                {"$set": {
+                    "key": key,
+                    "profile": profile.name,
+                    "model": profile.model,
+                    "response": response,
+                    "created_at": now,
+                    "expires_at": now + timedelta(seconds=ttl_seconds)
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            logging.warning(f"LLM cache store failed: {str(e)}")
+
+    async def clear(self) -> int:
+        self.entries.clear()
+        result = await db.llm_cache.delete_many({})
+        return result.deleted_count
+
+    def stats(self) -> dict:
+        lookups = self.counters["memory_hits"] + self.counters["mongo_hits"] + self.counters["misses"]
+        hits = lookups - self.counters["misses"]
+        return {
+            **self.counters,
+            "memory_entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "profiles": self.profile_counters
+        }
+
+llm_response_cache = LlmResponseCache()
+
+async def ensure_llm_cache_indexes():
+    """Create the unique key index and the TTL index that expires cached responses"""
+    try:
+        await db.llm_cache.create_index("key", unique=True)
+        await db.llm_cache.create_index("expires_at", expireAfterSeconds=0)
+    except Exception as e:
+        logging.warning(f"Could not create llm_cache indexes: {str(e)}")
+
+# LLM Single-Flight Coalescing
+class LlmSingleFlight:
+    """Coalesces identical concurrent model calls onto one shared upstream request"""
+
+    def __init__(self):
+        self.in_flight: Dict[str, dict] = {}
+        self.counters = {"upstream_calls": 0, "coalesced_calls": 0}
+        self.profile_coalesced: Dict[str, int] = {}
+
+    async def run(self, key: str, profile: "LlmProfile", call):
+        entry = self.in_flight.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(call())
+            entry = {"task": task, "waiters": 0}
+            self.in_flight[key] = entry
+            task.add_done_callback(lambda _task, key=key, entry=entry: self._release(key, entry))
+            self.counters["upstream_calls"] += 1
+        else:
+            self.counters["coalesced_calls"] += 1
+            self.profile_coalesced[profile.name] = self.profile_coalesced.get(profile.name, 0) + 1
+            llm_metrics.record_event(current_llm_endpoint(), profile, "coalesced")
+            logging.debug(f"Coalesced {profile.name} call onto in-flight request {key[:12]}")
+        
+        entry["waiters"] += 1
+        try:
+            # Shield the shared call so one caller going away does not fail the others
+            return await asyncio.shield(entry["task"])
+        except asyncio.CancelledError:
+            if entry["waiters"] == 1 and not entry["task"].done():
+                entry["task"].cancel()
+            raise
+        finally:
+            entry["waiters"] -= 1
+
+    def _release(self, key: str, entry: dict):
+        if self.in_flight.get(key) is entry:
+            del self.in_flight[key]
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "in_flight_keys": len(self.in_flight),
+            "profiles": self.profile_coalesced
+        }
+
+llm_single_flight = LlmSingleFlight()
+
+# LLM Instrumentation
+LLM_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+LLM_CHARS_PER_TOKEN = 4  # Rough estimate; the provider does not report token usage
+
+# Set per HTTP request by middleware; FastAPI fills in the matched route once routing runs
+llm_request_scope = contextvars.ContextVar("llm_request_scope", default=None)
+# Explicit label for calls made outside a request, e.g. background jobs
+llm_call_site = contextvars.ContextVar("llm_call_site", default=None)
+# True for speculative work (cache prefetch) that must not count as foreground load
+llm_speculative = contextvars.ContextVar("llm_speculative", default=False)
+# Overrides the profile's default scheduling class, e.g. "batch" for bulk simulation runs
+llm_priority = contextvars.ContextVar("llm_priority", default=None)
+# A dict a caller sets to learn whether any call beneath it served local fallback text ("served": True);
+# a dict rather than a flag so calls run in child tasks report back too
+llm_fallback_served = contextvars.ContextVar("llm_fallback_served", default=None)
+
+def current_llm_endpoint() -> str:
+    call_site = llm_call_site.get()
+    if call_site:
+        return call_site
+    scope = llm_request_scope.get()
+    if scope is None:
+        return "background"
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    return f"{scope['method']} {route.path}"
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / LLM_CHARS_PER_TOKEN) if text else 0
+
+def prometheus_label_value(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class LlmMetrics:
+    """Per (endpoint, profile, model) latency histograms and counters for upstream model calls"""
+    
+    def __init__(self, buckets=LLM_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.series: Dict[tuple, dict] = {}
+        self.disconnects: Dict[str, int] = {}  # endpoint -> requests abandoned by the client mid-call
+    
+    def get_series(self, endpoint: str, profile_name: str, model: str) -> dict:
+        key = (endpoint, profile_name, model)
+        series = self.series.get(key)
+        if series is None:
+            series = {
+                "calls": 0,
+                "errors": 0,
+                "cancelled": 0,
+                "cache_hits": 0,
+                "coalesced": 0,
+                "fallbacks": 0,
+                "structured_invalid": 0,
+                "latency_buckets": [0] * len(self.buckets),
+                "latency_sum": 0.0,
+                "latency_max": 0.0,
+                "prompt_chars": 0,
+                "response_chars": 0,
+                "prompt_tokens": 0,
+                "cached_prompt_tokens": 0,
+                "response_tokens": 0,
+                "error_types": {}
+            }
+            self.series[key] = series
+        return series
+    
+    def record_call(self, endpoint: str, profile: "LlmProfile", latency: float, prompt, response: Optional[str] = None, error: Optional[BaseException] = None, cached_tokens: int = 0):
+        """Record one upstream call; prompt sizes include the system message, which is sent as input on every call"""
+        series = self.get_series(endpoint, profile.name, profile.model)
+        series["calls"] += 1
+        series["latency_sum"] += latency
+        series["latency_max"] = max(series["latency_max"], latency)
+        for index, bound in enumerate(self.buckets):
+            if latency <= bound:
+                series["latency_buckets"][index] += 1
+                break
+        prompt = prompt_text(prompt)
+        series["prompt_chars"] += len(profile.system_message) + len(prompt)
+        series["prompt_tokens"] += estimate_tokens(profile.system_message) + estimate_tokens(prompt)
+        series["cached_prompt_tokens"] += cached_tokens
+        if response is not None:
+            series["response_chars"] += len(response)
+            series["response_tokens"] += estimate_tokens(response)
+        if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            series["cancelled"] += 1
+        elif error is not None:
+            series["errors"] += 1
+            error_type = type(error).__name__
+            series["error_types"][error_type] = series["error_types"].get(error_type, 0) + 1
+    
+    def record_disconnect(self, endpoint: str):
+        self.disconnects[endpoint] = self.disconnects.get(endpoint, 0) + 1
+    
+    def record_event(self, endpoint: str, profile: "LlmProfile", event: str):
+        """Count a call served without an upstream request ("cache_hits", "coalesced" or "fallbacks"),
+        or a structured response that failed validation ("structured_invalid")"""
+        series = self.get_series(endpoint, profile.name, profile.model)
+        series[event] += 1
+    
+    def latency_quantile(self, series: dict, quantile: float) -> Optional[float]:
+        """Upper bucket bound containing the quantile; calls above the last bucket report latency_max"""
+        if not series["calls"]:
+            return None
+        target = quantile * series["calls"]
+        seen = 0
+        for bound, count in zip(self.buckets, series["latency_buckets"]):
+            seen += count
+            if seen >= target:
+                return bound
+        return series["latency_max"]
+    
+    def summary(self) -> List[dict]:
+        """Per-endpoint totals, most total model time first"""
+        endpoints: Dict[str, dict] = {}
+        for (endpoint, profile_name, model), series in self.series.items():
+            summary = endpoints.setdefault(endpoint, {
+                "endpoint": endpoint,
+                "profiles": [],
+                "models": [],
+                "calls": 0,
+                "errors": 0,
+                "cancelled": 0,
+                "cache_hits": 0,
+                "coalesced": 0,
+                "fallbacks": 0,
+                "structured_invalid": 0,
+                "total_latency_seconds": 0.0,
+                "max_latency_seconds": 0.0,
+                "prompt_tokens": 0,
+                "cached_prompt_tokens": 0,
+                "response_tokens": 0,
+                "error_types": {},
+                "latency_buckets": [0] * len(self.buckets)
+            })
+            if profile_name not in summary["profiles"]:
+                summary["profiles"].append(profile_name)
+            if model not in summary["models"]:
+                summary["models"].append(model)
+            for field in ("calls", "errors", "cancelled", "cache_hits", "coalesced", "fallbacks", "structured_invalid", "prompt_tokens", "cached_prompt_tokens", "response_tokens"):
+                summary[field] += series[field]
+            summary["total_latency_seconds"] += series["latency_sum"]
+            summary["max_latency_seconds"] = max(summary["max_latency_seconds"], series["latency_max"])
+            summary["latency_buckets"] = [a + b for a, b in zip(summary["latency_buckets"], series["latency_buckets"])]
+            for error_type, count in series["error_types"].items():
+                summary["error_types"][error_type] = summary["error_types"].get(error_type, 0) + count
+        
+        results = []
+        for summary in endpoints.values():
+            requests_seen = summary["calls"] + summary["cache_hits"] + summary["coalesced"]
+            histogram = {"calls": summary["calls"], "latency_buckets": summary.pop("latency_buckets"), "latency_max": summary["max_latency_seconds"]}
+            summary.update({
+                "avg_latency_seconds": summary["total_latency_seconds"] / summary["calls"] if summary["calls"] else None,
+                "p50_latency_seconds": self.latency_quantile(histogram, 0.5),
+                "p95_latency_seconds": self.latency_quantile(histogram, 0.95),
+                "error_rate": summary["errors"] / summary["calls"] if summary["calls"] else 0.0,
+                "cache_hit_rate": summary["cache_hits"] / requests_seen if requests_seen else 0.0,
+                "cached_token_ratio": summary["cached_prompt_tokens"] / summary["prompt_tokens"] if summary["prompt_tokens"] else 0.0,
+                "estimated_tokens": summary["prompt_tokens"] + summary["response_tokens"],
+                "client_disconnects": self.disconnects.get(summary["endpoint"], 0)
+            })
+            results.append(summary)
+        return sorted(results, key=lambda summary: summary["total_latency_seconds"], reverse=True)
+    
+    def tier_summary(self) -> List[dict]:
+        """Latency and token totals per model tier across every endpoint"""
+        tiers: Dict[str, dict] = {}
+        for (endpoint, profile_name, model), series in self.series.items():
+            tier = llm_router.tier_for_model(model)
+            summary = tiers.setdefault(tier, {
+                "tier": tier,
+                "models": [],
+                "profiles": [],
+                "calls": 0,
+                "errors": 0,
+                "latency_sum": 0.0,
+                "latency_max": 0.0,
+                "prompt_tokens": 0,
+                "response_tokens": 0,
+                "latency_buckets": [0] * len(self.buckets)
+            })
+            if model not in summary["models"]:
+                summary["models"].append(model)
+            if profile_name not in summary["profiles"]:
+                summary["profiles"].append(profile_name)
+            for field in ("calls", "errors", "latency_sum", "prompt_tokens", "response_tokens"):
+                summary[field] += series[field]
+            summary["latency_max"] = max(summary["latency_max"], series["latency_max"])
+            summary["latency_buckets"] = [a + b for a, b in zip(summary["latency_buckets"], series["latency_buckets"])]
+        
+        results = []
+        for summary in tiers.values():
+            results.append({
+                "tier": summary["tier"],
+                "models": summary["models"],
+                "profiles": summary["profiles"],
+                "calls": summary["calls"],
+                "errors": summary["errors"],
+                "avg_latency_seconds": summary["latency_sum"] / summary["calls"] if summary["calls"] else None,
+                "p50_latency_seconds": self.latency_quantile(summary, 0.5),
+                "p95_latency_seconds": self.latency_quantile(summary, 0.95),
+                "max_latency_seconds": summary["latency_max"],
+                "prompt_tokens": summary["prompt_tokens"],
+                "response_tokens": summary["response_tokens"]
+            })
+        return sorted(results, key=lambda summary: summary["tier"])
+    
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        def labels(endpoint, profile_name, model, **extra):
+            pairs = {"endpoint": endpoint, "profile": profile_name, "model": model, "tier": llm_router.tier_for_model(model), **extra}
+            return ",".join(f'{name}="{prometheus_label_value(value)}"' for name, value in pairs.items())
+        
+        counters = [
+            ("llm_calls_total", "calls", "Upstream model calls"),
+            ("llm_errors_total", "errors", "Upstream model calls that raised"),
+            ("llm_cancelled_total", "cancelled", "Upstream model calls cancelled before completing, e.g. after a client disconnect"),
+            ("llm_cache_hits_total", "cache_hits", "Calls served from the response cache"),
+            ("llm_coalesced_total", "coalesced", "Calls coalesced onto an identical in-flight request"),
+            ("llm_fallbacks_total", "fallbacks", "Calls answered with local fallback text while the model was unavailable"),
+            ("llm_structured_invalid_total", "structured_invalid", "JSON responses that failed schema validation and fell back to unstructured text"),
+            ("llm_prompt_chars_total", "prompt_chars", "Prompt characters sent upstream, including the system message"),
+            ("llm_response_chars_total", "response_chars", "Response characters received"),
+            ("llm_prompt_tokens_estimated_total", "prompt_tokens", "Estimated prompt tokens sent upstream, including the system message"),
+            ("llm_prompt_cached_tokens_estimated_total", "cached_prompt_tokens", "Estimated prompt tokens in a prefix reused within the prompt cache TTL"),
+            ("llm_response_tokens_estimated_total", "response_tokens", "Estimated response tokens received")
+        ]
+        lines = []
+        for metric, field, help_text in counters:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for (endpoint, profile_name, model), series in sorted(self.series.items()):
+                lines.append(f"{metric}{{{labels(endpoint, profile_name, model)}}} {series[field]}")
+        
+        lines.append("# HELP llm_call_duration_seconds Upstream model call latency")
+        lines.append("# TYPE llm_call_duration_seconds histogram")
+        for (endpoint, profile_name, model), series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["latency_buckets"]):
+                cumulative += count
+                lines.append(f"llm_call_duration_seconds_bucket{{{labels(endpoint, profile_name, model, le=bound)}}} {cumulative}")
+            lines.append(f"llm_call_duration_seconds_bucket{{{labels(endpoint, profile_name, model, le='+Inf')}}} {series['calls']}")
+            lines.append(f"llm_call_duration_seconds_sum{{{labels(endpoint, profile_name, model)}}} {series['latency_sum']}")
+            lines.append(f"llm_call_duration_seconds_count{{{labels(endpoint, profile_name, model)}}} {series['calls']}")
+        
+        lines.append("# HELP llm_client_disconnects_total Requests whose client disconnected while waiting on the model")
+        lines.append("# TYPE llm_client_disconnects_total counter")
+        for endpoint, count in sorted(self.disconnects.items()):
+            lines.append(f'llm_client_disconnects_total{{endpoint="{prometheus_label_value(endpoint)}"}} {count}')
+        
+        lines.append("# HELP llm_profile_in_flight Upstream calls currently running per profile")
+        lines.append("# TYPE llm_profile_in_flight gauge")
+        for profile in llm_router.all_profiles():
+            lines.append(f'llm_profile_in_flight{{profile="{profile.name}",model="{profile.model}"}} {profile.in_flight}')
+        
+        lines.append("# HELP llm_adaptive_limit Current adaptive concurrency limit per model")
+        lines.append("# TYPE llm_adaptive_limit gauge")
+        for guard in llm_model_guards.values():
+            lines.append(f'llm_adaptive_limit{{model="{guard.model}"}} {guard.limit:.2f}')
+        lines.append("# HELP llm_circuit_state Circuit breaker state per model (1 for the current state)")
+        lines.append("# TYPE llm_circuit_state gauge")
+        for guard in llm_model_guards.values():
+            for state in ("closed", "open", "half_open"):
+                lines.append(f'llm_circuit_state{{model="{guard.model}",state="{state}"}} {int(guard.state == state)}')
+        
+        priority_metrics = [
+            ("llm_priority_queue_depth", "gauge", "queue_depth", "Calls waiting for a model slot per priority class"),
+            ("llm_priority_in_flight", "gauge", "in_flight", "Calls holding a model slot per priority class"),
+            ("llm_priority_admitted_total", "counter", "admitted", "Calls granted a model slot per priority class"),
+            ("llm_priority_wait_seconds_sum", "counter", "wait_sum", "Total time calls waited for a model slot per priority class"),
+            ("llm_priority_rejected_total", "counter", "rejected_queue", "Calls shed after waiting the full queue timeout per priority class")
+        ]
+        for metric, metric_type, field, help_text in priority_metrics:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {metric_type}")
+            for guard in llm_model_guards.values():
+                for name, klass in guard.classes.items():
+                    value = sum(1 for waiter, _ in klass["queue"] if not waiter.done()) if field == "queue_depth" else klass[field]
+                    lines.append(f'{metric}{{model="{guard.model}",priority="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+    
+    def reset(self):
+        self.series = {}
+        self.disconnects = {}
+
+llm_metrics = LlmMetrics()
+
+# LLM Adaptive Concurrency and Circuit Breaking
+class LlmUnavailableError(Exception):
+    """A model call was shed because the circuit is open or the adaptive limit stayed full"""
+
+class LlmModelGuard:
+    """AIMD concurrency limit plus circuit breaker for one upstream model"""
+    
+    def __init__(
+        self,
+        model: str,
+        initial_limit: int = LLM_DEFAULT_CONCURRENCY,
+        max_limit: int = LLM_ADAPTIVE_MAX_LIMIT,
+        latency_target: float = LLM_LATENCY_TARGET_SECONDS,
+        queue_timeout: float = LLM_LIMITER_QUEUE_TIMEOUT_SECONDS,
+        batch_queue_timeout: float = LLM_BATCH_QUEUE_TIMEOUT_SECONDS,
+        failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD,
+        cooldown: float = LLM_BREAKER_COOLDOWN_SECONDS
+    ):
+        self.model = model
+        self.limit = float(initial_limit)
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.queue_timeout = queue_timeout
+        self.batch_queue_timeout = batch_queue_timeout
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.waiting = 0
+        self.classes = {
+            name: {"queue": deque(), "in_flight": 0, "pass": 0.0, "last_active": None, "admitted": 0, "wait_sum": 0.0, "wait_max": 0.0, "rejected_queue": 0}
+            for name in LLM_PRIORITY_CLASSES
+        }
+        self.virtual_time = 0.0  # Pass of the last class served; idle classes rejoin from here
+        self.foreground_demand = 0  # Non-speculative calls waiting for or holding a slot
+        self.last_decrease_at = 0.0
+        self.state = "closed"  # "closed", "open" or "half_open"
+        self.opened_at = None
+        self.probe_in_flight = False
+        self.consecutive_failures = 0
+        self.counters = {"successes": 0, "failures": 0, "cancelled": 0, "slow_calls": 0, "rejected_open": 0, "rejected_queue": 0, "times_opened": 0}
+    
+    def admit(self) -> bool:
+        """Raise while the circuit is open; returns True if this call is the half-open probe"""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.cooldown:
+                self.counters["rejected_open"] += 1
+                raise LlmUnavailableError(f"Circuit open for {self.model}")
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self.probe_in_flight:
+                self.counters["rejected_open"] += 1
+                raise LlmUnavailableError(f"Circuit half-open for {self.model}; probe in flight")
+            self.probe_in_flight = True
+            return True
+        return False
+    
+    def class_queue_timeout(self, priority: str) -> Optional[float]:
+        """How long a waiter of this class may queue; None waits until a slot frees"""
+        if priority == "batch":
+            return self.batch_queue_timeout or None
+        return self.queue_timeout
+    
+    async def acquire(self, priority: str = "normal") -> bool:
+        is_probe = self.admit()
+        klass = self.classes[priority]
+        queue_timeout = self.class_queue_timeout(priority)
+        if not klass["queue"] and not klass["in_flight"]:
+            klass["pass"] = max(klass["pass"], self.virtual_time)
+        klass["last_active"] = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        klass["queue"].append((waiter, time.monotonic()))
+        self.waiting += 1
+        self.dispatch()
+        try:
+            await asyncio.wait_for(waiter, timeout=queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as we gave up; hand the slot to the next waiter
+                self.in_flight -= 1
+                klass["in_flight"] -= 1
+                self.dispatch()
+            else:
+                klass["queue"] = deque(entry for entry in klass["queue"] if entry[0] is not waiter)
+            if is_probe:
+                self.probe_in_flight = False
+            if isinstance(e, asyncio.TimeoutError):
+                self.counters["rejected_queue"] += 1
+                klass["rejected_queue"] += 1
+                raise LlmUnavailableError(f"Adaptive limit for {self.model} stayed full for {queue_timeout}s")
+            raise
+        finally:
+            self.waiting -= 1
+        return is_probe
+    
+    def reserved_floors(self, priority: str, now: float) -> int:
+        """Unused floor slots other recently active classes are entitled to"""
+        reserved = 0
+        for name, klass in self.classes.items():
+            if name != priority and klass["last_active"] is not None and now - klass["last_active"] < LLM_PRIORITY_FLOOR_IDLE_SECONDS:
+                reserved += max(0, LLM_PRIORITY_FLOORS[name] - klass["in_flight"])
+        return reserved
+    
+    def next_class(self) -> Optional[str]:
+        now = time.monotonic()
+        free = max(1, int(self.limit)) - self.in_flight
+        below_floor, eligible = [], []
+        for name, klass in self.classes.items():
+            queue = klass["queue"]
+            while queue and queue[0][0].done():
+                queue.popleft()
+            if not queue:
+                continue
+            if klass["in_flight"] < LLM_PRIORITY_FLOORS[name]:
+                below_floor.append(name)
+            elif free > self.reserved_floors(name, now):
+                eligible.append(name)
+        candidates = below_floor or eligible
+        if not candidates:
+            return None
+        return min(candidates, key=lambda name: self.classes[name]["pass"])
+    
+    def dispatch(self):
+        """Grant free slots to waiters, serving classes in order of their weighted pass"""
+        while self.in_flight < max(1, int(self.limit)):
+            name = self.next_class()
+            if name is None:
+                return
+            klass = self.classes[name]
+            waiter, enqueued_at = klass["queue"].popleft()
+            wait = time.monotonic() - enqueued_at
+            klass["admitted"] += 1
+            klass["wait_sum"] += wait
+            klass["wait_max"] = max(klass["wait_max"], wait)
+            self.virtual_time = klass["pass"]
+            klass["pass"] += 1 / LLM_PRIORITY_WEIGHTS[name]
+            self.in_flight += 1
+            klass["in_flight"] += 1
+            waiter.set_result(None)
+    
+    async def release(self, latency: float, outcome: str, is_probe: bool, priority: str = "normal"):
+        """outcome is "success", "failure" or "cancelled"; cancelled calls don't move the limit"""
+        self.in_flight -= 1
+        self.classes[priority]["in_flight"] -= 1
+        if outcome == "success":
+            self.counters["successes"] += 1
+            self.consecutive_failures = 0
+            if latency > self.latency_target:
+                self.counters["slow_calls"] += 1
+                self.decrease(latency)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            if self.state == "half_open":
+                self.state = "closed"
+        elif outcome == "failure":
+            self.counters["failures"] += 1
+            self.consecutive_failures += 1
+            self.decrease(latency)
+            if is_probe or self.consecutive_failures >= self.failure_threshold:
+                self.open()
+        else:
+            self.counters["cancelled"] += 1
+        if is_probe:
+            self.probe_in_flight = False
+        self.dispatch()
+    
+    def decrease(self, latency: float):
+        # Halve at most once per round trip so one burst of failures doesn't collapse the limit to 1
+        now = time.monotonic()
+        if now - self.last_decrease_at >= latency:
+            self.limit = max(1.0, self.limit / 2)
+            self.last_decrease_at = now
+    
+    def open(self):
+        if self.state != "open":
+            self.counters["times_opened"] += 1
+            logging.warning(f"LLM circuit opened for {self.model} after {self.consecutive_failures} consecutive failures")
+        self.state = "open"
+        self.opened_at = time.monotonic()
+    
+    def stats(self) -> dict:
+        return {
+            "model": self.model,
+            "limit": round(self.limit, 2),
+            "foreground_demand": self.foreground_demand,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "seconds_until_half_open": max(0.0, self.cooldown - (time.monotonic() - self.opened_at)) if self.state == "open" else None,
+            "priority_classes": self.class_stats(),
+            **self.counters
+        }
+    
+    def class_stats(self) -> List[dict]:
+        return [
+            {
+                "priority": name,
+                "weight": LLM_PRIORITY_WEIGHTS[name],
+                "floor": LLM_PRIORITY_FLOORS[name],
+                "queue_depth": sum(1 for waiter, _ in klass["queue"] if not waiter.done()),
+                "in_flight": klass["in_flight"],
+                "admitted": klass["admitted"],
+                "rejected_queue": klass["rejected_queue"],
+                "avg_wait_seconds": klass["wait_sum"] / klass["admitted"] if klass["admitted"] else None,
+                "max_wait_seconds": klass["wait_max"]
+            }
+            for name, klass in self.classes.items()
+        ]
+
+llm_model_guards: Dict[str, LlmModelGuard] = {}
+
+def get_llm_model_guard(model: str) -> LlmModelGuard:
+    guard = llm_model_guards.get(model)
+    if guard is None:
+        guard = llm_model_guards[model] = LlmModelGuard(model)
+    return guard
+
+@asynccontextmanager
+async def guard_llm_call(profile: LlmProfile, prompt):
+    """Hold the profile slot and the model's adaptive slot for one upstream call, recording its outcome"""
+    guard = get_llm_model_guard(profile.model)
+    speculative = llm_speculative.get()
+    priority = "batch" if speculative else llm_priority.get() or profile.priority
+    if not speculative:
+        guard.foreground_demand += 1
+    try:
+        async with profile.semaphore:
+            is_probe = await guard.acquire(priority)
+            profile.in_flight += 1
+            profile.total_calls += 1
+            call = {"response": None, "cached_tokens": llm_prompt_prefix_cache.observe(profile, prompt)}
+            started = time.perf_counter()
+            error = None
+            outcome = "failure"
+            try:
+                yield call
+                outcome = "success"
+            except (asyncio.CancelledError, GeneratorExit) as e:
+                error = e
+                outcome = "cancelled"
+                raise
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                latency = time.perf_counter() - started
+                profile.in_flight -= 1
+                llm_metrics.record_call(current_llm_endpoint(), profile, latency, prompt, call["response"], error, call["cached_tokens"])
+                await guard.release(latency, outcome, is_probe, priority)
+    finally:
+        if not speculative:
+            guard.foreground_demand -= 1
+
+class LlmFallbackText(str):
+    """Local fallback text standing in for a model response; callers that persist results check for it and skip the save"""
+
+def note_llm_fallback(profile: LlmProfile, error: Exception):
+    logging.warning(f"Serving local fallback for {profile.name}: {str(error)}")
+    llm_metrics.record_event(current_llm_endpoint(), profile, "fallbacks")
+    served = llm_fallback_served.get()
+    if served is not None:
+        served["served"] = True
+
+def build_local_llm_fallback(profile: LlmProfile, prompt) -> LlmFallbackText:
+    """Deterministic outline returned while the model is unavailable"""
+    lines = [
+        "**AI ANALYSIS TEMPORARILY UNAVAILABLE**",
+        "",
+        "The model service is degraded, so this is a locally generated outline. Re-run the request later for a full analysis.",
+        ""
+    ]
+    for index, section in enumerate(extract_prompt_sections(prompt_request(prompt)), 1):
+        lines.append(f"**{index}. {section}**")
+        lines.append(f"- Review {section[:1].lower() + section[1:]} with the responsible team using the latest available data.")
+        lines.append("")
+    lines.append(f"[local-fallback:{profile.name}]")
+    return LlmFallbackText("\n".join(lines))
+
+async def send_llm_message(
+    profile_name: str,
+    prompt: Union[str, LlmPrompt],
+    session_id: Optional[str] = None,
+    use_cache: Optional[bool] = None,
+    fallback: bool = True
+) -> str:
+    """Send a prompt through a named profile; cached repeats and identical in-flight calls skip the upstream model.
+    While the model is unavailable this returns LlmFallbackText, which is never cached, or raises
+    LlmUnavailableError if fallback is False."""
+    profile = llm_router.resolve(profile_name)
+    if use_cache is None:
+        cache_ttl = profile.cache_ttl
+    elif use_cache:
+        cache_ttl = profile.cache_ttl or LLM_CACHE_DEFAULT_TTL
+    else:
+        cache_ttl = 0
+    
+    request_key = LlmResponseCache.make_key(profile.model, profile.system_message, prompt_text(prompt))
+    if cache_ttl:
+        cached_response = await llm_response_cache.get(request_key, profile.name)
+        if cached_response is not None:
+            llm_metrics.record_event(current_llm_endpoint(), profile, "cache_hits")
+            return cached_response
+    
+    async def call_and_store():
+        response = await call_llm_profile(profile, prompt, session_id)
+        if cache_ttl:
+            await llm_response_cache.set(request_key, profile, response, cache_ttl)
+        return response
+    
+    try:
+        return await llm_single_flight.run(request_key, profile, call_and_store)
+    except LlmUnavailableError as e:
+        if not fallback:
+            raise
+        note_llm_fallback(profile, e)
+        return build_local_llm_fallback(profile, prompt)
+
+async def send_llm_message_with_retry(
+    profile_name: str,
+    prompt: Union[str, LlmPrompt],
+    session_id: Optional[str] = None,
+    use_cache: Optional[bool] = None
+) -> str:
+    """send_llm_message for results that get stored: never returns fallback text, retrying with
+    exponential backoff while the model is unavailable and raising LlmUnavailableError after
+    LLM_PERSIST_RETRY_ATTEMPTS attempts."""
+    for attempt in range(max(1, LLM_PERSIST_RETRY_ATTEMPTS)):
+        try:
+            return await send_llm_message(profile_name, prompt, session_id=session_id, use_cache=use_cache, fallback=False)
+        except LlmUnavailableError as e:
+            if attempt + 1 >= LLM_PERSIST_RETRY_ATTEMPTS:
+                raise
+            delay = LLM_PERSIST_RETRY_BASE_DELAY_SECONDS * 2 ** attempt
+            logging.warning(f"{profile_name} unavailable, retrying in {delay}s: {str(e)}")
+            await asyncio.sleep(delay)
+
+async def call_llm_profile(profile: LlmProfile, prompt: Union[str, LlmPrompt], session_id: Optional[str] = None) -> str:
+    """Call the configured provider for a profile, bounded by the profile and model concurrency limits"""
+    async with guard_llm_call(profile, prompt) as call:
+        call["response"] = await asyncio.wait_for(
+            llm_provider.complete(profile, prompt, session_id or f"{profile.name}-{uuid.uuid4()}"),
+            timeout=LLM_CALL_TIMEOUT_SECONDS
+        )
+    return call["response"]
+
+async def run_until_disconnected(request: Request, work):
+    """Await work (usually a model call), cancelling it and answering 499 if the client disconnects first"""
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=LLM_DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                endpoint = current_llm_endpoint()
+                logging.info(f"Client disconnected from {endpoint}; cancelling model work")
+                llm_metrics.record_disconnect(endpoint)
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
+
+# LLM streaming (Server-Sent Events)
+LLM_STREAM_HEARTBEAT_SECONDS = float(os.environ.get('LLM_STREAM_HEARTBEAT_SECONDS', '5'))
+LLM_STREAM_CHUNK_CHARS = int(os.environ.get('LLM_STREAM_CHUNK_CHARS', '200'))
+
+def chunk_llm_text(text: str) -> List[str]:
+    return [text[start:start + LLM_STREAM_CHUNK_CHARS] for start in range(0, len(text), LLM_STREAM_CHUNK_CHARS)]
+
+async def stream_llm_chunks(profile_name: str, prompt: Union[str, LlmPrompt], session_id: Optional[str] = None):
+    """Yield response text chunks, incrementally when the provider streams and all at once otherwise.
+    Chunks of local fallback text are LlmFallbackText."""
+    profile = llm_router.resolve(profile_name)
+    if not llm_provider.streaming:
+        response = await send_llm_message(profile_name, prompt, session_id=session_id)
+        for chunk in chunk_llm_text(response):
+            yield LlmFallbackText(chunk) if isinstance(response, LlmFallbackText) else chunk
+        return
+    
+    request_key = LlmResponseCache.make_key(profile.model, profile.system_message, prompt_text(prompt))
+    if profile.cache_ttl:
+        cached_response = await llm_response_cache.get(request_key, profile.name)
+        if cached_response is not None:
+            llm_metrics.record_event(current_llm_endpoint(), profile, "cache_hits")
+            for chunk in chunk_llm_text(cached_response):
+                yield chunk
+            return
+    
+    parts = []
+    try:
+        async with guard_llm_call(profile, prompt) as call:
+            # Same total budget as a non-streaming call. Each chunk may be awaited from a different task
+            # (see stream_llm_message), so the deadline is enforced per chunk rather than with asyncio.timeout.
+            deadline = time.monotonic() + LLM_CALL_TIMEOUT_SECONDS
+            stream = llm_provider.stream(profile, prompt, session_id or f"{profile.name}-{uuid.uuid4()}")
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(stream.__anext__(), timeout=max(0.0, deadline - time.monotonic()))
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        raise asyncio.TimeoutError(f"{profile.name} stream exceeded {LLM_CALL_TIMEOUT_SECONDS}s")
+                    parts.append(chunk)
+                    yield chunk
+            finally:
+                await stream.aclose()
+            call["response"] = "".join(parts)
+    except LlmUnavailableError as e:
+        # Raised before the first chunk, when the call is shed
+        note_llm_fallback(profile, e)
+        for chunk in chunk_llm_text(build_local_llm_fallback(profile, prompt)):
+            yield LlmFallbackText(chunk)
+        return
+    
+    if profile.cache_ttl:
+        await llm_response_cache.set(request_key, profile, "".join(parts), profile.cache_ttl)
+
+async def stream_llm_message(profile_name: str, prompt: Union[str, LlmPrompt], session_id: Optional[str] = None):
+    """Yield text chunks as they arrive, with None heartbeats whenever the model is quiet"""
+    chunks = stream_llm_chunks(profile_name, prompt, session_id=session_id)
+    next_chunk = None
+    try:
+        while True:
+            next_chunk = asyncio.ensure_future(chunks.__anext__())
+            while True:
+                done, _ = await asyncio.wait({next_chunk}, timeout=LLM_STREAM_HEARTBEAT_SECONDS)
+                if done:
+                    break
+                yield None
+            try:
+                chunk = next_chunk.result()
+            except StopAsyncIteration:
+                break
+            yield chunk
+    finally:
+        if next_chunk is not None and not next_chunk.done():
+            next_chunk.cancel()
+            await asyncio.gather(next_chunk, return_exceptions=True)
+        await chunks.aclose()
+
+def format_sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def stream_llm_artifact(profile_name: str, prompt: Union[str, LlmPrompt], session_id: str, save_artifact, metadata: dict) -> StreamingResponse:
+    """Stream a generated artifact as SSE and persist it once the full text has arrived (save_artifact skips
+    persisting local fallback text)"""
+    async def event_stream():
+        yield format_sse_event("start", metadata)
+        try:
+            parts = []
+            fallback = False
+            async for chunk in stream_llm_message(profile_name, prompt, session_id=session_id):
+                if chunk is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                fallback = fallback or isinstance(chunk, LlmFallbackText)
+                parts.append(chunk)
+                yield format_sse_event("token", {"text": chunk})
+            
+            text = "".join(parts)
+            artifact = await save_artifact(LlmFallbackText(text) if fallback else text)
+            yield format_sse_event("done", jsonable_encoder(artifact))
+        except Exception as e:
+            logging.error(f"Streaming {profile_name} error: {str(e)}")
+            yield format_sse_event("error", {"detail": str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # Models
 class User(BaseModel):
@@ -196,6 +1969,40 @@ class AIGenieResponse(BaseModel):
     suggestions: List[str]
     monitoring_tasks: List[str]
 
+class ImpactBand(BaseModel):
+    mean: float
+    std: float
+    p5: float
+    p25: float
+    p50: float
+    p75: float
+    p95: float
+
+class MonteCarloResult(BaseModel):
+    draws: int
+    seed: int
+    impacts: Dict[str, ImpactBand]  # "economic", "social", "environmental", "total" on the 0-100 impact scale
+    abc_probabilities: Dict[str, float]  # Share of draws landing in each ABC class
+    most_likely_class: str
+    runtime_ms: float
+
+class ConfidenceInterval(BaseModel):
+    estimate: float
+    lower: float
+    upper: float
+
+class UncertaintyResult(BaseModel):
+    outer_samples: int  # Latin hypercube samples of the epistemic parameters
+    inner_samples: int  # Aleatory draws nested in each epistemic sample
+    seed: int
+    confidence_level: float
+    impacts: Dict[str, ImpactBand]  # Pooled over all samples
+    percentile_intervals: Dict[str, Dict[str, ConfidenceInterval]]  # Domain -> "mean", "p5", "p50", "p95" of the aleatory spread, across epistemic samples
+    variance_shares: Dict[str, Dict[str, float]]  # Domain -> "aleatory" and "epistemic" share of the total variance
+    abc_probabilities: Dict[str, ConfidenceInterval]
+    parameter_ranges: Dict[str, List[float]]
+    runtime_ms: float
+
 class SimulationResult(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     scenario_id: str
@@ -204,6 +2011,8 @@ class SimulationResult(BaseModel):
     mitigation_strategies: List[str]
     key_insights: List[str]
     confidence_score: float
+    monte_carlo: Optional[MonteCarloResult] = None
+    uncertainty: Optional[UncertaintyResult] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class GameBook(BaseModel):
@@ -225,6 +2034,7 @@ class ActionPlan(BaseModel):
     responsible_parties: List[str]
     resource_allocation: List[str]
     priority_level: str
+    plan_content: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class StrategyImplementation(BaseModel):
@@ -380,6 +2190,7 @@ class BusinessDocument(BaseModel):
     strategic_priorities: List[str] = []
     uploaded_by: str
     file_size: Optional[int] = None
+    chunk_count: Optional[int] = None  # Sections summarized for the analysis; 1 means analyzed whole
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class BusinessDocumentCreate(BaseModel):
@@ -527,6 +2338,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         user = await db.users.find_one({"id": user_id})
         if user is None:
             raise HTTPException(status_code=401, detail="User not found")
+        llm_tenant.set(user.get("organization"))
         return User(**user)
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
@@ -585,24 +2397,26 @@ def get_sequence_letter(sequence_number: int) -> str:
         second = chr(64 + ((sequence_number - 1) % 26) + 1)
         return first + second
 
+# Weight factors for different crisis types
+ABC_CRISIS_WEIGHTS = {
+    "pandemic": 1.3,
+    "natural_disaster": 1.2,
+    "economic_crisis": 1.1,
+    "social_unrest": 1.0,
+    "technological_crisis": 0.9,
+    "environmental_crisis": 1.2
+}
+ABC_CLASS_A_THRESHOLD = 75
+ABC_CLASS_B_THRESHOLD = 50
+
 def calculate_abc_classification(severity_level: int, impact_score: float, crisis_type: str) -> tuple:
     """Calculate ABC classification based on scenario parameters"""
-    # Weight factors for different crisis types
-    crisis_weights = {
-        "pandemic": 1.3,
-        "natural_disaster": 1.2,
-        "economic_crisis": 1.1,
-        "social_unrest": 1.0,
-        "technological_crisis": 0.9,
-        "environmental_crisis": 1.2
-    }
-    
-    weight = crisis_weights.get(crisis_type, 1.0)
+    weight = ABC_CRISIS_WEIGHTS.get(crisis_type, 1.0)
     weighted_score = (severity_level * 10 + impact_score) * weight / 2
     
-    if weighted_score >= 75:
+    if weighted_score >= ABC_CLASS_A_THRESHOLD:
         return "A", "high", max(8, min(10, int(weighted_score / 10)))
-    elif weighted_score >= 50:
+    elif weighted_score >= ABC_CLASS_B_THRESHOLD:
         return "B", "medium", max(4, min(7, int(weighted_score / 10)))
     else:
         return "C", "low", max(1, min(3, int(weighted_score / 10)))
@@ -718,6 +2532,7 @@ async def create_scenario(scenario_data: ScenarioCreate, current_user: User = De
     )
     
     await db.scenarios.insert_one(scenario.dict())
+    scenario_prefetcher.enqueue(scenario.id, current_user.organization)
     return scenario
 
 # Scenario Adjusters - Fuzzy Logic Endpoints
@@ -918,21 +2733,15 @@ async def agree_to_consensus(company_id: str, consensus_id: str, current_user: U
     
     return {"message": "Agreement recorded", "consensus_reached": consensus_reached}
 
+SEPTE_CRISIS_FIELDS = (
+    "economic_crisis_pct", "social_unrest_pct", "environmental_degradation_pct",
+    "political_instability_pct", "technological_disruption_pct"
+)
+SEPTE_RISK_LEVELS = ("low", "medium", "high", "critical")
+SEPTE_RISK_THRESHOLDS = (40.0, 60.0, 75.0)  # Average crisis percentage at which medium, high and critical begin
+
 async def generate_scenario_analysis(company: dict, adjustment_data: ScenarioAdjustmentCreate) -> dict:
     """Generate AI analysis based on SEPTE framework adjustments"""
-    chat = LlmChat(
-        api_key=EMERGENT_LLM_KEY,
-        session_id=f"scenario-adjustment-{company['id']}",
-        system_message="""You are an expert scenario analysis consultant specializing in SEPTE framework analysis (Social, Economic, Political, Technological, Environmental) for crisis management.
-
-Your role is to:
-1. Analyze fuzzy logic adjustments to scenario parameters
-2. Provide real-time impact assessments based on percentage changes
-3. Generate concise, actionable insights for scenario planning
-4. Assess overall risk levels and provide strategic recommendations
-
-Focus on short, clear analysis that immediately shows the impact of parameter changes."""
-    ).with_model("anthropic", "claude-3-7-sonnet-20250219")
     
     # Build SEPTE analysis prompt
     analysis_prompt = f"""
@@ -953,8 +2762,7 @@ Provide:
 Keep analysis concise and focused on decision-making implications.
 """
     
-    user_message = UserMessage(text=analysis_prompt)
-    analysis_content = await chat.send_message(user_message)
+    analysis_content = await send_llm_message("scenario_adjustment", analysis_prompt, session_id=f"scenario-adjustment-{company['id']}")
     
     # Parse analysis into components
     lines = analysis_content.split('\n')
@@ -981,14 +2789,7 @@ Keep analysis concise and focused on decision-making implications.
         adjustment_data.technological_disruption_pct
     ) / 5
     
-    if crisis_avg >= 75:
-        risk_level = "critical"
-    elif crisis_avg >= 60:
-        risk_level = "high"
-    elif crisis_avg >= 40:
-        risk_level = "medium"
-    else:
-        risk_level = "low"
+    risk_level = SEPTE_RISK_LEVELS[sum(crisis_avg >= threshold for threshold in SEPTE_RISK_THRESHOLDS)]
     
     # Extract recommendations
     recommendations = [
@@ -1035,6 +2836,7 @@ async def update_scenario(scenario_id: str, scenario_data: ScenarioCreate, curre
     
     await db.scenarios.update_one({"id": scenario_id}, {"$set": update_data})
     updated_scenario = await db.scenarios.find_one({"id": scenario_id})
+    scenario_prefetcher.enqueue(scenario_id, current_user.organization)
     return Scenario(**updated_scenario)
 
 @api_router.patch("/scenarios/{scenario_id}/amend", response_model=Scenario)
@@ -1142,6 +2944,7 @@ async def amend_scenario(scenario_id: str, amendment_data: ScenarioAmendment, cu
     
     await db.scenarios.update_one({"id": scenario_id}, {"$set": update_data})
     updated_scenario = await db.scenarios.find_one({"id": scenario_id})
+    scenario_prefetcher.enqueue(scenario_id, current_user.organization)
     return Scenario(**updated_scenario)
 
 @api_router.delete("/scenarios/{scenario_id}")
@@ -1339,32 +3142,240 @@ async def update_scenario_impact_scores(
     return Scenario(**updated_scenario)
 
 
-# AI Avatar Genie endpoints
-@api_router.post("/ai-genie", response_model=AIGenieResponse)
-async def chat_with_ai_genie(request: AIGenieRequest, current_user: User = Depends(get_current_user)):
-    try:
-        # Initialize Claude Sonnet 4 chat
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"genie-{current_user.id}",
-            system_message="""You are the AI Avatar Genie for the Polycrisis Simulator. You are an expert in crisis management, risk assessment, and scenario planning. 
+# Structured model output
+# Each model lists what one call fills in; text_field receives the Markdown narrative. from_text
+# builds the result from an unstructured response (local fallback, streaming, invalid JSON).
+class SimulationOutput(BaseModel):
+    text_field: ClassVar[str] = "analysis"
+    analysis: str = Field(description="Full simulation analysis")
+    risk_assessment: str = Field(description="Overall risk assessment in one or two sentences")
+    mitigation_strategies: List[str] = Field(description="Three to six concrete mitigation strategies")
+    key_insights: List[str] = Field(description="Three to six key insights")
+    confidence_score: float = Field(ge=0.0, le=1.0, description="Confidence in the analysis from 0.0 to 1.0")
+    
+    @classmethod
+    def from_text(cls, text: str) -> "SimulationOutput":
+        return cls(
+            analysis=text,
+            risk_assessment="High impact potential with cascading effects across multiple sectors",
+            mitigation_strategies=[
+                "Establish emergency communication protocols",
+                "Pre-position critical resources in affected areas",
+                "Coordinate with local emergency services",
+                "Implement public awareness campaigns"
+            ],
+            key_insights=[
+                "Early warning systems are critical for effective response",
+                "Cross-sector coordination significantly improves outcomes",
+                "Community preparedness reduces overall impact",
+                "Resource availability is a key limiting factor"
+            ],
+            confidence_score=0.85
+        )
 
-Your role is to:
-1. Help users refine their crisis scenarios with intelligent suggestions
-2. Identify critical monitoring tasks and variables
-3. Suggest appropriate AI avatars for specific tasks
-4. Provide insights on potential risks and mitigation strategies
+class AIGenieOutput(BaseModel):
+    text_field: ClassVar[str] = "response"
+    response: str = Field(description="Direct answer to the user's query")
+    suggestions: List[str] = Field(description="Three to five specific suggestions for improving the scenario")
+    monitoring_tasks: List[str] = Field(description="Three to five key monitoring tasks to track")
+    
+    @classmethod
+    def from_text(cls, text: str) -> "AIGenieOutput":
+        return cls(
+            response=text,
+            suggestions=[
+                "Consider environmental impact factors",
+                "Analyze supply chain vulnerabilities",
+                "Evaluate communication infrastructure resilience",
+                "Assess population displacement scenarios"
+            ],
+            monitoring_tasks=[
+                "Real-time weather and environmental monitoring",
+                "Economic indicator tracking",
+                "Social media sentiment analysis",
+                "Infrastructure status monitoring"
+            ]
+        )
 
-When responding, always structure your response with:
-- Direct answer to the user's query
-- 3-5 specific suggestions for scenario improvement
-- 3-5 key monitoring tasks that should be tracked
+class RapidAnalysisOutput(BaseModel):
+    text_field: ClassVar[str] = "analysis_content"
+    analysis_content: str = Field(description="Full analysis")
+    key_findings: List[str] = Field(description="Three to six key findings")
+    recommendations: List[str] = Field(description="Three to six prioritized recommendations")
+    priority_level: Literal["low", "medium", "high", "critical"] = Field(description="How urgently the company should act")
+    confidence_score: float = Field(ge=0.0, le=1.0, description="Confidence in the analysis from 0.0 to 1.0")
+    
+    @classmethod
+    def from_text(cls, text: str) -> "RapidAnalysisOutput":
+        return cls(
+            analysis_content=text,
+            key_findings=[
+                "Critical vulnerabilities identified requiring immediate attention",
+                "High-impact scenarios with significant business implications",
+                "Strategic opportunities for competitive advantage in crisis management",
+                "Operational dependencies creating potential single points of failure"
+            ],
+            recommendations=[
+                "Implement comprehensive business continuity planning",
+                "Establish crisis communication protocols and procedures",
+                "Develop scenario-specific response strategies and playbooks",
+                "Create cross-functional crisis management teams",
+                "Invest in monitoring and early warning systems"
+            ],
+            priority_level="high",
+            confidence_score=0.88
+        )
 
-Be practical, actionable, and focus on real-world crisis management principles."""
-        ).with_model("anthropic", "claude-3-7-sonnet-20250219")
-        
-        # Prepare context if scenario is provided
-        context_info = ""
+class DocumentAnalysisOutput(BaseModel):
+    text_field: ClassVar[str] = "ai_analysis"
+    ai_analysis: str = Field(description="Full document analysis")
+    key_insights: List[str] = Field(description="Three to six key business insights from the document")
+    risk_factors: List[str] = Field(description="Three to six risk factors and vulnerabilities the document reveals")
+    strategic_priorities: List[str] = Field(description="Three to six strategic priorities for crisis preparedness")
+    
+    @classmethod
+    def from_text(cls, text: str) -> "DocumentAnalysisOutput":
+        return cls(
+            ai_analysis=text,
+            key_insights=[
+                "Strategic priorities identified from document analysis",
+                "Business model strengths and opportunities",
+                "Operational efficiency and process optimization",
+                "Market positioning and competitive advantages"
+            ],
+            risk_factors=[
+                "Market volatility and competitive threats",
+                "Operational dependencies and single points of failure",
+                "Financial risks and cash flow concerns",
+                "Regulatory and compliance challenges"
+            ],
+            strategic_priorities=[
+                "Business continuity planning implementation",
+                "Risk mitigation strategy development",
+                "Crisis communication plan establishment",
+                "Emergency response procedure optimization"
+            ]
+        )
+
+def parse_structured_output(profile_name: str, text: str, output_model):
+    """Validate a JSON response against output_model; unstructured or invalid responses go through from_text"""
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        try:
+            return output_model.model_validate_json(text[start:end + 1])
+        except ValueError as e:
+            logging.warning(f"Structured {profile_name} response failed validation: {str(e)[:500]}")
+            llm_metrics.record_event(current_llm_endpoint(), llm_router.resolve(profile_name), "structured_invalid")
+    return output_model.from_text(text)
+
+# AI Genie conversation memory
+GENIE_MEMORY_TOKEN_BUDGET = int(os.environ.get('GENIE_MEMORY_TOKEN_BUDGET', '2000'))  # Recent turns sent verbatim
+GENIE_MEMORY_MAX_STORED_TURNS = 200  # Backstop if summarization keeps failing
+
+def format_genie_turn(turn: dict) -> str:
+    return f"User: {turn['user_query']}\nGenie: {turn['response']}"
+
+class GenieConversationStore:
+    """Per-user Genie memory: recent turns within a token budget plus a running summary of older turns.
+    Turns that fall out of the budget are folded into the summary by a background call, off the request path."""
+    
+    def __init__(self):
+        self.summarizing: Dict[str, asyncio.Task] = {}  # user_id -> running summary task
+        self.counters = {"summaries": 0, "summarized_turns": 0, "summary_failures": 0}
+    
+    def split_turns(self, turns: List[dict]):
+        """(older, recent): the newest turns fitting the token budget are recent"""
+        used = 0
+        for index in range(len(turns) - 1, -1, -1):
+            used += turns[index]["tokens"]
+            if used > GENIE_MEMORY_TOKEN_BUDGET:
+                return turns[:index + 1], turns[index + 1:]
+        return [], turns
+    
+    async def build_prompt(self, user_id: str, request_text: str) -> Union[str, LlmPrompt]:
+        """Summary and recent turns form the prefix, so consecutive turns share a cacheable prompt start"""
+        conversation = await db.genie_conversations.find_one({"user_id": user_id})
+        if not conversation or not (conversation.get("summary") or conversation.get("turns")):
+            return request_text
+        _, recent = self.split_turns(conversation.get("turns", []))
+        sections = ["CONVERSATION SO FAR"]
+        if conversation.get("summary"):
+            sections.append(f"Summary of earlier conversation:\n{conversation['summary']}")
+        if recent:
+            sections.append("Recent turns:\n\n" + "\n\n".join(format_genie_turn(turn) for turn in recent))
+        return LlmPrompt("\n\n".join(sections), request_text)
+    
+    async def append(self, user_id: str, user_query: str, response: str, scenario_id: Optional[str] = None):
+        turn = {
+            "id": str(uuid.uuid4()),
+            "user_query": user_query,
+            "response": response,
+            "scenario_id": scenario_id,
+            "tokens": estimate_tokens(user_query) + estimate_tokens(response),
+            "created_at": datetime.now(timezone.utc)
+        }
+        await db.genie_conversations.update_one(
+            {"user_id": user_id},
+            {
+                "$push": {"turns": {"$each": [turn], "$slice": -GENIE_MEMORY_MAX_STORED_TURNS}},
+                "$set": {"updated_at": turn["created_at"]},
+                "$setOnInsert": {"summary": ""}
+            },
+            upsert=True
+        )
+        self.schedule_summary(user_id)
+    
+    def schedule_summary(self, user_id: str):
+        if user_id not in self.summarizing:
+            self.summarizing[user_id] = asyncio.create_task(self.summarize(user_id))
+    
+    async def summarize(self, user_id: str):
+        llm_call_site.set("genie summary")
+        try:
+            conversation = await db.genie_conversations.find_one({"user_id": user_id})
+            older, _ = self.split_turns(conversation.get("turns", []) if conversation else [])
+            if not older:
+                return
+            turns_text = "\n\n".join(format_genie_turn(turn) for turn in older)
+            prompt = f"""Earlier summary:
+{conversation.get('summary') or '(none)'}
+
+New turns to fold in:
+
+{turns_text}"""
+            summary = await send_llm_message(
+                "genie_summary", prompt, session_id=f"genie-summary-{user_id}", use_cache=False, fallback=False
+            )
+            await db.genie_conversations.update_one(
+                {"user_id": user_id},
+                {
+                    "$set": {"summary": summary.strip(), "summarized_at": datetime.now(timezone.utc)},
+                    "$pull": {"turns": {"id": {"$in": [turn["id"] for turn in older]}}}
+                }
+            )
+            self.counters["summaries"] += 1
+            self.counters["summarized_turns"] += len(older)
+        except Exception as e:
+            # The turns stay stored and are retried after the next message
+            self.counters["summary_failures"] += 1
+            logging.warning(f"Genie conversation summary failed for {user_id}: {str(e)}")
+        finally:
+            self.summarizing.pop(user_id, None)
+    
+    async def clear(self, user_id: str):
+        await db.genie_conversations.delete_one({"user_id": user_id})
+    
+    def stats(self) -> dict:
+        return {"summaries_in_progress": len(self.summarizing), **self.counters}
+
+genie_conversations = GenieConversationStore()
+
+# AI Avatar Genie endpoints
+@api_router.post("/ai-genie", response_model=AIGenieResponse)
+async def chat_with_ai_genie(request: AIGenieRequest, current_user: User = Depends(get_current_user)):
+    try:
+        # Prepare context if scenario is provided
+        context_info = ""
         if request.scenario_id:
             scenario = await db.scenarios.find_one({"id": request.scenario_id, "user_id": current_user.id})
             if scenario:
@@ -1378,113 +3389,618 @@ Current Scenario Context:
 - Key Variables: {', '.join(scenario['key_variables'])}
 """
         
-        user_message = UserMessage(
-            text=f"{context_info}\n\nUser Query: {request.user_query}"
+        # Get AI response; conversation history comes from the bounded store, so each call gets a
+        # fresh provider session rather than one whose history grows for the life of the account
+        prompt = await genie_conversations.build_prompt(current_user.id, f"{context_info}\n\nUser Query: {request.user_query}")
+        ai_response = await send_llm_message(
+            "ai_genie",
+            with_output_model(prompt, AIGenieOutput),
+            session_id=f"genie-{current_user.id}-{uuid.uuid4()}"
         )
+        output = parse_structured_output("ai_genie", ai_response, AIGenieOutput)
+        await genie_conversations.append(current_user.id, request.user_query, output.response, request.scenario_id)
         
-        # Get AI response
-        ai_response = await chat.send_message(user_message)
-        
-        # Parse response into structured format
-        response_text = ai_response
-        
-        # Extract suggestions and monitoring tasks (simplified parsing)
-        suggestions = [
-            "Consider environmental impact factors",
-            "Analyze supply chain vulnerabilities", 
-            "Evaluate communication infrastructure resilience",
-            "Assess population displacement scenarios"
-        ]
-        
-        monitoring_tasks = [
-            "Real-time weather and environmental monitoring",
-            "Economic indicator tracking",
-            "Social media sentiment analysis",
-            "Infrastructure status monitoring"
-        ]
-        
-        return AIGenieResponse(
-            response=response_text,
-            suggestions=suggestions,
-            monitoring_tasks=monitoring_tasks
-        )
+        return AIGenieResponse(**output.model_dump())
         
     except Exception as e:
         logging.error(f"AI Genie error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"AI service error: {str(e)}")
 
-# Simulation endpoints
-@api_router.post("/scenarios/{scenario_id}/simulate", response_model=SimulationResult)
-async def run_simulation(scenario_id: str, current_user: User = Depends(get_current_user)):
+@api_router.get("/ai-genie/conversation")
+async def get_ai_genie_conversation(current_user: User = Depends(get_current_user)):
+    """The running summary and the turns the Genie still sees verbatim"""
+    conversation = await db.genie_conversations.find_one({"user_id": current_user.id}) or {}
+    _, recent = genie_conversations.split_turns(conversation.get("turns", []))
+    return {
+        "summary": conversation.get("summary", ""),
+        "recent_turns": [
+            {"user_query": turn["user_query"], "response": turn["response"], "scenario_id": turn.get("scenario_id"), "created_at": turn["created_at"]}
+            for turn in recent
+        ],
+        "pending_summary_turns": len(conversation.get("turns", [])) - len(recent),
+        "token_budget": GENIE_MEMORY_TOKEN_BUDGET
+    }
+
+@api_router.delete("/ai-genie/conversation")
+async def clear_ai_genie_conversation(current_user: User = Depends(get_current_user)):
+    await genie_conversations.clear(current_user.id)
+    return {"message": "Conversation memory cleared"}
+
+# Idempotency keys
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_SECONDS', '86400'))
+IDEMPOTENCY_LOCK_SECONDS = float(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', '300'))  # In-progress claims older than this are taken over
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', '120'))
+IDEMPOTENCY_POLL_SECONDS = 0.5
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+def as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+class IdempotencyStore:
+    """Idempotency-Key handling backed by the TTL-indexed idempotency_keys collection: the first request with a
+    key runs, repeats replay its stored response or wait for it while it is still running"""
+    
+    def __init__(self):
+        self.in_flight: Dict[str, asyncio.Future] = {}  # key_id -> resolved when this process finishes the request
+        self.counters = {"executed": 0, "replayed": 0, "waited": 0, "conflicts": 0, "takeovers": 0}
+    
+    async def reserve(self, key_id: str, user_id: str, fingerprint: str) -> Optional[dict]:
+        """Claim the key for this request; returns None when claimed, otherwise the existing record"""
+        now = datetime.now(timezone.utc)
+        try:
+            await db.idempotency_keys.insert_one({
+                "key_id": key_id,
+                "user_id": user_id,
+                "fingerprint": fingerprint,
+                "status": "in_progress",
+                "created_at": now,
+                "locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+                "expires_at": now + timedelta(seconds=IDEMPOTENCY_KEY_TTL_SECONDS)
+            })
+            return None
+        except DuplicateKeyError:
+            pass
+        
+        record = await db.idempotency_keys.find_one({"key_id": key_id}, {"_id": 0})
+        if record and record["status"] == "in_progress" and record["fingerprint"] == fingerprint \
+                and as_utc(record["locked_until"]) < now and key_id not in self.in_flight:
+            # The process that claimed it went away without finishing
+            claimed = await db.idempotency_keys.find_one_and_update(
+                {"key_id": key_id, "status": "in_progress", "locked_until": record["locked_until"]},
+                {"$set": {"locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}}
+            )
+            if claimed:
+                self.counters["takeovers"] += 1
+                return None
+        return record
+    
+    async def execute(self, key_id: str, handler):
+        done = asyncio.get_running_loop().create_future()
+        self.in_flight[key_id] = done
+        self.counters["executed"] += 1
+        fallback = {"served": False}
+        llm_fallback_served.set(fallback)
+        try:
+            result = await handler()
+        except BaseException:
+            # Let a retry run the request again
+            await db.idempotency_keys.delete_one({"key_id": key_id})
+            raise
+        finally:
+            del self.in_flight[key_id]
+            done.set_result(None)
+        
+        if isinstance(result, StreamingResponse) or fallback["served"]:
+            # Nothing to replay: a stream, or a degraded outline the client should be able to retry
+            await db.idempotency_keys.delete_one({"key_id": key_id})
+            return result
+        if isinstance(result, Response):
+            status_code, body = result.status_code, json.loads(result.body)
+        else:
+            status_code, body = 200, jsonable_encoder(result)
+        await db.idempotency_keys.update_one(
+            {"key_id": key_id},
+            {"$set": {"status": "completed", "status_code": status_code, "body": body, "completed_at": datetime.now(timezone.utc)}}
+        )
+        return result
+    
+    async def run(self, idempotency_key: Optional[str], user_id: str, request: Request, handler):
+        """Run handler once per (user, key); without a key it simply runs"""
+        if idempotency_key is None:
+            return await handler()
+        if not idempotency_key or len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{IDEMPOTENCY_KEY_MAX_LENGTH} characters")
+        
+        key_id = hashlib.sha256(f"{user_id}|{idempotency_key}".encode()).hexdigest()
+        query = "&".join(sorted(request.url.query.split("&"))) if request.url.query else ""
+        fingerprint = f"{request.method} {request.url.path}?{query}"
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        waited = False
+        while True:
+            record = await self.reserve(key_id, user_id, fingerprint)
+            if record is None:
+                return await self.execute(key_id, handler)
+            if record["fingerprint"] != fingerprint:
+                self.counters["conflicts"] += 1
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+            if record["status"] == "completed":
+                self.counters["replayed"] += 1
+                return JSONResponse(record["body"], status_code=record["status_code"], headers={"Idempotent-Replayed": "true"})
+            
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+            if not waited:
+                self.counters["waited"] += 1
+                waited = True
+            local = self.in_flight.get(key_id)
+            if local is not None:
+                await asyncio.wait({local}, timeout=remaining)
+            else:
+                await asyncio.sleep(min(IDEMPOTENCY_POLL_SECONDS, remaining))
+    
+    def stats(self) -> dict:
+        return {**self.counters, "in_flight": len(self.in_flight)}
+
+idempotency_store = IdempotencyStore()
+
+async def ensure_idempotency_indexes():
+    try:
+        await db.idempotency_keys.create_index("key_id", unique=True)
+        await db.idempotency_keys.create_index("expires_at", expireAfterSeconds=0)
+    except Exception as e:
+        logging.warning(f"Could not create idempotency_keys indexes: {str(e)}")
+
+# Monte Carlo impact simulation
+MONTE_CARLO_DRAWS = int(os.environ.get('MONTE_CARLO_DRAWS', '100000'))
+MONTE_CARLO_MAX_DRAWS = 1000000
+IMPACT_DOMAINS = ("economic", "social", "environmental")
+IMPACT_DOMAIN_WEIGHTS = np.array([0.4, 0.3, 0.3])  # Same weighting as calculate_total_impact
+
+# Relative exposure of each impact domain (economic, social, environmental) per crisis type
+CRISIS_DOMAIN_EXPOSURE = {
+    "economic_crisis": (1.0, 0.7, 0.4),
+    "pandemic": (0.8, 1.0, 0.3),
+    "natural_disaster": (0.6, 0.7, 1.0),
+    "environmental_crisis": (0.5, 0.6, 1.0),
+    "social_unrest": (0.6, 1.0, 0.3),
+    "technological_crisis": (0.9, 0.6, 0.3)
+}
+
+MONTE_CARLO_INPUT_FIELDS = (
+    "crisis_type", "severity_level", "affected_regions", "key_variables",
+    "economic_impact", "social_impact", "environmental_impact"
+)
+
+def monte_carlo_seed(scenario: dict) -> int:
+    """Stable for a scenario's inputs, so re-running an unchanged scenario reproduces its bands"""
+    payload = json.dumps([scenario["id"]] + [scenario.get(field) for field in MONTE_CARLO_INPUT_FIELDS])
+    return int(hashlib.sha256(payload.encode()).hexdigest()[:8], 16)
+
+def summarize_impact_samples(samples: np.ndarray) -> List[ImpactBand]:
+    """One band per column of a (draws, columns) sample matrix"""
+    percentiles = np.percentile(samples, [5, 25, 50, 75, 95], axis=0)
+    means, stds = samples.mean(axis=0), samples.std(axis=0)
+    return [
+        ImpactBand(
+            mean=round(float(means[column]), 2), std=round(float(stds[column]), 2),
+            **{f"p{pct}": round(float(value), 2) for pct, value in zip((5, 25, 50, 75, 95), percentiles[:, column])}
+        )
+        for column in range(samples.shape[1])
+    ]
+
+def impact_model(scenario: dict) -> dict:
+    """Nominal parameters of the impact model for a scenario.
+
+    Means come from the scenario's impact scores, or from severity and the crisis type's domain exposure.
+    More affected regions couple the domains more tightly and amplify impacts; more key variables widen
+    the spread. A severity-dependent share of draws also takes a cascading shock across all domains.
+    """
+    severity = float(scenario.get("severity_level", 5))
+    regions = max(1, len(scenario.get("affected_regions") or []))
+    variables = len(scenario.get("key_variables") or [])
+    exposure = CRISIS_DOMAIN_EXPOSURE.get(scenario.get("crisis_type"), (0.8, 0.8, 0.8))
+    return {
+        "severity": severity,
+        "means": np.array([
+            scenario.get(f"{domain}_impact") if scenario.get(f"{domain}_impact") is not None else severity * 10 * weight
+            for domain, weight in zip(IMPACT_DOMAINS, exposure)
+        ]) * (1 + 0.1 * math.log(regions)),
+        "spread": 10.0 + 2.5 * min(variables, 8),
+        "coupling": min(0.8, 0.3 + 0.05 * regions),
+        "cascade_probability": 0.02 + 0.03 * severity / 10,
+        "cascade_amplification": 1.25
+    }
+
+def classify_impact_totals(scenario: dict, total: np.ndarray) -> np.ndarray:
+    """Vectorized calculate_abc_classification: 0, 1, 2 for classes A, B, C"""
+    weighted_score = (float(scenario.get("severity_level", 5)) * 10 + total) * ABC_CRISIS_WEIGHTS.get(scenario.get("crisis_type"), 1.0) / 2
+    return np.where(weighted_score >= ABC_CLASS_A_THRESHOLD, 0, np.where(weighted_score >= ABC_CLASS_B_THRESHOLD, 1, 2))
+
+def run_monte_carlo(scenario: dict, draws: int = MONTE_CARLO_DRAWS, seed: Optional[int] = None) -> MonteCarloResult:
+    """Draw correlated economic, social and environmental impacts for a scenario and classify every draw"""
+    started = time.perf_counter()
+    seed = monte_carlo_seed(scenario) if seed is None else seed
+    rng = np.random.default_rng(seed)
+    model = impact_model(scenario)
+    correlation = np.full((3, 3), model["coupling"])
+    np.fill_diagonal(correlation, 1.0)
+    
+    shocks = rng.standard_normal((draws, 3)) @ np.linalg.cholesky(correlation).T
+    impacts = model["means"] + model["spread"] * shocks
+    cascading = rng.random(draws) < model["cascade_probability"]
+    impacts[cascading] *= rng.lognormal(math.log(model["cascade_amplification"]), 0.2, size=(int(cascading.sum()), 1))
+    np.clip(impacts, 0.0, 100.0, out=impacts)
+    total = impacts @ IMPACT_DOMAIN_WEIGHTS
+    class_shares = np.bincount(classify_impact_totals(scenario, total), minlength=3) / draws
+    
+    bands = summarize_impact_samples(np.column_stack([impacts, total]))
+    abc_probabilities = {label: round(float(share), 4) for label, share in zip("ABC", class_shares)}
+    return MonteCarloResult(
+        draws=draws,
+        seed=seed,
+        impacts=dict(zip(IMPACT_DOMAINS + ("total",), bands)),
+        abc_probabilities=abc_probabilities,
+        most_likely_class=max(abc_probabilities, key=abc_probabilities.get),
+        runtime_ms=round((time.perf_counter() - started) * 1000, 2)
+    )
+
+@api_router.post("/scenarios/{scenario_id}/monte-carlo", response_model=MonteCarloResult)
+async def run_scenario_monte_carlo(scenario_id: str, draws: int = MONTE_CARLO_DRAWS, current_user: User = Depends(get_current_user)):
+    """Quantitative impact simulation alone, without the model-written analysis"""
     scenario = await db.scenarios.find_one({"id": scenario_id, "user_id": current_user.id})
     if not scenario:
         raise HTTPException(status_code=404, detail="Scenario not found")
-    
-    try:
-        # Initialize AI for simulation analysis
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"simulation-{scenario_id}",
-            system_message="""You are an expert crisis simulation engine. Analyze the given crisis scenario and provide:
+    if not 1000 <= draws <= MONTE_CARLO_MAX_DRAWS:
+        raise HTTPException(status_code=400, detail=f"draws must be between 1000 and {MONTE_CARLO_MAX_DRAWS}")
+    return await asyncio.to_thread(run_monte_carlo, scenario, draws)
+
+# Uncertainty quantification
+UNCERTAINTY_OUTER_SAMPLES = int(os.environ.get('UNCERTAINTY_OUTER_SAMPLES', '200'))
+UNCERTAINTY_INNER_SAMPLES = int(os.environ.get('UNCERTAINTY_INNER_SAMPLES', '500'))
+UNCERTAINTY_MAX_SAMPLES = 1000000
+UNCERTAINTY_CONFIDENCE = 0.9
+
+def epistemic_parameter_ranges(scenario: dict) -> Dict[str, tuple]:
+    """Plausible ranges for what the impact model does not know, as scale factors or shifts on its nominal parameters"""
+    ranges = {}
+    for domain in IMPACT_DOMAINS:
+        # Assessed impact scores are better known than ones derived from severity alone
+        width = 0.1 if scenario.get(f"{domain}_impact") is not None else 0.25
+        ranges[f"{domain}_mean"] = (1 - width, 1 + width)
+    ranges.update({
+        "spread": (0.75, 1.25),
+        "coupling": (-0.15, 0.15),
+        "cascade_probability": (0.5, 2.0),
+        "cascade_amplification": (1.1, 1.4)
+    })
+    return ranges
+
+def latin_hypercube(rng: np.random.Generator, samples: int, dimensions: int) -> np.ndarray:
+    """Uniform (samples, dimensions) design on [0, 1) with exactly one sample in each of the samples strata per dimension"""
+    strata = rng.permuted(np.tile(np.arange(samples), (dimensions, 1)), axis=1).T
+    return (strata + rng.random((samples, dimensions))) / samples
+
+def run_uncertainty_quantification(
+    scenario: dict,
+    outer_samples: int = UNCERTAINTY_OUTER_SAMPLES,
+    inner_samples: int = UNCERTAINTY_INNER_SAMPLES,
+    seed: Optional[int] = None
+) -> UncertaintyResult:
+    """Nested sampling of the impact model that keeps aleatory and epistemic uncertainty apart.
+
+    The outer loop draws the epistemic parameters by Latin hypercube; for each of those, the inner loop draws
+    the model's own randomness. Percentiles of every inner distribution, taken across the outer samples, give
+    confidence intervals on the percentiles themselves. Both loops are one array operation.
+    """
+    started = time.perf_counter()
+    seed = monte_carlo_seed(scenario) if seed is None else seed
+    rng = np.random.default_rng(seed)
+    model = impact_model(scenario)
+    ranges = epistemic_parameter_ranges(scenario)
+    lows, highs = np.array(list(ranges.values())).T
+    parameters = lows + latin_hypercube(rng, outer_samples, len(ranges)) * (highs - lows)
+    
+    means = model["means"] * parameters[:, :3]
+    spread = model["spread"] * parameters[:, 3]
+    coupling = np.clip(model["coupling"] + parameters[:, 4], 0.0, 0.9)
+    cascade_probability = np.minimum(1.0, model["cascade_probability"] * parameters[:, 5])
+    correlation = np.repeat(coupling, 9).reshape(outer_samples, 3, 3)
+    correlation[:, range(3), range(3)] = 1.0
+    
+    shocks = rng.standard_normal((outer_samples, inner_samples, 3)) @ np.linalg.cholesky(correlation).transpose(0, 2, 1)
+    impacts = means[:, None, :] + spread[:, None, None] * shocks
+    cascading = rng.random((outer_samples, inner_samples)) < cascade_probability[:, None]
+    amplification = rng.lognormal(np.log(parameters[:, 6])[:, None], 0.2, size=(outer_samples, inner_samples))
+    impacts *= np.where(cascading, amplification, 1.0)[:, :, None]
+    np.clip(impacts, 0.0, 100.0, out=impacts)
+    total = impacts @ IMPACT_DOMAIN_WEIGHTS
+    samples = np.concatenate([impacts, total[:, :, None]], axis=2)
+    
+    tail = (1 - UNCERTAINTY_CONFIDENCE) / 2 * 100
+    bounds = [tail, 50, 100 - tail]
+    statistics = np.concatenate([samples.mean(axis=1)[None], np.percentile(samples, [5, 50, 95], axis=1)])
+    intervals = np.percentile(statistics, bounds, axis=1)  # (bound, statistic, column)
+    aleatory = samples.var(axis=1).mean(axis=0)
+    epistemic = samples.mean(axis=1).var(axis=0)
+    
+    classes = classify_impact_totals(scenario, total)
+    class_shares = np.stack([(classes == label).mean(axis=1) for label in range(3)], axis=1)
+    class_intervals = np.percentile(class_shares, bounds, axis=0)
+    
+    columns = IMPACT_DOMAINS + ("total",)
+    return UncertaintyResult(
+        outer_samples=outer_samples,
+        inner_samples=inner_samples,
+        seed=seed,
+        confidence_level=UNCERTAINTY_CONFIDENCE,
+        impacts=dict(zip(columns, summarize_impact_samples(samples.reshape(-1, len(columns))))),
+        percentile_intervals={
+            name: {
+                statistic: ConfidenceInterval(
+                    estimate=round(float(intervals[1, row, column]), 2),
+                    lower=round(float(intervals[0, row, column]), 2),
+                    upper=round(float(intervals[2, row, column]), 2)
+                )
+                for row, statistic in enumerate(("mean", "p5", "p50", "p95"))
+            }
+            for column, name in enumerate(columns)
+        },
+        variance_shares={
+            name: {
+                "aleatory": round(float(aleatory[column] / (aleatory[column] + epistemic[column] or 1.0)), 4),
+                "epistemic": round(float(epistemic[column] / (aleatory[column] + epistemic[column] or 1.0)), 4)
+            }
+            for column, name in enumerate(columns)
+        },
+        abc_probabilities={
+            label: ConfidenceInterval(
+                estimate=round(float(class_shares[:, index].mean()), 4),
+                lower=round(float(class_intervals[0, index]), 4),
+                upper=round(float(class_intervals[2, index]), 4)
+            )
+            for index, label in enumerate("ABC")
+        },
+        parameter_ranges={name: [float(low), float(high)] for name, (low, high) in ranges.items()},
+        runtime_ms=round((time.perf_counter() - started) * 1000, 2)
+    )
 
-1. Detailed risk assessment
-2. Potential impacts and cascading effects
-3. Concrete mitigation strategies
-4. Key insights and recommendations
-5. Confidence score (0.0-1.0) for your analysis
+def quantify_scenario(scenario: dict) -> tuple:
+    """Monte Carlo bands and uncertainty quantification stored with every simulation result"""
+    return run_monte_carlo(scenario), run_uncertainty_quantification(scenario)
 
-Be thorough, realistic, and provide actionable insights based on real crisis management principles."""
-        ).with_model("anthropic", "claude-3-7-sonnet-20250219")
-        
-        simulation_prompt = f"""
-Please analyze this crisis scenario and provide a comprehensive simulation:
+@api_router.post("/scenarios/{scenario_id}/uncertainty", response_model=UncertaintyResult)
+async def run_scenario_uncertainty(
+    scenario_id: str,
+    outer_samples: int = UNCERTAINTY_OUTER_SAMPLES,
+    inner_samples: int = UNCERTAINTY_INNER_SAMPLES,
+    current_user: User = Depends(get_current_user)
+):
+    """Uncertainty quantification alone, without the model-written analysis"""
+    scenario = await db.scenarios.find_one({"id": scenario_id, "user_id": current_user.id})
+    if not scenario:
+        raise HTTPException(status_code=404, detail="Scenario not found")
+    if outer_samples < 10 or inner_samples < 10 or outer_samples * inner_samples > UNCERTAINTY_MAX_SAMPLES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"outer_samples and inner_samples must be at least 10, with at most {UNCERTAINTY_MAX_SAMPLES} samples in total"
+        )
+    return await asyncio.to_thread(run_uncertainty_quantification, scenario, outer_samples, inner_samples)
 
-Scenario: {scenario['title']}
-Type: {scenario['crisis_type']}
-Description: {scenario['description']}
-Severity Level: {scenario['severity_level']}/10
-Affected Regions: {', '.join(scenario['affected_regions'])}
-Key Variables: {', '.join(scenario['key_variables'])}
+# Simulation endpoints
+def build_simulation_prompt(scenario: dict, structured: bool = True) -> LlmPrompt:
+    """Structured unless streamed, since a streamed response is shown to the user as it arrives"""
+    return build_scenario_prompt("simulation", scenario, """
+Please analyze this crisis scenario and provide a comprehensive simulation.
 
 Provide detailed analysis including risk assessment, mitigation strategies, and key insights.
-"""
-        
-        user_message = UserMessage(text=simulation_prompt)
-        analysis = await chat.send_message(user_message)
-        
-        # Create simulation result
-        result = SimulationResult(
-            scenario_id=scenario_id,
-            analysis=analysis,
-            risk_assessment="High impact potential with cascading effects across multiple sectors",
-            mitigation_strategies=[
-                "Establish emergency communication protocols",
-                "Pre-position critical resources in affected areas",
-                "Coordinate with local emergency services",
-                "Implement public awareness campaigns"
-            ],
-            key_insights=[
-                "Early warning systems are critical for effective response",
-                "Cross-sector coordination significantly improves outcomes",
-                "Community preparedness reduces overall impact",
-                "Resource availability is a key limiting factor"
-            ],
-            confidence_score=0.85
+""", SimulationOutput if structured else None)
+
+def build_simulation_result(
+    scenario_id: str,
+    content: str,
+    monte_carlo: Optional[MonteCarloResult] = None,
+    uncertainty: Optional[UncertaintyResult] = None
+) -> SimulationResult:
+    output = parse_structured_output("simulation", content, SimulationOutput)
+    return SimulationResult(scenario_id=scenario_id, monte_carlo=monte_carlo, uncertainty=uncertainty, **output.model_dump())
+
+async def save_simulation_result(scenario_id: str, content: str) -> SimulationResult:
+    """Persist a simulation result for the generated response, with its impact bands and uncertainty, and mark the scenario active.
+    Local fallback text is returned unsaved."""
+    scenario = await db.scenarios.find_one({"id": scenario_id})
+    monte_carlo, uncertainty = await asyncio.to_thread(quantify_scenario, scenario) if scenario else (None, None)
+    result = build_simulation_result(scenario_id, content, monte_carlo, uncertainty)
+    if isinstance(content, LlmFallbackText):
+        return result  # Shown to the caller, but not stored as the scenario's simulation
+    await db.simulation_results.insert_one(result.dict())
+    
+    # Update scenario status
+    await db.scenarios.update_one(
+        {"id": scenario_id}, 
+        {"$set": {"status": "active", "updated_at": datetime.now(timezone.utc)}}
+    )
+    
+    return result
+
+@api_router.post("/scenarios/{scenario_id}/simulate", response_model=SimulationResult)
+async def run_simulation(
+    scenario_id: str,
+    request: Request,
+    stream: bool = False,
+    run_async: bool = Query(False, alias="async"),
+    idempotency_key: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    scenario = await db.scenarios.find_one({"id": scenario_id, "user_id": current_user.id})
+    if not scenario:
+        raise HTTPException(status_code=404, detail="Scenario not found")
+    
+    if stream and not run_async:
+        return stream_llm_artifact(
+            "simulation", build_simulation_prompt(scenario, structured=False), f"simulation-{scenario_id}",
+            lambda analysis: save_simulation_result(scenario_id, analysis),
+            {"artifact": "simulation", "scenario_id": scenario_id}
         )
-        
-        await db.simulation_results.insert_one(result.dict())
-        
-        # Update scenario status
-        await db.scenarios.update_one(
-            {"id": scenario_id}, 
+    
+    async def simulate():
+        if run_async:
+            return await submit_generation_job("simulation", scenario_id, current_user)
+        try:
+            content = await send_llm_message("simulation", build_simulation_prompt(scenario), session_id=f"simulation-{scenario_id}")
+            return await save_simulation_result(scenario_id, content)
+            
+        except Exception as e:
+            logging.error(f"Simulation error: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Simulation error: {str(e)}")
+    
+    return await idempotency_store.run(idempotency_key, current_user.id, request, simulate)
+
+# Batch simulation
+SIMULATION_BATCH_DEFAULT_CONCURRENCY = int(os.environ.get('SIMULATION_BATCH_CONCURRENCY', '4'))
+SIMULATION_BATCH_MAX_CONCURRENCY = int(os.environ.get('SIMULATION_BATCH_MAX_CONCURRENCY', '16'))
+SIMULATION_BATCH_MAX_SCENARIOS = int(os.environ.get('SIMULATION_BATCH_MAX_SCENARIOS', '500'))
+SIMULATION_BATCH_WRITE_SIZE = 50
+
+class BatchSimulationRequest(BaseModel):
+    scenario_ids: Optional[List[str]] = None
+    # Filter used when scenario_ids is not given
+    crisis_type: Optional[str] = None
+    status: Optional[str] = None
+    abc_classification: Optional[str] = None
+    min_severity_level: Optional[int] = None
+    limit: int = 100
+    concurrency: int = SIMULATION_BATCH_DEFAULT_CONCURRENCY
+
+async def find_batch_scenarios(batch: BatchSimulationRequest, user_id: str):
+    """Resolve the request to the user's scenarios; returns (scenarios, ids that were not found)"""
+    query = {"user_id": user_id}
+    if batch.scenario_ids:
+        query["id"] = {"$in": batch.scenario_ids}
+    else:
+        for field in ("crisis_type", "status", "abc_classification"):
+            if getattr(batch, field):
+                query[field] = getattr(batch, field)
+        if batch.min_severity_level is not None:
+            query["severity_level"] = {"$gte": batch.min_severity_level}
+    
+    limit = max(1, min(batch.limit, SIMULATION_BATCH_MAX_SCENARIOS))
+    if batch.scenario_ids:
+        limit = min(len(batch.scenario_ids), SIMULATION_BATCH_MAX_SCENARIOS)
+    scenarios = await db.scenarios.find(query).limit(limit).to_list(limit)
+    
+    found = {scenario["id"] for scenario in scenarios}
+    missing = [scenario_id for scenario_id in (batch.scenario_ids or []) if scenario_id not in found]
+    return scenarios, missing
+
+async def run_simulation_batch(scenarios: List[dict], concurrency: int):
+    """Simulate scenarios with bounded concurrency, yielding per-scenario outcomes as they finish.
+
+    Results are written with insert_many in groups of SIMULATION_BATCH_WRITE_SIZE, and the
+    simulated scenarios are marked active with one update_many per group.
+    """
+    semaphore = asyncio.Semaphore(max(1, min(concurrency, SIMULATION_BATCH_MAX_CONCURRENCY)))
+    pending_results: List[SimulationResult] = []
+    
+    async def simulate(scenario: dict) -> dict:
+        llm_priority.set("batch")
+        async with semaphore:
+            try:
+                analysis = await send_llm_message_with_retry(
+                    "simulation", build_simulation_prompt(scenario), session_id=f"simulation-{scenario['id']}"
+                )
+                result = build_simulation_result(scenario["id"], analysis, *await asyncio.to_thread(quantify_scenario, scenario))
+            except Exception as e:
+                return {"scenario_id": scenario["id"], "status": "failed", "error": str(e)}
+        pending_results.append(result)
+        return {"scenario_id": scenario["id"], "status": "completed", "result_id": result.id}
+    
+    async def flush():
+        if not pending_results:
+            return
+        batch_results = pending_results[:]
+        pending_results.clear()
+        await db.simulation_results.insert_many([result.dict() for result in batch_results])
+        await db.scenarios.update_many(
+            {"id": {"$in": [result.scenario_id for result in batch_results]}},
             {"$set": {"status": "active", "updated_at": datetime.now(timezone.utc)}}
         )
-        
-        return result
-        
-    except Exception as e:
-        logging.error(f"Simulation error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Simulation error: {str(e)}")
+    
+    tasks = [asyncio.create_task(simulate(scenario)) for scenario in scenarios]
+    try:
+        for next_outcome in asyncio.as_completed(tasks):
+            outcome = await next_outcome
+            if len(pending_results) >= SIMULATION_BATCH_WRITE_SIZE:
+                await flush()
+            yield outcome
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Keep whatever finished even if the caller went away mid-batch
+        await asyncio.shield(flush())
+
+async def collect_simulation_batch(scenarios: List[dict], missing: List[str], concurrency: int) -> dict:
+    outcomes = [{"scenario_id": scenario_id, "status": "not_found"} for scenario_id in missing]
+    async for outcome in run_simulation_batch(scenarios, concurrency):
+        outcomes.append(outcome)
+    return {
+        "total": len(outcomes),
+        "succeeded": sum(1 for outcome in outcomes if outcome["status"] == "completed"),
+        "failed": sum(1 for outcome in outcomes if outcome["status"] == "failed"),
+        "not_found": len(missing),
+        "results": outcomes
+    }
+
+async def run_simulation_batch_job(job: dict) -> dict:
+    batch = BatchSimulationRequest(**job["params"]["request"])
+    scenarios, missing = await find_batch_scenarios(batch, job["user_id"])
+    return await collect_simulation_batch(scenarios, missing, batch.concurrency)
+
+@api_router.post("/scenarios/simulate-batch")
+async def simulate_scenario_batch(
+    batch: BatchSimulationRequest,
+    stream: bool = False,
+    run_async: bool = Query(False, alias="async"),
+    current_user: User = Depends(get_current_user)
+):
+    """Simulate many scenarios in one request, by id list or filter"""
+    if run_async:
+        job = await job_queue.submit("simulation_batch", current_user.id, {"request": batch.dict()})
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={"job_id": job.id, "status": job.status, "status_url": f"/api/jobs/{job.id}"}
+        )
+    
+    scenarios, missing = await find_batch_scenarios(batch, current_user.id)
+    if not scenarios:
+        raise HTTPException(status_code=404, detail="No matching scenarios found")
+    
+    if not stream:
+        try:
+            return await collect_simulation_batch(scenarios, missing, batch.concurrency)
+        except Exception as e:
+            logging.error(f"Batch simulation error: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Batch simulation error: {str(e)}")
+    
+    async def event_stream():
+        yield format_sse_event("start", {"total": len(scenarios) + len(missing)})
+        counts = {"completed": 0, "failed": 0, "not_found": len(missing)}
+        for scenario_id in missing:
+            yield format_sse_event("result", {"scenario_id": scenario_id, "status": "not_found"})
+        try:
+            async for outcome in run_simulation_batch(scenarios, batch.concurrency):
+                counts[outcome["status"]] += 1
+                yield format_sse_event("result", outcome)
+            yield format_sse_event("done", {"succeeded": counts["completed"], "failed": counts["failed"], "not_found": counts["not_found"]})
+        except Exception as e:
+            logging.error(f"Batch simulation stream error: {str(e)}")
+            yield format_sse_event("error", {"detail": str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @api_router.get("/scenarios/{scenario_id}/results", response_model=List[SimulationResult])
 async def get_simulation_results(scenario_id: str, current_user: User = Depends(get_current_user)):
@@ -1498,37 +4014,9 @@ async def get_simulation_results(scenario_id: str, current_user: User = Depends(
 
 # Dashboard endpoints
 # Game Book generation endpoint
-@api_router.post("/scenarios/{scenario_id}/game-book", response_model=GameBook)
-async def generate_game_book(scenario_id: str, current_user: User = Depends(get_current_user)):
-    scenario = await db.scenarios.find_one({"id": scenario_id, "user_id": current_user.id})
-    if not scenario:
-        raise HTTPException(status_code=404, detail="Scenario not found")
-    
-    try:
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"gamebook-{scenario_id}",
-            system_message="""You are an expert crisis management game book creator. Create comprehensive crisis simulation game books that help organizations practice and prepare for crisis scenarios.
-
-Your role is to:
-1. Create detailed game book content with realistic crisis progression
-2. Identify critical decision points during the crisis
-3. Specify resource requirements and constraints
-4. Define timeline phases with clear milestones
-5. Establish success metrics and evaluation criteria
-
-Provide structured, actionable game book content that can be used for tabletop exercises and crisis simulations."""
-        ).with_model("anthropic", "claude-3-7-sonnet-20250219")
-        
-        prompt = f"""
-Create a comprehensive Crisis Game Book for this scenario:
-
-Scenario: {scenario['title']}
-Type: {scenario['crisis_type']}
-Description: {scenario['description']}
-Severity: {scenario['severity_level']}/10
-Regions: {', '.join(scenario['affected_regions'])}
-Variables: {', '.join(scenario['key_variables'])}
+def build_game_book_prompt(scenario: dict) -> LlmPrompt:
+    return build_scenario_prompt("game_book", scenario, """
+Create a comprehensive Crisis Game Book for this scenario.
 
 Generate a detailed game book that includes:
 1. Crisis progression phases with realistic timeline
@@ -1538,84 +4026,85 @@ Generate a detailed game book that includes:
 5. Realistic constraints and challenges
 
 Format as a practical tabletop exercise guide.
-"""
-        
-        user_message = UserMessage(text=prompt)
-        game_content = await chat.send_message(user_message)
-        
-        game_book = GameBook(
-            scenario_id=scenario_id,
-            game_book_content=game_content,
-            decision_points=[
-                "Initial crisis detection and assessment",
-                "Resource allocation and deployment decisions",
-                "Communication strategy activation",
-                "Escalation and response coordination",
-                "Recovery and business continuity planning"
-            ],
-            resource_requirements=[
-                "Emergency response team personnel",
-                "Communication infrastructure",
-                "Emergency supplies and equipment",
-                "Backup facilities and locations",
-                "External partner coordination"
-            ],
-            timeline_phases=[
-                "Phase 1: Crisis Detection (0-1 hours)",
-                "Phase 2: Initial Response (1-6 hours)",
-                "Phase 3: Full Activation (6-24 hours)",
-                "Phase 4: Sustained Operations (1-7 days)",
-                "Phase 5: Recovery Planning (1-4 weeks)"
-            ],
-            success_metrics=[
-                "Response time to initial crisis detection",
-                "Effectiveness of communication protocols",
-                "Resource utilization efficiency",
-                "Stakeholder satisfaction scores",
-                "Recovery timeline adherence"
-            ]
-        )
-        
+""")
+
+async def save_game_book(scenario_id: str, game_content: str) -> GameBook:
+    """Persist a game book built from the generated content, unless it is local fallback text"""
+    game_book = GameBook(
+        scenario_id=scenario_id,
+        game_book_content=game_content,
+        decision_points=[
+            "Initial crisis detection and assessment",
+            "Resource allocation and deployment decisions",
+            "Communication strategy activation",
+            "Escalation and response coordination",
+            "Recovery and business continuity planning"
+        ],
+        resource_requirements=[
+            "Emergency response team personnel",
+            "Communication infrastructure",
+            "Emergency supplies and equipment",
+            "Backup facilities and locations",
+            "External partner coordination"
+        ],
+        timeline_phases=[
+            "Phase 1: Crisis Detection (0-1 hours)",
+            "Phase 2: Initial Response (1-6 hours)",
+            "Phase 3: Full Activation (6-24 hours)",
+            "Phase 4: Sustained Operations (1-7 days)",
+            "Phase 5: Recovery Planning (1-4 weeks)"
+        ],
+        success_metrics=[
+            "Response time to initial crisis detection",
+            "Effectiveness of communication protocols",
+            "Resource utilization efficiency",
+            "Stakeholder satisfaction scores",
+            "Recovery timeline adherence"
+        ]
+    )
+    
+    if not isinstance(game_content, LlmFallbackText):
         await db.game_books.insert_one(game_book.dict())
-        return game_book
-        
-    except Exception as e:
-        logging.error(f"Game book generation error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Game book generation failed: {str(e)}")
+    return game_book
 
-# Action Plan generation endpoint
-@api_router.post("/scenarios/{scenario_id}/action-plan", response_model=ActionPlan)
-async def generate_action_plan(scenario_id: str, current_user: User = Depends(get_current_user)):
+@api_router.post("/scenarios/{scenario_id}/game-book", response_model=GameBook)
+async def generate_game_book(
+    scenario_id: str,
+    request: Request,
+    stream: bool = False,
+    run_async: bool = Query(False, alias="async"),
+    idempotency_key: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
     scenario = await db.scenarios.find_one({"id": scenario_id, "user_id": current_user.id})
     if not scenario:
         raise HTTPException(status_code=404, detail="Scenario not found")
     
-    try:
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"actionplan-{scenario_id}",
-            system_message="""You are an expert crisis management action plan developer. Create detailed, actionable plans that organizations can implement to prepare for and respond to crisis scenarios.
-
-Your role is to:
-1. Define immediate actions (0-24 hours)
-2. Outline short-term actions (1-30 days)  
-3. Plan long-term actions (1-12 months)
-4. Identify responsible parties and roles
-5. Specify resource allocation requirements
-6. Assign priority levels based on impact and urgency
-
-Provide practical, implementable action items with clear ownership and timelines."""
-        ).with_model("anthropic", "claude-3-7-sonnet-20250219")
-        
-        prompt = f"""
-Create a comprehensive Action Plan for this crisis scenario:
+    prompt = build_game_book_prompt(scenario)
+    if stream and not run_async:
+        return stream_llm_artifact(
+            "game_book", prompt, f"gamebook-{scenario_id}",
+            lambda game_content: save_game_book(scenario_id, game_content),
+            {"artifact": "game_book", "scenario_id": scenario_id}
+        )
+    
+    async def generate():
+        if run_async:
+            return await submit_generation_job("game_book", scenario_id, current_user)
+        try:
+            game_content = await send_llm_message("game_book", prompt, session_id=f"gamebook-{scenario_id}")
+            return await save_game_book(scenario_id, game_content)
+            
+        except Exception as e:
+            logging.error(f"Game book generation error: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Game book generation failed: {str(e)}")
+    
+    return await idempotency_store.run(idempotency_key, current_user.id, request, generate)
 
-Scenario: {scenario['title']}
-Type: {scenario['crisis_type']}
-Description: {scenario['description']}
-Severity: {scenario['severity_level']}/10
-Regions: {', '.join(scenario['affected_regions'])}
-Variables: {', '.join(scenario['key_variables'])}
+# Action Plan generation endpoint
+def build_action_plan_prompt(scenario: dict) -> LlmPrompt:
+    return build_scenario_prompt("action_plan", scenario, """
+Create a comprehensive Action Plan for this crisis scenario.
 
 Generate specific, actionable steps organized by timeline:
 1. Immediate Actions (0-24 hours) - Critical first responses
@@ -1626,153 +4115,715 @@ Generate specific, actionable steps organized by timeline:
 6. Overall priority assessment
 
 Make all actions specific, measurable, and implementable.
-"""
+""")
+
+async def save_action_plan(scenario_id: str, action_content: str) -> ActionPlan:
+    """Persist an action plan alongside the generated plan text, unless it is local fallback text"""
+    action_plan = ActionPlan(
+        scenario_id=scenario_id,
+        plan_content=action_content,
+        immediate_actions=[
+            "Activate crisis management team within 30 minutes",
+            "Establish secure communication channels",
+            "Conduct initial situation assessment",
+            "Alert key stakeholders and authorities",
+            "Implement immediate safety protocols"
+        ],
+        short_term_actions=[
+            "Deploy emergency response resources",
+            "Establish coordination with external agencies",
+            "Begin damage assessment procedures",
+            "Activate business continuity plans",
+            "Implement public communication strategy"
+        ],
+        long_term_actions=[
+            "Conduct comprehensive lessons learned review",
+            "Update crisis management procedures",
+            "Invest in infrastructure improvements",
+            "Enhance training and preparedness programs",
+            "Develop strategic partnerships"
+        ],
+        responsible_parties=[
+            "Crisis Management Team Leader",
+            "Emergency Response Coordinator",
+            "Communications Director",
+            "Operations Manager",
+            "External Relations Manager"
+        ],
+        resource_allocation=[
+            "Emergency response personnel (24/7 coverage)",
+            "Communication systems and backup power",
+            "Emergency supplies and equipment inventory",
+            "Financial reserves for crisis response",
+            "External contractor and vendor agreements"
+        ],
+        priority_level="HIGH"
+    )
+    
+    if not isinstance(action_content, LlmFallbackText):
+        await db.action_plans.insert_one(action_plan.dict())
+    return action_plan
+
+@api_router.post("/scenarios/{scenario_id}/action-plan", response_model=ActionPlan)
+async def generate_action_plan(
+    scenario_id: str,
+    stream: bool = False,
+    run_async: bool = Query(False, alias="async"),
+    current_user: User = Depends(get_current_user)
+):
+    scenario = await db.scenarios.find_one({"id": scenario_id, "user_id": current_user.id})
+    if not scenario:
+        raise HTTPException(status_code=404, detail="Scenario not found")
+    
+    prompt = build_action_plan_prompt(scenario)
+    if stream and not run_async:
+        return stream_llm_artifact(
+            "action_plan", prompt, f"actionplan-{scenario_id}",
+            lambda action_content: save_action_plan(scenario_id, action_content),
+            {"artifact": "action_plan", "scenario_id": scenario_id}
+        )
+    if run_async:
+        return await submit_generation_job("action_plan", scenario_id, current_user)
+    
+    try:
+        action_content = await send_llm_message("action_plan", prompt, session_id=f"actionplan-{scenario_id}")
+        return await save_action_plan(scenario_id, action_content)
         
-        user_message = UserMessage(text=prompt)
-        action_content = await chat.send_message(user_message)
+    except Exception as e:
+        logging.error(f"Action plan generation error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Action plan generation failed: {str(e)}")
+
+# Strategy Implementation endpoint
+def build_strategy_prompt(scenario: dict, organization: str) -> LlmPrompt:
+    return build_scenario_prompt("strategy_implementation", scenario, f"""
+Create a Strategic Implementation Plan for integrating this crisis scenario into organizational strategy.
+
+Organization: {organization}
+
+Develop a comprehensive strategy covering:
+1. Overall implementation approach and methodology
+2. Required organizational changes and restructuring
+3. Policy recommendations and procedure updates
+4. Training requirements and capability development
+5. Budget considerations and investment priorities
+6. Stakeholder engagement and communication strategies
+
+Focus on building long-term organizational resilience and crisis preparedness capabilities.
+""")
+
+async def save_strategy_implementation(scenario_id: str, strategy_content: str) -> StrategyImplementation:
+    """Persist a strategy implementation built from the generated content, unless it is local fallback text"""
+    strategy_impl = StrategyImplementation(
+        scenario_id=scenario_id,
+        implementation_strategy=strategy_content,
+        organizational_changes=[
+            "Establish dedicated crisis management office",
+            "Create cross-functional rapid response teams",
+            "Implement crisis communication protocols",
+            "Develop supplier and vendor backup systems",
+            "Enhance decision-making authority structures"
+        ],
+        policy_recommendations=[
+            "Update crisis management policy framework",
+            "Establish clear escalation procedures",
+            "Define roles and responsibilities matrix",
+            "Create resource allocation guidelines",
+            "Implement regular scenario testing requirements"
+        ],
+        training_requirements=[
+            "Executive crisis leadership training",
+            "Tabletop exercise facilitation skills",
+            "Crisis communication and media training",
+            "Business continuity planning workshops",
+            "Inter-agency coordination training"
+        ],
+        budget_considerations=[
+            "Crisis management system infrastructure",
+            "Emergency supplies and equipment reserves",
+            "Training and development programs",
+            "External consultant and vendor contracts",
+            "Insurance coverage optimization"
+        ],
+        stakeholder_engagement=[
+            "Board and executive leadership briefings",
+            "Employee awareness and training programs",
+            "Customer and client communication strategies",
+            "Regulatory and government liaison activities",
+            "Community and public relations initiatives"
+        ]
+    )
+    
+    if not isinstance(strategy_content, LlmFallbackText):
+        await db.strategy_implementations.insert_one(strategy_impl.dict())
+    return strategy_impl
+
+@api_router.post("/scenarios/{scenario_id}/strategy-implementation", response_model=StrategyImplementation)
+async def generate_strategy_implementation(
+    scenario_id: str,
+    stream: bool = False,
+    run_async: bool = Query(False, alias="async"),
+    current_user: User = Depends(get_current_user)
+):
+    scenario = await db.scenarios.find_one({"id": scenario_id, "user_id": current_user.id})
+    if not scenario:
+        raise HTTPException(status_code=404, detail="Scenario not found")
+    
+    prompt = build_strategy_prompt(scenario, current_user.organization)
+    if stream and not run_async:
+        return stream_llm_artifact(
+            "strategy_implementation", prompt, f"strategy-{scenario_id}",
+            lambda strategy_content: save_strategy_implementation(scenario_id, strategy_content),
+            {"artifact": "strategy_implementation", "scenario_id": scenario_id}
+        )
+    if run_async:
+        return await submit_generation_job("strategy_implementation", scenario_id, current_user, prompt_args={"organization": current_user.organization})
+    
+    try:
+        strategy_content = await send_llm_message("strategy_implementation", prompt, session_id=f"strategy-{scenario_id}")
+        return await save_strategy_implementation(scenario_id, strategy_content)
         
-        action_plan = ActionPlan(
-            scenario_id=scenario_id,
-            immediate_actions=[
-                "Activate crisis management team within 30 minutes",
-                "Establish secure communication channels",
-                "Conduct initial situation assessment",
-                "Alert key stakeholders and authorities",
-                "Implement immediate safety protocols"
-            ],
-            short_term_actions=[
-                "Deploy emergency response resources",
-                "Establish coordination with external agencies",
-                "Begin damage assessment procedures",
-                "Activate business continuity plans",
-                "Implement public communication strategy"
-            ],
-            long_term_actions=[
-                "Conduct comprehensive lessons learned review",
-                "Update crisis management procedures",
-                "Invest in infrastructure improvements",
-                "Enhance training and preparedness programs",
-                "Develop strategic partnerships"
-            ],
-            responsible_parties=[
-                "Crisis Management Team Leader",
-                "Emergency Response Coordinator",
-                "Communications Director",
-                "Operations Manager",
-                "External Relations Manager"
-            ],
-            resource_allocation=[
-                "Emergency response personnel (24/7 coverage)",
-                "Communication systems and backup power",
-                "Emergency supplies and equipment inventory",
-                "Financial reserves for crisis response",
-                "External contractor and vendor agreements"
-            ],
-            priority_level="HIGH"
+    except Exception as e:
+        logging.error(f"Strategy implementation generation error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Strategy implementation failed: {str(e)}")
+
+# Background generation jobs
+JOB_WORKER_COUNT = int(os.environ.get('JOB_WORKERS', '4'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+JOB_RETRY_BASE_DELAY = float(os.environ.get('JOB_RETRY_BASE_DELAY_SECONDS', '2'))
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', '60'))  # Running jobs whose lease lapses are reclaimed
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', '1'))  # Idle workers look for queued jobs and cancel requests this often
+
+class Job(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    kind: str
+    params: Dict = {}
+    status: str = "queued"  # "queued", "running", "completed", "failed", "cancelled"
+    attempts: int = 0
+    max_attempts: int = JOB_MAX_ATTEMPTS
+    result: Optional[Dict] = None
+    error: Optional[str] = None
+    owner: Optional[str] = None  # Queue instance holding the lease while running
+    locked_until: Optional[datetime] = None
+    available_at: Optional[datetime] = None  # Queued retries wait until this time
+    cancel_requested: bool = False  # Set on a running job; its owner cancels the task
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+
+class JobQueue:
+    """Mongo-backed job records processed by a fixed pool of asyncio workers.
+
+    Workers claim the oldest queued job straight from Mongo, so any server process can run any job.
+    A running job is leased to the queue instance running it, and a heartbeat renews the lease, so
+    several processes can share the jobs collection and only reclaim jobs whose owner went away.
+    """
+    
+    def __init__(self, worker_count: int):
+        self.worker_count = worker_count
+        self.owner = str(uuid.uuid4())
+        self.handlers = {}
+        self.wakeup = None
+        self.workers = []
+        self.heartbeat_task = None
+        self.running = {}
+        self.cancel_requested = set()
+    
+    def register(self, kind: str, handler):
+        self.handlers[kind] = handler
+    
+    async def start(self):
+        self.wakeup = asyncio.Event()
+        await self.reclaim_expired()
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(self.worker_count)]
+        self.heartbeat_task = asyncio.create_task(self.heartbeat())
+    
+    async def stop(self):
+        interrupted = list(self.running)
+        tasks = self.workers + ([self.heartbeat_task] if self.heartbeat_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.workers = []
+        self.heartbeat_task = None
+        # Hand interrupted jobs back right away instead of waiting for their leases to lapse
+        await db.jobs.update_many(
+            {"id": {"$in": interrupted}, "owner": self.owner, "status": "running"},
+            {"$set": {"status": "queued", "owner": None, "locked_until": None, "available_at": None}}
+        )
+    
+    def notify(self):
+        """Wake idle workers in this process; other processes find the job on their next poll"""
+        if self.wakeup is not None:
+            self.wakeup.set()
+    
+    async def claim(self) -> Optional[dict]:
+        """Lease the oldest queued job that is due, or None"""
+        now = datetime.now(timezone.utc)
+        return await db.jobs.find_one_and_update(
+            {"status": "queued", "$or": [{"available_at": None}, {"available_at": {"$lte": now}}]},
+            {
+                "$set": {"status": "running", "started_at": now, "owner": self.owner, "locked_until": now + timedelta(seconds=JOB_LEASE_SECONDS)},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+    
+    async def reclaim_expired(self):
+        """Re-queue running jobs whose lease lapsed, e.g. because their process died"""
+        now = datetime.now(timezone.utc)
+        expired = await db.jobs.find(
+            {"status": "running", "$or": [{"locked_until": None}, {"locked_until": {"$lt": now}}]},
+            {"id": 1, "locked_until": 1, "cancel_requested": 1}
+        ).to_list(10000)
+        for job in expired:
+            if job.get("cancel_requested"):
+                update = {"status": "cancelled", "owner": None, "locked_until": None, "completed_at": now}
+            else:
+                update = {"status": "queued", "owner": None, "locked_until": None, "available_at": None}
+            # Conditional on the lease we saw, so only one process reclaims each job
+            reclaimed = await db.jobs.find_one_and_update(
+                {"id": job["id"], "status": "running", "locked_until": job.get("locked_until")},
+                {"$set": update}
+            )
+            if reclaimed:
+                logging.warning(f"Reclaimed job {job['id']} after its lease expired")
+                self.notify()
+    
+    async def heartbeat(self):
+        renewed_at = time.monotonic()
+        while True:
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            try:
+                if self.running:
+                    # Cancel requests may come from any process; the owner cancels its own task
+                    requested = await db.jobs.find(
+                        {"id": {"$in": list(self.running)}, "owner": self.owner, "cancel_requested": True}, {"id": 1}
+                    ).to_list(None)
+                    for job in requested:
+                        self.cancel_local(job["id"])
+                if time.monotonic() - renewed_at >= JOB_LEASE_SECONDS / 3:
+                    renewed_at = time.monotonic()
+                    if self.running:
+                        await db.jobs.update_many(
+                            {"id": {"$in": list(self.running)}, "owner": self.owner, "status": "running"},
+                            {"$set": {"locked_until": datetime.now(timezone.utc) + timedelta(seconds=JOB_LEASE_SECONDS)}}
+                        )
+                    await self.reclaim_expired()
+            except Exception as e:
+                logging.error(f"Job heartbeat error: {str(e)}")
+    
+    async def submit(self, kind: str, user_id: str, params: dict) -> Job:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job = Job(user_id=user_id, kind=kind, params=params)
+        await db.jobs.insert_one(job.dict())
+        self.notify()
+        return job
+    
+    def cancel_local(self, job_id: str):
+        if job_id in self.running and job_id not in self.cancel_requested:
+            self.cancel_requested.add(job_id)
+            self.running[job_id].cancel()
+    
+    async def cancel(self, job_id: str):
+        result = await db.jobs.update_one(
+            {"id": job_id, "status": "queued"},
+            {"$set": {"status": "cancelled", "completed_at": datetime.now(timezone.utc)}}
+        )
+        if not result.modified_count:
+            await db.jobs.update_one({"id": job_id, "status": "running"}, {"$set": {"cancel_requested": True}})
+            self.cancel_local(job_id)
+    
+    async def retry(self, job_id: str) -> bool:
+        result = await db.jobs.update_one(
+            {"id": job_id, "status": {"$in": ["failed", "cancelled"]}},
+            {"$set": {"status": "queued", "attempts": 0, "error": None, "completed_at": None, "available_at": None, "cancel_requested": False}}
+        )
+        if result.modified_count:
+            self.notify()
+        return bool(result.modified_count)
+    
+    async def run_handler(self, job: dict):
+        llm_call_site.set(f"job {job['kind']}")
+        owner = await db.users.find_one({"id": job["user_id"]}, {"organization": 1})
+        llm_tenant.set(owner.get("organization") if owner else None)
+        return await self.handlers[job["kind"]](job)
+    
+    async def worker(self):
+        while True:
+            try:
+                job = await self.claim()
+            except Exception as e:
+                logging.error(f"Job claim error: {str(e)}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup.clear()
+                continue
+            try:
+                await self.process(job)
+            except Exception as e:
+                logging.error(f"Job worker error for {job['id']}: {str(e)}")
+    
+    async def process(self, job: dict):
+        job_id = job["id"]
+        task = asyncio.create_task(self.run_handler(job))
+        self.running[job_id] = task
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if job_id not in self.cancel_requested:
+                raise  # worker shutdown; stop() hands the job back to the queue
+            await self.finish(job_id, "cancelled")
+        except Exception as e:
+            retryable = not (isinstance(e, HTTPException) and e.status_code < 500)
+            if retryable and job["attempts"] < job["max_attempts"]:
+                # Any process picks the job up again once its backoff has passed
+                delay = JOB_RETRY_BASE_DELAY * (2 ** (job["attempts"] - 1))
+                await db.jobs.update_one(
+                    {"id": job_id, "owner": self.owner},
+                    {"$set": {
+                        "status": "queued",
+                        "error": str(e),
+                        "owner": None,
+                        "locked_until": None,
+                        "available_at": datetime.now(timezone.utc) + timedelta(seconds=delay)
+                    }}
+                )
+            else:
+                logging.error(f"Job {job_id} ({job['kind']}) failed: {str(e)}")
+                await self.finish(job_id, "failed", error=str(e))
+        else:
+            await self.finish(job_id, "completed", result=result)
+        finally:
+            self.running.pop(job_id, None)
+            self.cancel_requested.discard(job_id)
+    
+    async def finish(self, job_id: str, status: str, result: Optional[dict] = None, error: Optional[str] = None):
+        # A job reclaimed by another process after this lease lapsed is no longer ours to finish
+        await db.jobs.update_one(
+            {"id": job_id, "owner": self.owner},
+            {"$set": {
+                "status": status,
+                "result": result,
+                "error": error,
+                "locked_until": None,
+                "completed_at": datetime.now(timezone.utc)
+            }}
         )
-        
-        await db.action_plans.insert_one(action_plan.dict())
-        return action_plan
-        
-    except Exception as e:
-        logging.error(f"Action plan generation error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Action plan generation failed: {str(e)}")
 
-# Strategy Implementation endpoint
-@api_router.post("/scenarios/{scenario_id}/strategy-implementation", response_model=StrategyImplementation)
-async def generate_strategy_implementation(scenario_id: str, current_user: User = Depends(get_current_user)):
-    scenario = await db.scenarios.find_one({"id": scenario_id, "user_id": current_user.id})
+job_queue = JobQueue(JOB_WORKER_COUNT)
+
+# Generation kinds that can run as jobs: profile, session prefix, prompt builder, saver
+GENERATION_JOBS = {
+    "simulation": ("simulation", "simulation", build_simulation_prompt, save_simulation_result),
+    "game_book": ("game_book", "gamebook", build_game_book_prompt, save_game_book),
+    "action_plan": ("action_plan", "actionplan", build_action_plan_prompt, save_action_plan),
+    "strategy_implementation": ("strategy_implementation", "strategy", build_strategy_prompt, save_strategy_implementation),
+}
+
+async def run_generation_job(job: dict) -> dict:
+    profile_name, session_prefix, build_prompt, save_artifact = GENERATION_JOBS[job["kind"]]
+    params = job["params"]
+    scenario = await db.scenarios.find_one({"id": params["scenario_id"], "user_id": job["user_id"]})
     if not scenario:
         raise HTTPException(status_code=404, detail="Scenario not found")
     
-    try:
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"strategy-{scenario_id}",
-            system_message="""You are an expert strategic crisis management consultant. Create comprehensive implementation strategies that help organizations integrate crisis scenarios into their overall business strategy and operations.
+    prompt = build_prompt(scenario, **params.get("prompt_args", {}))
+    content = await send_llm_message(profile_name, prompt, session_id=f"{session_prefix}-{scenario['id']}", fallback=False)
+    artifact = await save_artifact(scenario["id"], content)
+    return jsonable_encoder(artifact)
+
+for generation_kind in GENERATION_JOBS:
+    job_queue.register(generation_kind, run_generation_job)
+job_queue.register("simulation_batch", run_simulation_batch_job)
+
+async def submit_generation_job(kind: str, scenario_id: str, current_user: User, prompt_args: Optional[dict] = None) -> JSONResponse:
+    """202 with the job's status URL. Every generation endpoint checks `stream and not run_async` first,
+    so ?async=true wins over ?stream=true."""
+    params = {"scenario_id": scenario_id}
+    if prompt_args:
+        params["prompt_args"] = prompt_args
+    job = await job_queue.submit(kind, current_user.id, params)
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"job_id": job.id, "status": job.status, "status_url": f"/api/jobs/{job.id}"}
+    )
 
-Your role is to:
-1. Develop strategic implementation frameworks
-2. Recommend organizational changes and improvements
-3. Propose policy updates and new procedures
-4. Define training and capability development needs
-5. Estimate budget and resource requirements
-6. Plan stakeholder engagement strategies
+@api_router.get("/jobs", response_model=List[Job])
+async def list_jobs(job_status: Optional[str] = Query(None, alias="status"), current_user: User = Depends(get_current_user)):
+    query = {"user_id": current_user.id}
+    if job_status:
+        query["status"] = job_status
+    jobs = await db.jobs.find(query).sort("created_at", -1).to_list(100)
+    return [Job(**job) for job in jobs]
+
+@api_router.get("/jobs/{job_id}", response_model=Job)
+async def get_job(job_id: str, current_user: User = Depends(get_current_user)):
+    job = await db.jobs.find_one({"id": job_id, "user_id": current_user.id})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return Job(**job)
+
+@api_router.post("/jobs/{job_id}/cancel", response_model=Job)
+async def cancel_job(job_id: str, current_user: User = Depends(get_current_user)):
+    job = await db.jobs.find_one({"id": job_id, "user_id": current_user.id})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] not in ("queued", "running"):
+        raise HTTPException(status_code=409, detail=f"Job is already {job['status']}")
+    
+    await job_queue.cancel(job_id)
+    # A running job is marked cancelled by its worker once the task unwinds
+    for _ in range(50):
+        job = await db.jobs.find_one({"id": job_id})
+        if job["status"] != "running":
+            break
+        await asyncio.sleep(0.05)
+    return Job(**job)
+
+@api_router.post("/jobs/{job_id}/retry", response_model=Job)
+async def retry_job(job_id: str, current_user: User = Depends(get_current_user)):
+    job = await db.jobs.find_one({"id": job_id, "user_id": current_user.id})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not await job_queue.retry(job_id):
+        raise HTTPException(status_code=409, detail=f"Only failed or cancelled jobs can be retried (job is {job['status']})")
+    return Job(**await db.jobs.find_one({"id": job_id}))
+
+# SEPTE sensitivity analysis
+SENSITIVITY_WORKERS = int(os.environ.get('SENSITIVITY_WORKERS', str(os.cpu_count() or 1)))
+SENSITIVITY_SOBOL_SAMPLES = int(os.environ.get('SENSITIVITY_SOBOL_SAMPLES', '32768'))
+SENSITIVITY_MORRIS_TRAJECTORIES = int(os.environ.get('SENSITIVITY_MORRIS_TRAJECTORIES', '200'))
+SENSITIVITY_MORRIS_LEVELS = 4
+SENSITIVITY_SPAN = 20.0  # Percentage points each crisis setting may move either way
+SEPTE_RISK_SMOOTHING = 2.5  # Width in percentage points of the smoothed risk thresholds
+
+class SensitivityIndex(BaseModel):
+    parameter: str
+    morris_mu_star: float  # Mean absolute elementary effect, in risk levels per full parameter range
+    morris_mu: float
+    morris_sigma: float  # Non-linearity and interactions
+    sobol_first_order: float
+    sobol_total: float
+
+class SensitivityAnalysis(BaseModel):
+    adjustment_id: str
+    fingerprint: str
+    baseline_risk: float  # Continuous risk level at the adjustment's settings: 0 low to 3 critical
+    risk_level: str
+    parameters: List[SensitivityIndex]  # Most influential first
+    parameter_ranges: Dict[str, List[float]]
+    sobol_samples: int
+    morris_trajectories: int
+    evaluations: int
+    workers: int
+    runtime_ms: float
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
-Provide strategic guidance that transforms crisis scenarios into organizational resilience capabilities."""
-        ).with_model("anthropic", "claude-3-7-sonnet-20250219")
-        
-        prompt = f"""
-Create a Strategic Implementation Plan for integrating this crisis scenario into organizational strategy:
+def septe_risk(crisis: np.ndarray) -> np.ndarray:
+    """Continuous risk level for rows of the five crisis percentages.
+
+    Each threshold of generate_scenario_analysis becomes a logistic step, so the level runs smoothly
+    from 0 (low) to 3 (critical) and matches the discrete levels away from the thresholds.
+    """
+    average = crisis.mean(axis=1)
+    return sum(1.0 / (1.0 + np.exp(-(average - threshold) / SEPTE_RISK_SMOOTHING)) for threshold in SEPTE_RISK_THRESHOLDS)
+
+def sobol_partial_sums(lows: np.ndarray, highs: np.ndarray, rows: int, seed: np.random.SeedSequence) -> np.ndarray:
+    """Saltelli sums over one worker's share of the sample, so only k+2 numbers per estimator cross processes.
+
+    Returns rows, sum f, sum f^2, then per parameter the Saltelli (2010) first-order sum of
+    f(B) * (f(AB_i) - f(A)) and the Jansen total-effect sum of (f(A) - f(AB_i))^2.
+    """
+    rng = np.random.default_rng(seed)
+    count = len(lows)
+    sample_a = lows + latin_hypercube(rng, rows, count) * (highs - lows)
+    sample_b = lows + latin_hypercube(rng, rows, count) * (highs - lows)
+    risk_a, risk_b = septe_risk(sample_a), septe_risk(sample_b)
+    
+    first_order, total = np.empty(count), np.empty(count)
+    for column in range(count):
+        mixed = sample_a.copy()
+        mixed[:, column] = sample_b[:, column]
+        risk_mixed = septe_risk(mixed)
+        first_order[column] = (risk_b * (risk_mixed - risk_a)).sum()
+        total[column] = ((risk_a - risk_mixed) ** 2).sum()
+    
+    combined = np.concatenate([risk_a, risk_b])
+    return np.concatenate([[rows, combined.sum(), (combined ** 2).sum()], first_order, total])
+
+def morris_elementary_effects(lows: np.ndarray, highs: np.ndarray, trajectories: int, seed: np.random.SeedSequence) -> np.ndarray:
+    """(trajectories, parameters) elementary effects from one-at-a-time trajectories on a Morris grid"""
+    rng = np.random.default_rng(seed)
+    count = len(lows)
+    levels = SENSITIVITY_MORRIS_LEVELS
+    delta = levels / (2 * (levels - 1))
+    
+    # Start in the lower half of the grid; a downward step starts delta higher instead
+    start = rng.integers(0, levels // 2, size=(trajectories, count)) / (levels - 1)
+    direction = rng.choice([-1.0, 1.0], size=(trajectories, count))
+    start = np.where(direction < 0, start + delta, start)
+    order = np.argsort(rng.random((trajectories, count)), axis=1)
+    rank = np.argsort(order, axis=1)
+    moved = rank[:, None, :] < np.arange(count + 1)[None, :, None]
+    points = start[:, None, :] + moved * direction[:, None, :] * delta
+    
+    risk = septe_risk((lows + points * (highs - lows)).reshape(-1, count)).reshape(trajectories, count + 1)
+    effects = np.empty((trajectories, count))
+    np.put_along_axis(effects, order, np.diff(risk, axis=1), axis=1)
+    return effects * direction / delta
+
+sensitivity_pool: Optional[ProcessPoolExecutor] = None
+
+def get_sensitivity_pool() -> ProcessPoolExecutor:
+    global sensitivity_pool
+    if sensitivity_pool is None:
+        # Never fork the running server: its Mongo monitor and to_thread workers may hold locks the
+        # child would inherit. Workers start from a clean interpreter and import the module-level functions.
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        sensitivity_pool = ProcessPoolExecutor(max_workers=SENSITIVITY_WORKERS, mp_context=multiprocessing.get_context(start_method))
+    return sensitivity_pool
+
+def sensitivity_fingerprint(adjustment: dict, samples: int, trajectories: int) -> str:
+    """Changes whenever the adjustment's crisis settings or the sample sizes do"""
+    payload = json.dumps([adjustment["id"], samples, trajectories, SENSITIVITY_SPAN] + [adjustment[field] for field in SEPTE_CRISIS_FIELDS])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+async def run_sensitivity_analysis(adjustment: dict, samples: int, trajectories: int) -> SensitivityAnalysis:
+    """Morris screening and Sobol indices of the SEPTE risk level around an adjustment's settings.
+
+    Each worker process generates and evaluates its own share of both samples from an independent
+    seed, so the work splits evenly across SENSITIVITY_WORKERS with no large arrays to transfer.
+    """
+    started = time.perf_counter()
+    fingerprint = sensitivity_fingerprint(adjustment, samples, trajectories)
+    baseline = np.array([float(adjustment[field]) for field in SEPTE_CRISIS_FIELDS])
+    lows = np.clip(baseline - SENSITIVITY_SPAN, 0.0, 100.0)
+    highs = np.clip(baseline + SENSITIVITY_SPAN, 0.0, 100.0)
+    
+    workers = SENSITIVITY_WORKERS
+    seeds = np.random.SeedSequence(int(fingerprint[:16], 16)).spawn(2 * workers)
+    sample_shares = np.diff(np.linspace(0, samples, workers + 1).astype(int))
+    trajectory_shares = np.diff(np.linspace(0, trajectories, workers + 1).astype(int))
+    
+    loop = asyncio.get_running_loop()
+    pool = get_sensitivity_pool()
+    sobol_tasks = [
+        loop.run_in_executor(pool, sobol_partial_sums, lows, highs, int(rows), seed)
+        for rows, seed in zip(sample_shares, seeds[:workers]) if rows
+    ]
+    morris_tasks = [
+        loop.run_in_executor(pool, morris_elementary_effects, lows, highs, int(share), seed)
+        for share, seed in zip(trajectory_shares, seeds[workers:]) if share
+    ]
+    partial_sums = await asyncio.gather(*sobol_tasks)
+    effects = np.concatenate(await asyncio.gather(*morris_tasks))
+    
+    count = len(SEPTE_CRISIS_FIELDS)
+    sums = np.sum(partial_sums, axis=0)
+    rows = sums[0]
+    mean = sums[1] / (2 * rows)
+    variance = sums[2] / (2 * rows) - mean ** 2
+    if variance <= 1e-12:
+        # Flat risk across the whole range: no parameter moves it
+        first_order = total = np.zeros(count)
+    else:
+        first_order = sums[3:3 + count] / rows / variance
+        total = sums[3 + count:] / (2 * rows) / variance
+    
+    indices = [
+        SensitivityIndex(
+            parameter=field,
+            morris_mu_star=round(float(np.abs(effects[:, column]).mean()), 4),
+            morris_mu=round(float(effects[:, column].mean()), 4),
+            morris_sigma=round(float(effects[:, column].std()), 4),
+            sobol_first_order=round(float(first_order[column]), 4),
+            sobol_total=round(float(total[column]), 4)
+        )
+        for column, field in enumerate(SEPTE_CRISIS_FIELDS)
+    ]
+    baseline_risk = float(septe_risk(baseline[None])[0])
+    return SensitivityAnalysis(
+        adjustment_id=adjustment["id"],
+        fingerprint=fingerprint,
+        baseline_risk=round(baseline_risk, 4),
+        risk_level=SEPTE_RISK_LEVELS[sum(baseline.mean() >= threshold for threshold in SEPTE_RISK_THRESHOLDS)],
+        parameters=sorted(indices, key=lambda index: (index.sobol_total, index.morris_mu_star), reverse=True),
+        parameter_ranges={field: [float(low), float(high)] for field, low, high in zip(SEPTE_CRISIS_FIELDS, lows, highs)},
+        sobol_samples=samples,
+        morris_trajectories=trajectories,
+        evaluations=samples * (count + 2) + trajectories * (count + 1),
+        workers=workers,
+        runtime_ms=round((time.perf_counter() - started) * 1000, 2)
+    )
 
-Scenario: {scenario['title']}
-Type: {scenario['crisis_type']}
-Description: {scenario['description']}
-Severity: {scenario['severity_level']}/10
-Organization: {current_user.organization}
-Regions: {', '.join(scenario['affected_regions'])}
-Variables: {', '.join(scenario['key_variables'])}
+async def run_sensitivity_job(job: dict) -> dict:
+    params = job["params"]
+    adjustment = await db.scenario_adjustments.find_one({"id": params["adjustment_id"], "company_id": params["company_id"]})
+    if not adjustment:
+        raise HTTPException(status_code=404, detail="Scenario adjustment not found")
+    
+    analysis = await run_sensitivity_analysis(adjustment, params["samples"], params["trajectories"])
+    # One cached analysis per adjustment, replaced when its settings change
+    await db.sensitivity_analyses.replace_one({"adjustment_id": analysis.adjustment_id}, analysis.dict(), upsert=True)
+    return jsonable_encoder(analysis)
 
-Develop a comprehensive strategy covering:
-1. Overall implementation approach and methodology
-2. Required organizational changes and restructuring
-3. Policy recommendations and procedure updates  
-4. Training requirements and capability development
-5. Budget considerations and investment priorities
-6. Stakeholder engagement and communication strategies
+job_queue.register("septe_sensitivity", run_sensitivity_job)
 
-Focus on building long-term organizational resilience and crisis preparedness capabilities.
-"""
-        
-        user_message = UserMessage(text=prompt)
-        strategy_content = await chat.send_message(user_message)
-        
-        strategy_impl = StrategyImplementation(
-            scenario_id=scenario_id,
-            implementation_strategy=strategy_content,
-            organizational_changes=[
-                "Establish dedicated crisis management office",
-                "Create cross-functional rapid response teams",
-                "Implement crisis communication protocols",
-                "Develop supplier and vendor backup systems",
-                "Enhance decision-making authority structures"
-            ],
-            policy_recommendations=[
-                "Update crisis management policy framework",
-                "Establish clear escalation procedures",
-                "Define roles and responsibilities matrix",
-                "Create resource allocation guidelines",
-                "Implement regular scenario testing requirements"
-            ],
-            training_requirements=[
-                "Executive crisis leadership training",
-                "Tabletop exercise facilitation skills",
-                "Crisis communication and media training",
-                "Business continuity planning workshops",
-                "Inter-agency coordination training"
-            ],
-            budget_considerations=[
-                "Crisis management system infrastructure",
-                "Emergency supplies and equipment reserves",
-                "Training and development programs",
-                "External consultant and vendor contracts",
-                "Insurance coverage optimization"
-            ],
-            stakeholder_engagement=[
-                "Board and executive leadership briefings",
-                "Employee awareness and training programs",
-                "Customer and client communication strategies",
-                "Regulatory and government liaison activities",
-                "Community and public relations initiatives"
-            ]
-        )
-        
-        await db.strategy_implementations.insert_one(strategy_impl.dict())
-        return strategy_impl
-        
-    except Exception as e:
-        logging.error(f"Strategy implementation generation error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Strategy implementation failed: {str(e)}")
+async def find_company_adjustment(company_id: str, adjustment_id: str, current_user: User) -> dict:
+    if current_user.company_id != company_id:
+        company = await db.companies.find_one({"id": company_id, "created_by": current_user.id})
+        if not company:
+            raise HTTPException(status_code=403, detail="Access denied")
+    
+    adjustment = await db.scenario_adjustments.find_one({"id": adjustment_id, "company_id": company_id})
+    if not adjustment:
+        raise HTTPException(status_code=404, detail="Scenario adjustment not found")
+    return adjustment
+
+@api_router.post("/companies/{company_id}/scenario-adjustments/{adjustment_id}/sensitivity")
+async def analyze_adjustment_sensitivity(
+    company_id: str,
+    adjustment_id: str,
+    samples: int = SENSITIVITY_SOBOL_SAMPLES,
+    trajectories: int = SENSITIVITY_MORRIS_TRAJECTORIES,
+    current_user: User = Depends(get_current_user)
+):
+    """Which SEPTE settings drive the adjustment's risk level. Returns the cached analysis when the
+    settings are unchanged, otherwise accepts a sensitivity job."""
+    adjustment = await find_company_adjustment(company_id, adjustment_id, current_user)
+    if not 256 <= samples <= 1048576 or not 10 <= trajectories <= 10000:
+        raise HTTPException(status_code=400, detail="samples must be between 256 and 1048576, trajectories between 10 and 10000")
+    
+    cached = await db.sensitivity_analyses.find_one({
+        "adjustment_id": adjustment_id,
+        "fingerprint": sensitivity_fingerprint(adjustment, samples, trajectories)
+    })
+    if cached:
+        return SensitivityAnalysis(**cached)
+    
+    job = await job_queue.submit("septe_sensitivity", current_user.id, {
+        "company_id": company_id, "adjustment_id": adjustment_id, "samples": samples, "trajectories": trajectories
+    })
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"job_id": job.id, "status": job.status, "status_url": f"/api/jobs/{job.id}"}
+    )
+
+@api_router.get("/companies/{company_id}/scenario-adjustments/{adjustment_id}/sensitivity", response_model=SensitivityAnalysis)
+async def get_adjustment_sensitivity(company_id: str, adjustment_id: str, current_user: User = Depends(get_current_user)):
+    """Most recent sensitivity analysis of the adjustment, which may predate its current settings"""
+    await find_company_adjustment(company_id, adjustment_id, current_user)
+    analysis = await db.sensitivity_analyses.find_one({"adjustment_id": adjustment_id})
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Sensitivity analysis not found")
+    return SensitivityAnalysis(**analysis)
 
 # Get implementation artifacts
 @api_router.get("/scenarios/{scenario_id}/game-book")
@@ -1797,112 +4848,123 @@ async def get_strategy_implementation(scenario_id: str, current_user: User = Dep
     return StrategyImplementation(**strategy_impl)
 
 # AI Monitor Agents endpoints
+async def save_monitor_agents(scenario_id: str) -> List[MonitorAgent]:
+    """Create and store the standard set of monitor agents for a scenario"""
+    # Create multiple AI monitor agents for comprehensive monitoring
+    agents = []
+    
+    # Risk Monitor Agent
+    risk_agent = MonitorAgent(
+        scenario_id=scenario_id,
+        agent_type="risk_monitor",
+        monitoring_parameters=[
+            "Crisis escalation patterns",
+            "Resource depletion rates", 
+            "System vulnerability indicators",
+            "External threat emergence"
+        ],
+        insights_generated=[
+            "Risk level trending upward in economic sector",
+            "Early warning: Supply chain vulnerabilities detected",
+            "Potential cascade effects identified in infrastructure"
+        ],
+        anomalies_detected=[
+            "Unusual resource consumption pattern detected",
+            "Unexpected correlation between economic and social factors"
+        ],
+        risk_level="medium"
+    )
+    
+    # Performance Tracker Agent
+    performance_agent = MonitorAgent(
+        scenario_id=scenario_id,
+        agent_type="performance_tracker",
+        monitoring_parameters=[
+            "Intervention effectiveness",
+            "Response time metrics",
+            "Resource utilization efficiency",
+            "Stakeholder satisfaction"
+        ],
+        insights_generated=[
+            "Communication protocols showing 85% effectiveness",
+            "Resource allocation optimized for current conditions",
+            "Stakeholder engagement levels within acceptable range"
+        ],
+        anomalies_detected=[
+            "Response time variance higher than expected"
+        ],
+        risk_level="low"
+    )
+    
+    # Anomaly Detector Agent
+    anomaly_agent = MonitorAgent(
+        scenario_id=scenario_id,
+        agent_type="anomaly_detector",
+        monitoring_parameters=[
+            "Unexpected system behaviors",
+            "Statistical outliers in crisis patterns",
+            "Deviation from predicted outcomes",
+            "Emerging crisis interactions"
+        ],
+        insights_generated=[
+            "Anomaly detected: Unusual correlation between social and economic factors",
+            "Pattern deviation: Crisis progression faster than predicted"
+        ],
+        anomalies_detected=[
+            "Social media sentiment shift 300% above normal variance",
+            "Cross-sector impact acceleration detected"
+        ],
+        risk_level="high"
+    )
+    
+    # Trend Analyzer Agent
+    trend_agent = MonitorAgent(
+        scenario_id=scenario_id,
+        agent_type="trend_analyzer",
+        monitoring_parameters=[
+            "Long-term crisis evolution patterns",
+            "Systemic trend identification",
+            "Predictive modeling accuracy",
+            "Adaptation trend analysis"
+        ],
+        insights_generated=[
+            "Trend analysis: System showing increased adaptive capacity",
+            "Long-term pattern: Resilience building in key sectors",
+            "Predictive accuracy improving with system learning"
+        ],
+        anomalies_detected=[
+            "Unexpected trend reversal in adaptation patterns"
+        ],
+        risk_level="low"
+    )
+    
+    agents = [risk_agent, performance_agent, anomaly_agent, trend_agent]
+    
+    # Store all agents in database
+    for agent in agents:
+        await db.monitor_agents.insert_one(agent.dict())
+    
+    return agents
+
 @api_router.post("/scenarios/{scenario_id}/deploy-monitors", response_model=List[MonitorAgent])
-async def deploy_monitor_agents(scenario_id: str, current_user: User = Depends(get_current_user)):
+async def deploy_monitor_agents(
+    scenario_id: str,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
     scenario = await db.scenarios.find_one({"id": scenario_id, "user_id": current_user.id})
     if not scenario:
         raise HTTPException(status_code=404, detail="Scenario not found")
     
-    try:
-        # Create multiple AI monitor agents for comprehensive monitoring
-        agents = []
-        
-        # Risk Monitor Agent
-        risk_agent = MonitorAgent(
-            scenario_id=scenario_id,
-            agent_type="risk_monitor",
-            monitoring_parameters=[
-                "Crisis escalation patterns",
-                "Resource depletion rates", 
-                "System vulnerability indicators",
-                "External threat emergence"
-            ],
-            insights_generated=[
-                "Risk level trending upward in economic sector",
-                "Early warning: Supply chain vulnerabilities detected",
-                "Potential cascade effects identified in infrastructure"
-            ],
-            anomalies_detected=[
-                "Unusual resource consumption pattern detected",
-                "Unexpected correlation between economic and social factors"
-            ],
-            risk_level="medium"
-        )
-        
-        # Performance Tracker Agent
-        performance_agent = MonitorAgent(
-            scenario_id=scenario_id,
-            agent_type="performance_tracker",
-            monitoring_parameters=[
-                "Intervention effectiveness",
-                "Response time metrics",
-                "Resource utilization efficiency",
-                "Stakeholder satisfaction"
-            ],
-            insights_generated=[
-                "Communication protocols showing 85% effectiveness",
-                "Resource allocation optimized for current conditions",
-                "Stakeholder engagement levels within acceptable range"
-            ],
-            anomalies_detected=[
-                "Response time variance higher than expected"
-            ],
-            risk_level="low"
-        )
-        
-        # Anomaly Detector Agent
-        anomaly_agent = MonitorAgent(
-            scenario_id=scenario_id,
-            agent_type="anomaly_detector",
-            monitoring_parameters=[
-                "Unexpected system behaviors",
-                "Statistical outliers in crisis patterns",
-                "Deviation from predicted outcomes",
-                "Emerging crisis interactions"
-            ],
-            insights_generated=[
-                "Anomaly detected: Unusual correlation between social and economic factors",
-                "Pattern deviation: Crisis progression faster than predicted"
-            ],
-            anomalies_detected=[
-                "Social media sentiment shift 300% above normal variance",
-                "Cross-sector impact acceleration detected"
-            ],
-            risk_level="high"
-        )
-        
-        # Trend Analyzer Agent
-        trend_agent = MonitorAgent(
-            scenario_id=scenario_id,
-            agent_type="trend_analyzer",
-            monitoring_parameters=[
-                "Long-term crisis evolution patterns",
-                "Systemic trend identification",
-                "Predictive modeling accuracy",
-                "Adaptation trend analysis"
-            ],
-            insights_generated=[
-                "Trend analysis: System showing increased adaptive capacity",
-                "Long-term pattern: Resilience building in key sectors",
-                "Predictive accuracy improving with system learning"
-            ],
-            anomalies_detected=[
-                "Unexpected trend reversal in adaptation patterns"
-            ],
-            risk_level="low"
-        )
-        
-        agents = [risk_agent, performance_agent, anomaly_agent, trend_agent]
-        
-        # Store all agents in database
-        for agent in agents:
-            await db.monitor_agents.insert_one(agent.dict())
-        
-        return agents
-        
-    except Exception as e:
-        logging.error(f"Monitor agent deployment error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to deploy monitor agents: {str(e)}")
+    async def deploy():
+        try:
+            return await save_monitor_agents(scenario_id)
+        except Exception as e:
+            logging.error(f"Monitor agent deployment error: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Failed to deploy monitor agents: {str(e)}")
+    
+    return await idempotency_store.run(idempotency_key, current_user.id, request, deploy)
 
 @api_router.get("/scenarios/{scenario_id}/monitor-agents", response_model=List[MonitorAgent])
 async def get_monitor_agents(scenario_id: str, current_user: User = Depends(get_current_user)):
@@ -1915,29 +4977,8 @@ async def get_monitor_agents(scenario_id: str, current_user: User = Depends(get_
     return [MonitorAgent(**agent) for agent in agents]
 
 # Complex Adaptive Systems Modeling
-@api_router.post("/scenarios/{scenario_id}/complex-systems-analysis", response_model=ComplexAdaptiveSystem)
-async def analyze_complex_adaptive_system(scenario_id: str, current_user: User = Depends(get_current_user)):
-    scenario = await db.scenarios.find_one({"id": scenario_id, "user_id": current_user.id})
-    if not scenario:
-        raise HTTPException(status_code=404, detail="Scenario not found")
-    
-    try:
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"complex-system-{scenario_id}",
-            system_message="""You are an expert in complex adaptive systems analysis, specializing in polycrisis scenarios. 
-
-Your role is to:
-1. Identify system components and their interconnections
-2. Map feedback loops and emergent behaviors
-3. Analyze adaptation mechanisms and tipping points
-4. Model system dynamics and non-linear interactions
-5. Predict cascading effects and system evolution
-
-Provide detailed analysis of how multiple crisis systems interact, adapt, and evolve in complex, non-linear ways."""
-        ).with_model("anthropic", "claude-3-7-sonnet-20250219")
-        
-        prompt = f"""
+def build_complex_systems_prompt(scenario: dict) -> str:
+    return f"""
 Analyze this crisis scenario as a Complex Adaptive System:
 
 Scenario: {scenario['title']}
@@ -1958,9 +4999,19 @@ Provide comprehensive complex adaptive systems analysis including:
 
 Focus on non-linear interactions, cascading effects, and adaptive behaviors.
 """
+
+@api_router.post("/scenarios/{scenario_id}/complex-systems-analysis", response_model=ComplexAdaptiveSystem)
+async def analyze_complex_adaptive_system(scenario_id: str, request: Request, current_user: User = Depends(get_current_user)):
+    scenario = await db.scenarios.find_one({"id": scenario_id, "user_id": current_user.id})
+    if not scenario:
+        raise HTTPException(status_code=404, detail="Scenario not found")
+    
+    try:
+        prompt = build_complex_systems_prompt(scenario)
         
-        user_message = UserMessage(text=prompt)
-        system_analysis = await chat.send_message(user_message)
+        system_analysis = await run_until_disconnected(
+            request, send_llm_message("complex_systems", prompt, session_id=f"complex-system-{scenario_id}")
+        )
         
         complex_system = ComplexAdaptiveSystem(
             scenario_id=scenario_id,
@@ -2007,13 +5058,131 @@ Focus on non-linear interactions, cascading effects, and adaptive behaviors.
             system_dynamics=system_analysis
         )
         
-        await db.complex_adaptive_systems.insert_one(complex_system.dict())
+        if not isinstance(system_analysis, LlmFallbackText):
+            await db.complex_adaptive_systems.insert_one(complex_system.dict())
         return complex_system
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Complex systems analysis error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Complex systems analysis failed: {str(e)}")
 
+# Speculative artifact prefetch
+SCENARIO_PREFETCH_ENABLED = os.environ.get('SCENARIO_PREFETCH_ENABLED', 'false').lower() == 'true'
+SCENARIO_PREFETCH_LOAD_THRESHOLD = float(os.environ.get('SCENARIO_PREFETCH_LOAD_THRESHOLD', '0.25'))  # Fraction of the model's adaptive limit
+SCENARIO_PREFETCH_CHECK_SECONDS = float(os.environ.get('SCENARIO_PREFETCH_CHECK_SECONDS', '0.5'))
+SCENARIO_PREFETCH_MAX_PENDING = 100
+
+# What users typically request after creating or amending a scenario, in order
+SCENARIO_PREFETCH_ARTIFACTS = [
+    ("simulation", build_simulation_prompt),
+    ("game_book", build_game_book_prompt),
+    ("action_plan", build_action_plan_prompt),
+    ("complex_systems", build_complex_systems_prompt)
+]
+
+class ScenarioPrefetcher:
+    """Warms the response cache with a new or amended scenario's likely next artifacts. Runs one call at a
+    time while foreground model load is below the threshold and is cancelled as soon as load rises."""
+    
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.pending: "OrderedDict[str, Optional[str]]" = OrderedDict()  # scenario_id -> tenant
+        self.wakeup = None
+        self.runner = None
+        self.counters = {"queued": 0, "generated": 0, "already_cached": 0, "preempted": 0, "failed": 0, "dropped": 0}
+    
+    def start(self):
+        if self.enabled:
+            self.wakeup = asyncio.Event()
+            self.runner = asyncio.ensure_future(self.run())
+    
+    async def stop(self):
+        if self.runner is not None:
+            self.runner.cancel()
+            await asyncio.gather(self.runner, return_exceptions=True)
+            self.runner = None
+    
+    def enqueue(self, scenario_id: str, tenant: Optional[str]):
+        if self.runner is None:
+            return
+        self.pending.pop(scenario_id, None)
+        self.pending[scenario_id] = tenant
+        self.counters["queued"] += 1
+        while len(self.pending) > SCENARIO_PREFETCH_MAX_PENDING:
+            self.pending.popitem(last=False)
+            self.counters["dropped"] += 1
+        self.wakeup.set()
+    
+    def busy(self, model: str) -> bool:
+        guard = get_llm_model_guard(model)
+        return guard.state != "closed" or guard.foreground_demand >= max(1.0, SCENARIO_PREFETCH_LOAD_THRESHOLD * guard.limit)
+    
+    async def run(self):
+        llm_call_site.set("prefetch")
+        llm_speculative.set(True)  # Also schedules every prefetch call in the batch class
+        while True:
+            if not self.pending:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            scenario_id, tenant = self.pending.popitem(last=False)
+            try:
+                await self.prefetch(scenario_id, tenant)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.counters["failed"] += 1
+                logging.warning(f"Prefetch for scenario {scenario_id} failed: {str(e)}")
+    
+    async def prefetch(self, scenario_id: str, tenant: Optional[str]):
+        llm_tenant.set(tenant)
+        scenario = await db.scenarios.find_one({"id": scenario_id})
+        if not scenario:
+            return
+        
+        for profile_name, build_prompt in SCENARIO_PREFETCH_ARTIFACTS:
+            if scenario_id in self.pending:
+                return  # Amended again meanwhile; the newer version is queued
+            prompt = build_prompt(scenario)
+            profile = llm_router.resolve(profile_name)
+            if await llm_response_cache.contains(LlmResponseCache.make_key(profile.model, profile.system_message, prompt_text(prompt))):
+                self.counters["already_cached"] += 1
+                continue
+            
+            while self.busy(profile.model):
+                await asyncio.sleep(SCENARIO_PREFETCH_CHECK_SECONDS)
+            call = asyncio.ensure_future(send_llm_message(
+                profile_name, prompt, session_id=f"prefetch-{profile_name}-{scenario_id}", use_cache=True, fallback=False
+            ))
+            while True:
+                done, _ = await asyncio.wait({call}, timeout=SCENARIO_PREFETCH_CHECK_SECONDS)
+                if done:
+                    break
+                if self.busy(profile.model):
+                    call.cancel()
+                    await asyncio.gather(call, return_exceptions=True)
+                    self.counters["preempted"] += 1
+                    # Resume with the first uncached artifact once load drops, ahead of newer scenarios
+                    if scenario_id not in self.pending:
+                        self.pending[scenario_id] = tenant
+                        self.pending.move_to_end(scenario_id, last=False)
+                    return
+            call.result()
+            self.counters["generated"] += 1
+    
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "running": self.runner is not None,
+            "pending_scenarios": len(self.pending),
+            "load_threshold": SCENARIO_PREFETCH_LOAD_THRESHOLD,
+            **self.counters
+        }
+
+scenario_prefetcher = ScenarioPrefetcher(SCENARIO_PREFETCH_ENABLED)
+
 # Advanced Analytics and Metrics
 @api_router.post("/scenarios/{scenario_id}/generate-metrics", response_model=SystemMetrics)
 async def generate_system_metrics(scenario_id: str, current_user: User = Depends(get_current_user)):
@@ -2043,36 +5212,18 @@ async def generate_system_metrics(scenario_id: str, current_user: User = Depends
     return metrics
 
 # Adaptive Learning System
-@api_router.post("/scenarios/{scenario_id}/generate-learning-insights", response_model=List[LearningInsight])
-async def generate_learning_insights(scenario_id: str, current_user: User = Depends(get_current_user)):
-    scenario = await db.scenarios.find_one({"id": scenario_id, "user_id": current_user.id})
-    if not scenario:
-        raise HTTPException(status_code=404, detail="Scenario not found")
+async def save_learning_insights(scenario: dict, current_user: User) -> List[LearningInsight]:
+    """Generate and store learning insights for a scenario, using the user's recent scenarios as context"""
+    scenario_id = scenario["id"]
     
-    try:
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"learning-{scenario_id}",
-            system_message="""You are an adaptive learning AI that analyzes crisis management patterns and generates personalized insights for improved decision-making.
-
-Your role is to:
-1. Identify patterns from scenario interactions
-2. Predict optimal outcomes based on past data
-3. Suggest system optimizations and improvements
-4. Provide personalized recommendations for enhancement
-5. Generate actionable learning insights
-
-Focus on continuous improvement and adaptive learning from crisis management experiences."""
-        ).with_model("anthropic", "claude-3-7-sonnet-20250219")
-        
-        # Get user's previous scenarios for learning context
-        user_scenarios = await db.scenarios.find({"user_id": current_user.id}).to_list(10)
-        
-        context = f"User has created {len(user_scenarios)} scenarios. "
-        if len(user_scenarios) > 1:
-            context += f"Previous scenario types: {', '.join([s['crisis_type'] for s in user_scenarios[-3:]])}"
-        
-        prompt = f"""
+    # Get user's previous scenarios for learning context
+    user_scenarios = await db.scenarios.find({"user_id": current_user.id}).to_list(10)
+    
+    context = f"User has created {len(user_scenarios)} scenarios. "
+    if len(user_scenarios) > 1:
+        context += f"Previous scenario types: {', '.join([s['crisis_type'] for s in user_scenarios[-3:]])}"
+    
+    prompt = f"""
 Generate adaptive learning insights for this user and scenario:
 
 Current Scenario: {scenario['title']} ({scenario['crisis_type']})
@@ -2086,44 +5237,59 @@ Based on this scenario and user patterns, generate 3 different types of learning
 
 Each insight should be actionable and personalized for this user's crisis management approach.
 """
-        
-        user_message = UserMessage(text=prompt)
-        insights_content = await chat.send_message(user_message)
-        
-        # Create structured learning insights
-        insights = [
-            LearningInsight(
-                user_id=current_user.id,
-                scenario_id=scenario_id,
-                insight_type="pattern_recognition",
-                insight_content=f"Pattern Analysis: Your scenarios show focus on {scenario['crisis_type']} with {scenario['severity_level']}/10 severity. Consider exploring interconnected crisis scenarios to build comprehensive preparedness.",
-                confidence_score=0.85
-            ),
-            LearningInsight(
-                user_id=current_user.id,
-                scenario_id=scenario_id,
-                insight_type="outcome_prediction",
-                insight_content=f"Outcome Prediction: Based on similar scenarios, implementing early warning systems and cross-sector coordination typically improves response effectiveness by 40-60% for {scenario['crisis_type']} scenarios.",
-                confidence_score=0.78
-            ),
-            LearningInsight(
-                user_id=current_user.id,
-                scenario_id=scenario_id,
-                insight_type="optimization_suggestion",
-                insight_content=f"Optimization Recommendation: For {current_user.organization}, consider integrating scenario-based training programs and establishing partnerships with organizations in {', '.join(scenario['affected_regions'])} for enhanced preparedness.",
-                confidence_score=0.92
-            )
-        ]
-        
-        # Store insights in database
-        for insight in insights:
-            await db.learning_insights.insert_one(insight.dict())
-        
-        return insights
-        
-    except Exception as e:
-        logging.error(f"Learning insights generation error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Learning insights generation failed: {str(e)}")
+    
+    insights_content = await send_llm_message_with_retry("learning_insights", prompt, session_id=f"learning-{scenario_id}")
+    
+    # Create structured learning insights
+    insights = [
+        LearningInsight(
+            user_id=current_user.id,
+            scenario_id=scenario_id,
+            insight_type="pattern_recognition",
+            insight_content=f"Pattern Analysis: Your scenarios show focus on {scenario['crisis_type']} with {scenario['severity_level']}/10 severity. Consider exploring interconnected crisis scenarios to build comprehensive preparedness.",
+            confidence_score=0.85
+        ),
+        LearningInsight(
+            user_id=current_user.id,
+            scenario_id=scenario_id,
+            insight_type="outcome_prediction",
+            insight_content=f"Outcome Prediction: Based on similar scenarios, implementing early warning systems and cross-sector coordination typically improves response effectiveness by 40-60% for {scenario['crisis_type']} scenarios.",
+            confidence_score=0.78
+        ),
+        LearningInsight(
+            user_id=current_user.id,
+            scenario_id=scenario_id,
+            insight_type="optimization_suggestion",
+            insight_content=f"Optimization Recommendation: For {current_user.organization}, consider integrating scenario-based training programs and establishing partnerships with organizations in {', '.join(scenario['affected_regions'])} for enhanced preparedness.",
+            confidence_score=0.92
+        )
+    ]
+    
+    # Store insights in database
+    for insight in insights:
+        await db.learning_insights.insert_one(insight.dict())
+    
+    return insights
+
+@api_router.post("/scenarios/{scenario_id}/generate-learning-insights", response_model=List[LearningInsight])
+async def generate_learning_insights(
+    scenario_id: str,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user)
+):
+    scenario = await db.scenarios.find_one({"id": scenario_id, "user_id": current_user.id})
+    if not scenario:
+        raise HTTPException(status_code=404, detail="Scenario not found")
+    
+    async def generate():
+        try:
+            return await save_learning_insights(scenario, current_user)
+        except Exception as e:
+            logging.error(f"Learning insights generation error: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Learning insights generation failed: {str(e)}")
+    
+    return await idempotency_store.run(idempotency_key, current_user.id, request, generate)
 
 @api_router.get("/dashboard/advanced-analytics")
 async def get_advanced_analytics(current_user: User = Depends(get_current_user)):
@@ -2167,21 +5333,6 @@ async def suggest_monitoring_sources(scenario_id: str, current_user: User = Depe
         raise HTTPException(status_code=404, detail="Scenario not found")
     
     try:
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"monitoring-suggestions-{scenario_id}",
-            system_message="""You are an expert monitoring and intelligence gathering system. Based on crisis scenarios, suggest the most relevant data sources, APIs, and monitoring targets.
-
-Your role is to:
-1. Analyze crisis scenarios and identify critical information sources
-2. Suggest specific APIs, websites, and data feeds to monitor
-3. Recommend keywords and search terms for effective monitoring
-4. Prioritize sources based on relevance and reliability
-5. Consider real-time vs periodic monitoring needs
-
-Provide practical, actionable monitoring suggestions that teams can implement immediately."""
-        ).with_model("anthropic", "claude-3-7-sonnet-20250219")
-        
         prompt = f"""
 Analyze this crisis scenario and suggest intelligent monitoring sources:
 
@@ -2200,8 +5351,7 @@ Generate specific monitoring source suggestions including:
 Provide 5 high-value monitoring suggestions with detailed reasoning.
 """
         
-        user_message = UserMessage(text=prompt)
-        suggestions_content = await chat.send_message(user_message)
+        suggestions_content = await send_llm_message("monitoring_suggestions", prompt, session_id=f"monitoring-suggestions-{scenario_id}")
         
         # Create smart suggestions based on scenario type and content
         suggestions = []
@@ -2312,13 +5462,7 @@ async def add_monitoring_source(scenario_id: str, source_data: MonitoringSourceC
     )
     
     # Calculate relevance score using AI
-    try:
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"relevance-{scenario_id}",
-            system_message="You are an AI that evaluates the relevance of monitoring sources to crisis scenarios. Provide a relevance score from 0.0 to 1.0."
-        ).with_model("anthropic", "claude-3-7-sonnet-20250219")
-        
+    try:
         relevance_prompt = f"""
 Evaluate the relevance of this monitoring source to the crisis scenario:
 
@@ -2330,8 +5474,7 @@ Provide a relevance score from 0.0 (not relevant) to 1.0 (highly relevant).
 Just respond with the numerical score.
 """
         
-        user_message = UserMessage(text=relevance_prompt)
-        relevance_response = await chat.send_message(user_message)
+        relevance_response = await send_llm_message("source_relevance", relevance_prompt, session_id=f"relevance-{scenario_id}")
         
         try:
             relevance_score = float(relevance_response.strip())
@@ -2357,6 +5500,8 @@ async def get_monitoring_sources(scenario_id: str, current_user: User = Depends(
     return [MonitoringSource(**source) for source in sources]
 
 # Automated Data Collection Simulation
+DATA_COLLECTION_CONCURRENCY = int(os.environ.get('DATA_COLLECTION_CONCURRENCY', '8'))
+
 @api_router.post("/scenarios/{scenario_id}/collect-data")
 async def collect_monitoring_data(scenario_id: str, current_user: User = Depends(get_current_user)):
     scenario = await db.scenarios.find_one({"id": scenario_id, "user_id": current_user.id})
@@ -2369,27 +5514,12 @@ async def collect_monitoring_data(scenario_id: str, current_user: User = Depends
     if not sources:
         raise HTTPException(status_code=404, detail="No active monitoring sources found")
     
-    collected_data_items = []
+    import random
+    semaphore = asyncio.Semaphore(DATA_COLLECTION_CONCURRENCY)
     
-    try:
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"data-collection-{scenario_id}",
-            system_message="""You are an AI data collector and analyzer. Simulate realistic data collection from various sources and provide intelligent analysis.
-
-Your role is to:
-1. Simulate realistic data from monitoring sources
-2. Analyze data relevance and sentiment
-3. Determine urgency levels
-4. Provide concise, actionable summaries
-5. Identify keyword matches and patterns
-
-Generate realistic, scenario-appropriate data that would be collected from the specified monitoring sources."""
-        ).with_model("anthropic", "claude-3-7-sonnet-20250219")
-        
-        for source in sources:
-            # Simulate data collection for each source
-            collection_prompt = f"""
+    async def collect_from_source(source):
+        # Simulate data collection for each source
+        collection_prompt = f"""
 Simulate realistic data collection from this monitoring source:
 
 Source: {source['source_name']} ({source['source_type']})
@@ -2406,44 +5536,63 @@ Generate 2-3 realistic data items that would be collected from this source, incl
 
 Make the data realistic and relevant to the crisis scenario.
 """
-            
-            user_message = UserMessage(text=collection_prompt)
-            collection_response = await chat.send_message(user_message)
-            
-            # Create simulated collected data items
-            import random
-            
-            # Generate 2-3 data items per source
-            for i in range(random.randint(2, 3)):
-                collected_item = CollectedData(
-                    source_id=source['id'],
-                    scenario_id=scenario_id,
-                    data_title=f"Data Update #{i+1} from {source['source_name']}",
-                    data_content=f"Simulated data collection: {collection_response[:200]}...",
-                    data_url=source['source_url'],
-                    relevance_score=min(1.0, source['relevance_score'] + random.uniform(-0.1, 0.1)),
-                    sentiment_score=random.uniform(-0.5, 0.5),
-                    urgency_level=random.choice(["low", "medium", "high"]),
-                    keywords_matched=[kw for kw in source['data_keywords'] if random.random() > 0.3],
-                    ai_summary=f"AI Analysis: Key information relevant to {scenario['crisis_type']} scenario with {source['source_name']} data indicating {random.choice(['normal conditions', 'elevated concerns', 'monitoring required'])}"
-                )
-                
-                await db.collected_data.insert_one(collected_item.dict())
-                collected_data_items.append(collected_item)
-            
-            # Update source last_check and total_data_points
-            await db.monitoring_sources.update_one(
+        
+        async with semaphore:
+            collection_response = await send_llm_message_with_retry(
+                "data_collection", collection_prompt, session_id=f"data-collection-{scenario_id}-{source['id']}"
+            )
+        
+        # Generate 2-3 data items per source
+        return [
+            CollectedData(
+                source_id=source['id'],
+                scenario_id=scenario_id,
+                data_title=f"Data Update #{i+1} from {source['source_name']}",
+                data_content=f"Simulated data collection: {collection_response[:200]}...",
+                data_url=source['source_url'],
+                relevance_score=min(1.0, source['relevance_score'] + random.uniform(-0.1, 0.1)),
+                sentiment_score=random.uniform(-0.5, 0.5),
+                urgency_level=random.choice(["low", "medium", "high"]),
+                keywords_matched=[kw for kw in source['data_keywords'] if random.random() > 0.3],
+                ai_summary=f"AI Analysis: Key information relevant to {scenario['crisis_type']} scenario with {source['source_name']} data indicating {random.choice(['normal conditions', 'elevated concerns', 'monitoring required'])}"
+            )
+            for i in range(random.randint(2, 3))
+        ]
+    
+    try:
+        results = await asyncio.gather(*(collect_from_source(source) for source in sources), return_exceptions=True)
+        
+        # One failing source doesn't discard what the others collected
+        collected = [(source, items) for source, items in zip(sources, results) if not isinstance(items, BaseException)]
+        failed_sources = []
+        for source, result in zip(sources, results):
+            if isinstance(result, BaseException):
+                logging.error(f"Data collection from source {source['id']} failed: {str(result)}")
+                failed_sources.append({"source_id": source['id'], "source_name": source['source_name'], "error": str(result)})
+        if not collected:
+            raise next(result for result in results if isinstance(result, BaseException))
+        
+        collected_data_items = [item for _, items in collected for item in items]
+        await db.collected_data.insert_many([item.dict() for item in collected_data_items])
+        
+        # Update each successful source's last_check and total_data_points in one round trip
+        checked_at = datetime.now(timezone.utc)
+        await db.monitoring_sources.bulk_write([
+            UpdateOne(
                 {"id": source['id']},
                 {
-                    "$set": {"last_check": datetime.now(timezone.utc)},
-                    "$inc": {"total_data_points": len(collected_data_items)}
+                    "$set": {"last_check": checked_at},
+                    "$inc": {"total_data_points": len(items)}
                 }
             )
+            for source, items in collected
+        ], ordered=False)
         
         return {
-            "message": f"Successfully collected {len(collected_data_items)} data items from {len(sources)} sources",
+            "message": f"Successfully collected {len(collected_data_items)} data items from {len(collected)} of {len(sources)} sources",
             "data_items_collected": len(collected_data_items),
-            "sources_monitored": len(sources),
+            "sources_monitored": len(collected),
+            "failed_sources": failed_sources,
             "collection_timestamp": datetime.now(timezone.utc)
         }
         
@@ -2552,20 +5701,6 @@ async def create_company(company_data: CompanyCreate, current_user: User = Depen
         # Analyze company website if provided
         if company_data.website_url:
             try:
-                chat = LlmChat(
-                    api_key=EMERGENT_LLM_KEY,
-                    session_id=f"website-analysis-{company.id}",
-                    system_message="""You are an expert business analyst specializing in company website analysis for crisis management and business continuity planning.
-
-Your role is to:
-1. Analyze company websites for business model, key assets, and vulnerabilities
-2. Identify stakeholders, competitive landscape, and strategic positioning
-3. Assess potential crisis scenarios based on company profile
-4. Extract key business information for crisis planning
-
-Provide structured analysis that will help in creating relevant crisis scenarios."""
-                ).with_model("anthropic", "claude-3-7-sonnet-20250219")
-                
                 analysis_prompt = f"""
 Analyze this company website and provide comprehensive business intelligence:
 
@@ -2587,8 +5722,7 @@ Please provide:
 Focus on practical insights for crisis management and business continuity planning.
 """
                 
-                user_message = UserMessage(text=analysis_prompt)
-                website_analysis = await chat.send_message(user_message)
+                website_analysis = await send_llm_message("website_analysis", analysis_prompt, session_id=f"website-analysis-{company.id}")
                 
                 company.website_analysis = website_analysis
                 company.business_model = f"Analysis generated for {company_data.industry} company"
@@ -2658,46 +5792,155 @@ async def update_company(company_id: str, company_data: CompanyCreate, current_u
     update_data["updated_at"] = datetime.now(timezone.utc)
     
     await db.companies.update_one({"id": company_id}, {"$set": update_data})
+    septe_analysis_cache.invalidate(company_id)
     updated_company = await db.companies.find_one({"id": company_id})
     return Company(**updated_company)
 
-# Business Document Management
-@api_router.post("/companies/{company_id}/documents", response_model=BusinessDocument)
-async def upload_business_document(company_id: str, doc_data: BusinessDocumentCreate, current_user: User = Depends(get_current_user)):
-    # Verify company access
-    company = await db.companies.find_one({"id": company_id})
-    if not company:
-        raise HTTPException(status_code=404, detail="Company not found")
+# Document chunking and map-reduce analysis
+DOCUMENT_CHUNK_TOKENS = int(os.environ.get('DOCUMENT_CHUNK_TOKENS', '3000'))
+DOCUMENT_REDUCE_MAX_TOKENS = int(os.environ.get('DOCUMENT_REDUCE_MAX_TOKENS', '12000'))
+DOCUMENT_CHUNK_CONCURRENCY = int(os.environ.get('DOCUMENT_CHUNK_CONCURRENCY', '6'))
+DOCUMENT_PREVIEW_CHARS = 2000  # Extracted file text kept on the document record itself
+
+def split_oversized_paragraph(paragraph: str, max_chars: int) -> List[str]:
+    """Split a paragraph that alone exceeds the chunk budget, preferring sentence boundaries"""
+    pieces, current = [], ""
+    for sentence in re.split(r"(?<=[.!?])\s+", paragraph):
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            pieces.append(current)
+            current = ""
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+def chunk_document_text(text: str, max_tokens: int = DOCUMENT_CHUNK_TOKENS) -> List[str]:
+    """Split text into paragraph-aligned chunks of at most max_tokens (estimated).
+
+    Once a chunk is half full it is also cut after any paragraph whose hash hits a fixed residue,
+    so boundaries depend on content rather than position: an edit early in a document only changes
+    the chunks around it, and the chunk summary cache still hits for the rest.
+    """
+    max_chars = max_tokens * LLM_CHARS_PER_TOKEN
+    paragraphs = []
+    for paragraph in re.split(r"\n\s*\n|\n", text):
+        paragraph = paragraph.strip()
+        if paragraph:
+            paragraphs.extend(split_oversized_paragraph(paragraph, max_chars) if len(paragraph) > max_chars else [paragraph])
+    
+    chunks, current, current_chars = [], [], 0
+    for paragraph in paragraphs:
+        if current and current_chars + len(paragraph) + 1 > max_chars:
+            chunks.append("\n".join(current))
+            current, current_chars = [], 0
+        current.append(paragraph)
+        current_chars += len(paragraph) + 1
+        if current_chars >= max_chars // 2 and hashlib.sha256(paragraph.encode()).digest()[0] % 4 == 0:
+            chunks.append("\n".join(current))
+            current, current_chars = [], 0
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+def group_chunk_summaries(summaries: List[str], max_tokens: int = DOCUMENT_CHUNK_TOKENS) -> List[str]:
+    """Pack consecutive summaries into groups of at most max_tokens, at least two per group so each round shrinks"""
+    groups, current = [], []
+    for summary in summaries:
+        if len(current) >= 2 and estimate_tokens("\n\n".join(current + [summary])) > max_tokens:
+            groups.append("\n\n".join(current))
+            current = []
+        current.append(summary)
+    if current:
+        groups.append("\n\n".join(current))
+    return groups
+
+async def summarize_document_chunks(chunks: List[str], context: str, session_id: str) -> List[str]:
+    """Summarize chunks concurrently, reusing summaries cached by content hash"""
+    profile = llm_router.resolve("document_chunk_summary")
+    hashes = [
+        hashlib.sha256(f"{profile.model}|{profile.system_message}|{chunk}".encode()).hexdigest()
+        for chunk in chunks
+    ]
+    cached = {
+        entry["hash"]: entry["summary"]
+        async for entry in db.document_chunk_summaries.find({"hash": {"$in": list(set(hashes))}})
+    }
     
-    if current_user.company_id != company_id and company['created_by'] != current_user.id:
-        raise HTTPException(status_code=403, detail="Access denied")
+    semaphore = asyncio.Semaphore(DOCUMENT_CHUNK_CONCURRENCY)
     
-    try:
-        # AI analysis of the document
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"doc-analysis-{company_id}",
-            system_message="""You are an expert business document analyzer specializing in extracting crisis management insights from business documents.
+    async def summarize(chunk: str):
+        """Returns (summary, cacheable)"""
+        prompt = f"""Summarize this section of {context}:
 
-Your role is to:
-1. Analyze business plans, strategies, and operational documents
-2. Identify key business insights and strategic priorities
-3. Extract potential risk factors and vulnerabilities
-4. Recommend relevant crisis scenarios based on document content
-5. Provide actionable intelligence for crisis planning
+{chunk}"""
+        async with semaphore:
+            try:
+                summary = await send_llm_message(
+                    "document_chunk_summary", prompt, session_id=session_id, use_cache=False, fallback=False
+                )
+                return summary, True
+            except LlmUnavailableError as e:
+                # Not cached, so the section is summarized properly on the next upload
+                logging.warning(f"Chunk summary unavailable, using excerpt: {str(e)}")
+                return chunk[:1000], False
+    
+    pending = {}
+    for chunk_hash, chunk in zip(hashes, chunks):
+        if chunk_hash not in cached:
+            pending.setdefault(chunk_hash, chunk)
+    results = await asyncio.gather(*(summarize(chunk) for chunk in pending.values()))
+    
+    summaries = dict(cached)
+    new_entries = []
+    now = datetime.now(timezone.utc)
+    for chunk_hash, (summary, cacheable) in zip(pending, results):
+        summaries[chunk_hash] = summary
+        if cacheable:
+            new_entries.append({"hash": chunk_hash, "summary": summary, "model": profile.model, "created_at": now})
+    
+    if new_entries:
+        try:
+            await db.document_chunk_summaries.insert_many(new_entries, ordered=False)
+        except Exception as e:
+            # Concurrent uploads of the same content may race on the unique hash index
+            logging.debug(f"Chunk summary cache insert: {str(e)}")
+    
+    return [summaries[chunk_hash] for chunk_hash in hashes]
 
-Focus on practical insights that will enhance crisis preparedness and business continuity."""
-        ).with_model("anthropic", "claude-3-7-sonnet-20250219")
-        
-        analysis_prompt = f"""
+async def analyze_document_text(company: dict, document_name: str, document_type: str, text: str, session_id: str):
+    """Analyze a whole document: directly if it fits one chunk, otherwise summarize chunks and reduce.
+
+    Returns (DocumentAnalysisOutput, chunk_count).
+    """
+    chunks = chunk_document_text(text)
+    context = f"the {document_type} document '{document_name}' for {company['company_name']} ({company['industry']})"
+    
+    if len(chunks) <= 1:
+        content_label = "Document Content"
+        content = text
+    else:
+        summaries = await summarize_document_chunks(chunks, context, session_id)
+        # Very long documents reduce in rounds until the summaries fit one analysis prompt
+        while estimate_tokens("\n\n".join(summaries)) > DOCUMENT_REDUCE_MAX_TOKENS and len(summaries) > 1:
+            summaries = await summarize_document_chunks(group_chunk_summaries(summaries), context, session_id)
+        content_label = f"Section Summaries (covering all {len(chunks)} sections of the document)"
+        content = "\n\n".join(f"Section {index}:\n{summary}" for index, summary in enumerate(summaries, 1))
+    
+    analysis_prompt = f"""
 Analyze this business document and extract crisis management insights:
 
-Document Type: {doc_data.document_type}
-Document Name: {doc_data.document_name}
+Document Type: {document_type}
+Document Name: {document_name}
 Company: {company['company_name']} ({company['industry']})
 
-Document Content:
-{doc_data.document_content[:2000]}...
+{content_label}:
+{content}
 
 Please provide:
 1. Key business insights and strategic priorities
@@ -2707,36 +5950,36 @@ Please provide:
 
 Focus on actionable intelligence for business continuity and crisis management.
 """
-        
-        user_message = UserMessage(text=analysis_prompt)
-        ai_analysis = await chat.send_message(user_message)
+    analysis = await send_llm_message("document_analysis", with_output_model(analysis_prompt, DocumentAnalysisOutput), session_id=session_id)
+    return parse_structured_output("document_analysis", analysis, DocumentAnalysisOutput), len(chunks)
+
+# Business Document Management
+@api_router.post("/companies/{company_id}/documents", response_model=BusinessDocument)
+async def upload_business_document(company_id: str, doc_data: BusinessDocumentCreate, current_user: User = Depends(get_current_user)):
+    # Verify company access
+    company = await db.companies.find_one({"id": company_id})
+    if not company:
+        raise HTTPException(status_code=404, detail="Company not found")
+    
+    if current_user.company_id != company_id and company['created_by'] != current_user.id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    try:
+        # AI analysis of the whole document
+        analysis, chunk_count = await analyze_document_text(
+            company, doc_data.document_name, doc_data.document_type, doc_data.document_content,
+            session_id=f"doc-analysis-{company_id}"
+        )
         
         document = BusinessDocument(
             company_id=company_id,
             document_name=doc_data.document_name,
             document_type=doc_data.document_type,
             document_content=doc_data.document_content,
-            ai_analysis=ai_analysis,
-            key_insights=[
-                "Strategic priorities identified from document analysis",
-                "Business model strengths and opportunities",
-                "Operational efficiency and process optimization",
-                "Market positioning and competitive advantages"
-            ],
-            risk_factors=[
-                "Market volatility and competitive threats",
-                "Operational dependencies and single points of failure",
-                "Financial risks and cash flow concerns",
-                "Regulatory and compliance challenges"
-            ],
-            strategic_priorities=[
-                "Business continuity planning implementation",
-                "Risk mitigation strategy development",
-                "Crisis communication plan establishment",
-                "Emergency response procedure optimization"
-            ],
+            **analysis.model_dump(),
             uploaded_by=current_user.id,
-            file_size=len(doc_data.document_content)
+            file_size=len(doc_data.document_content),
+            chunk_count=chunk_count
         )
         
         await db.business_documents.insert_one(document.dict())
@@ -2757,6 +6000,23 @@ async def get_business_documents(company_id: str, current_user: User = Depends(g
     documents = await db.business_documents.find({"company_id": company_id}).to_list(1000)
     return [BusinessDocument(**doc) for doc in documents]
 
+@api_router.get("/companies/{company_id}/documents/{document_id}/text", response_class=PlainTextResponse)
+async def get_business_document_text(company_id: str, document_id: str, current_user: User = Depends(get_current_user)):
+    """Full extracted text of an uploaded file, which document listings only preview"""
+    # Verify company access
+    if current_user.company_id != company_id:
+        company = await db.companies.find_one({"id": company_id, "created_by": current_user.id})
+        if not company:
+            raise HTTPException(status_code=403, detail="Access denied")
+    
+    stored = await db.business_document_texts.find_one({"document_id": document_id, "company_id": company_id})
+    if stored:
+        return stored["text"]
+    document = await db.business_documents.find_one({"id": document_id, "company_id": company_id})
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return document["document_content"]
+
 @api_router.post("/companies/{company_id}/documents/upload", response_model=BusinessDocument)
 async def upload_document_file(
     company_id: str, 
@@ -2801,78 +6061,25 @@ async def upload_document_file(
         if not text_content.strip():
             raise HTTPException(status_code=400, detail="Could not extract text from the file")
         
-        # AI analysis of the document
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"file-analysis-{company_id}",
-            system_message="""You are an expert business document analyzer specializing in extracting crisis management insights from business documents.
-
-Your role is to:
-1. Analyze business plans, strategies, and operational documents
-2. Identify key business insights and strategic priorities
-3. Extract potential risk factors and vulnerabilities
-4. Recommend relevant crisis scenarios based on document content
-5. Provide actionable intelligence for crisis planning
-
-Focus on practical insights that will enhance crisis preparedness and business continuity."""
-        ).with_model("anthropic", "claude-3-7-sonnet-20250219")
-        
-        analysis_prompt = f"""
-Analyze this business document and extract crisis management insights:
-
-Document Type: {document_type}
-Document Name: {file.filename}
-Company: {company['company_name']} ({company['industry']})
-
-Document Content:
-{text_content[:4000]}...
-
-Please provide:
-1. Key business insights and strategic priorities
-2. Identified risk factors and vulnerabilities
-3. Recommended crisis scenarios based on document content
-4. Strategic recommendations for crisis preparedness
-
-Focus on actionable intelligence for business continuity and crisis management.
-"""
-        
-        user_message = UserMessage(text=analysis_prompt)
-        ai_analysis = await chat.send_message(user_message)
-        
-        # Extract key insights using simple text analysis
-        key_insights = [
-            "Document successfully processed and analyzed",
-            "Business continuity factors identified",
-            "Risk assessment completed",
-            "Strategic recommendations generated"
-        ]
-        
-        risk_factors = [
-            "Operational dependencies identified",
-            "Market vulnerabilities assessed",
-            "Resource constraints evaluated"
-        ]
-        
-        strategic_priorities = [
-            "Crisis preparedness enhancement",
-            "Business continuity planning",
-            "Risk mitigation strategies"
-        ]
+        # AI analysis of the whole document
+        analysis, chunk_count = await analyze_document_text(
+            company, file.filename, document_type, text_content,
+            session_id=f"file-analysis-{company_id}"
+        )
         
         document = BusinessDocument(
             company_id=company_id,
             document_name=file.filename,
             document_type=document_type,
-            document_content=text_content[:2000],  # Store first 2000 chars
-            ai_analysis=ai_analysis,
-            key_insights=key_insights,
-            risk_factors=risk_factors,
-            strategic_priorities=strategic_priorities,
+            document_content=text_content[:DOCUMENT_PREVIEW_CHARS],  # Store a preview; the full text lives in business_document_texts
+            **analysis.model_dump(),
             uploaded_by=current_user.id,
-            file_size=len(file_content)
+            file_size=len(file_content),
+            chunk_count=chunk_count
         )
         
         await db.business_documents.insert_one(document.dict())
+        await db.business_document_texts.insert_one({"document_id": document.id, "company_id": company_id, "text": text_content})
         return document
         
     except Exception as e:
@@ -2900,6 +6107,179 @@ async def create_team(company_id: str, team_data: TeamCreate, current_user: User
     await db.teams.insert_one(team.dict())
     return {"message": "Team created successfully", "team_id": team.id}
 
+# Real-time SEPTE analysis cache
+SEPTE_ANALYSIS_FIELDS = [
+    "social_unrest_pct", "social_cohesion_pct",
+    "economic_recession_pct", "economic_growth_pct",
+    "political_instability_pct", "political_stability_pct",
+    "technological_disruption_pct", "technological_advancement_pct",
+    "environmental_degradation_pct", "environmental_recovery_pct"
+]
+SEPTE_BUCKET_PCT = float(os.environ.get('SEPTE_BUCKET_PCT', '5'))
+SEPTE_CACHE_TOLERANCE_PCT = float(os.environ.get('SEPTE_CACHE_TOLERANCE_PCT', '10'))
+SEPTE_CACHE_REFRESH_SECONDS = int(os.environ.get('SEPTE_CACHE_REFRESH_SECONDS', '900'))
+SEPTE_CACHE_MAX_ENTRIES = int(os.environ.get('SEPTE_CACHE_MAX_ENTRIES', '2048'))
+
+class SepteAnalysisCache:
+    """Real-time analyses keyed by (company, quantized SEPTE vector), served from the nearest cached bucket"""
+    
+    def __init__(self, bucket_pct: float, tolerance_pct: float, refresh_seconds: int, max_entries: int):
+        self.bucket_pct = bucket_pct
+        self.tolerance_pct = tolerance_pct
+        self.refresh_seconds = refresh_seconds
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.refreshing = set()
+        self.background_tasks = set()
+        self.exact_hits = 0
+        self.nearest_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+    
+    def quantize(self, values: dict) -> tuple:
+        return tuple(
+            min(100.0, max(0.0, round(float(values[field]) / self.bucket_pct) * self.bucket_pct))
+            for field in SEPTE_ANALYSIS_FIELDS
+        )
+    
+    def lookup(self, company_id: str, bucket: tuple):
+        """Return (entry, status) for the exact bucket or the nearest one within tolerance"""
+        entry = self.entries.get((company_id, bucket))
+        if entry is not None:
+            self.entries.move_to_end((company_id, bucket))
+            self.exact_hits += 1
+            return entry, "hit"
+        
+        nearest, nearest_distance = None, None
+        for (cached_company, cached_bucket), cached_entry in self.entries.items():
+            if cached_company != company_id:
+                continue
+            distance = max(abs(a - b) for a, b in zip(bucket, cached_bucket))
+            if distance <= self.tolerance_pct and (nearest_distance is None or distance < nearest_distance):
+                nearest, nearest_distance = cached_entry, distance
+        if nearest is not None:
+            self.nearest_hits += 1
+            return nearest, "nearest"
+        
+        self.misses += 1
+        return None, "miss"
+    
+    def store(self, company_id: str, bucket: tuple, analysis: str) -> dict:
+        entry = {"bucket": bucket, "analysis": analysis, "created_at": time.time()}
+        self.entries[(company_id, bucket)] = entry
+        self.entries.move_to_end((company_id, bucket))
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+    
+    def is_stale(self, entry: dict) -> bool:
+        return time.time() - entry["created_at"] > self.refresh_seconds
+    
+    def schedule_refresh(self, company_id: str, bucket: tuple, compute):
+        """Recompute a bucket in the background unless a refresh for it is already running"""
+        key = (company_id, bucket)
+        if key in self.refreshing:
+            return
+        self.refreshing.add(key)
+        
+        async def refresh():
+            try:
+                self.store(company_id, bucket, await compute())
+                self.refreshes += 1
+            except Exception as e:
+                logging.error(f"SEPTE analysis refresh failed for {company_id}: {str(e)}")
+            finally:
+                self.refreshing.discard(key)
+        
+        task = asyncio.create_task(refresh())
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+    
+    def invalidate(self, company_id: str):
+        for key in [key for key in self.entries if key[0] == company_id]:
+            del self.entries[key]
+    
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.nearest_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "bucket_pct": self.bucket_pct,
+            "tolerance_pct": self.tolerance_pct,
+            "refresh_seconds": self.refresh_seconds,
+            "exact_hits": self.exact_hits,
+            "nearest_hits": self.nearest_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.nearest_hits) / lookups if lookups else 0.0,
+            "background_refreshes": self.refreshes,
+            "refreshing": len(self.refreshing)
+        }
+
+septe_analysis_cache = SepteAnalysisCache(
+    SEPTE_BUCKET_PCT, SEPTE_CACHE_TOLERANCE_PCT, SEPTE_CACHE_REFRESH_SECONDS, SEPTE_CACHE_MAX_ENTRIES
+)
+
+def build_real_time_analysis_prompt(company: dict, values: dict) -> str:
+    return f"""
+    You are analyzing a crisis scenario for {company.get('company_name', 'the organization')} using the SEPTE framework.
+    
+    Company Context:
+    - Industry: {company.get('industry', 'Unknown')}
+    - Size: {company.get('company_size', 'Unknown')}
+    - Description: {company.get('description', 'No description available')}
+    
+    Current SEPTE Framework Values:
+    
+    SOCIAL:
+    - Social Unrest: {values['social_unrest_pct']}%
+    - Social Cohesion: {values['social_cohesion_pct']}%
+    
+    ECONOMIC:
+    - Economic Recession Risk: {values['economic_recession_pct']}%
+    - Economic Growth Potential: {values['economic_growth_pct']}%
+    
+    POLITICAL:
+    - Political Instability: {values['political_instability_pct']}%
+    - Political Stability: {values['political_stability_pct']}%
+    
+    TECHNOLOGICAL:
+    - Technological Disruption: {values['technological_disruption_pct']}%
+    - Technological Advancement: {values['technological_advancement_pct']}%
+    
+    ENVIRONMENTAL:
+    - Environmental Degradation: {values['environmental_degradation_pct']}%
+    - Environmental Recovery: {values['environmental_recovery_pct']}%
+    
+    Please provide a comprehensive impact analysis that includes:
+
+    1. **SCENARIO ASSESSMENT**: Overall risk level and key concerns
+    2. **DOMAIN ANALYSIS**: Impact analysis for each SEPTE domain
+    3. **INTERCONNECTIONS**: How different factors influence each other
+    4. **BUSINESS IMPACT**: Specific implications for this company/industry
+    5. **RISK INDICATORS**: Key metrics to monitor
+    6. **STRATEGIC RECOMMENDATIONS**: Actionable steps for preparedness
+    7. **TIMELINE**: Expected development phases
+    
+    Keep the analysis practical, actionable, and specific to the company context.
+    Use clear headings and bullet points for readability.
+    """
+
+async def get_real_time_analysis(company: dict, analysis_data: dict):
+    """Serve the analysis for the quantized SEPTE vector, computing on a miss and refreshing near or stale hits"""
+    bucket = septe_analysis_cache.quantize({field: analysis_data.get(field, 50) for field in SEPTE_ANALYSIS_FIELDS})
+    
+    async def compute():
+        prompt = build_real_time_analysis_prompt(company, dict(zip(SEPTE_ANALYSIS_FIELDS, bucket)))
+        return await send_llm_message("real_time_analysis", prompt, session_id=f"real-time-analysis-{company['id']}", fallback=False)
+    
+    entry, cache_status = septe_analysis_cache.lookup(company["id"], bucket)
+    if entry is None:
+        entry = septe_analysis_cache.store(company["id"], bucket, await compute())
+    elif cache_status == "nearest" or septe_analysis_cache.is_stale(entry):
+        septe_analysis_cache.schedule_refresh(company["id"], bucket, compute)
+    
+    return entry, cache_status
+
 @api_router.post("/companies/{company_id}/real-time-analysis")
 async def generate_real_time_analysis(
     company_id: str, 
@@ -2913,72 +6293,16 @@ async def generate_real_time_analysis(
         raise HTTPException(status_code=404, detail="Company not found")
     
     try:
-        # Extract SEPTE values from analysis_data
+        # Extract the risk-side SEPTE values from analysis_data
         social_unrest = analysis_data.get('social_unrest_pct', 50)
-        social_cohesion = analysis_data.get('social_cohesion_pct', 50)
         economic_recession = analysis_data.get('economic_recession_pct', 50)
-        economic_growth = analysis_data.get('economic_growth_pct', 50)
         political_instability = analysis_data.get('political_instability_pct', 50)
-        political_stability = analysis_data.get('political_stability_pct', 50)
         technological_disruption = analysis_data.get('technological_disruption_pct', 50)
-        technological_advancement = analysis_data.get('technological_advancement_pct', 50)
         environmental_degradation = analysis_data.get('environmental_degradation_pct', 50)
-        environmental_recovery = analysis_data.get('environmental_recovery_pct', 50)
-        
-        # Create analysis prompt
-        analysis_prompt = f"""
-        You are analyzing a crisis scenario for {company.get('company_name', 'the organization')} using the SEPTE framework.
-        
-        Company Context:
-        - Industry: {company.get('industry', 'Unknown')}
-        - Size: {company.get('company_size', 'Unknown')}
-        - Description: {company.get('description', 'No description available')}
-        
-        Current SEPTE Framework Values:
-        
-        SOCIAL:
-        - Social Unrest: {social_unrest}%
-        - Social Cohesion: {social_cohesion}%
-        
-        ECONOMIC:
-        - Economic Recession Risk: {economic_recession}%
-        - Economic Growth Potential: {economic_growth}%
-        
-        POLITICAL:
-        - Political Instability: {political_instability}%
-        - Political Stability: {political_stability}%
         
-        TECHNOLOGICAL:
-        - Technological Disruption: {technological_disruption}%
-        - Technological Advancement: {technological_advancement}%
-        
-        ENVIRONMENTAL:
-        - Environmental Degradation: {environmental_degradation}%
-        - Environmental Recovery: {environmental_recovery}%
-        
-        Please provide a comprehensive impact analysis that includes:
-
-        1. **SCENARIO ASSESSMENT**: Overall risk level and key concerns
-        2. **DOMAIN ANALYSIS**: Impact analysis for each SEPTE domain
-        3. **INTERCONNECTIONS**: How different factors influence each other
-        4. **BUSINESS IMPACT**: Specific implications for this company/industry
-        5. **RISK INDICATORS**: Key metrics to monitor
-        6. **STRATEGIC RECOMMENDATIONS**: Actionable steps for preparedness
-        7. **TIMELINE**: Expected development phases
-        
-        Keep the analysis practical, actionable, and specific to the company context.
-        Use clear headings and bullet points for readability.
-        """
-        
-        # Generate AI analysis using the existing AI integration
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"real-time-analysis-{company_id}",
-            system_message="You are an expert crisis management analyst specializing in SEPTE framework analysis and organizational risk assessment."
-        ).with_model("anthropic", "claude-3-7-sonnet-20250219")
-        
-        user_message = UserMessage(text=analysis_prompt)
-        analysis_result = await chat.send_message(user_message)
+        # Analyses are cached per quantized SEPTE bucket so slider drags reuse nearby results
+        cache_entry, cache_status = await get_real_time_analysis(company, analysis_data)
+        analysis_result = cache_entry["analysis"]
         
         # Calculate overall risk level
         risk_factors = [social_unrest, economic_recession, political_instability, technological_disruption, environmental_degradation]
@@ -3014,7 +6338,9 @@ async def generate_real_time_analysis(
             "risk_level": risk_level,
             "recommendations": recommendations,
             "septe_values": analysis_data,
-            "generated_at": datetime.now(timezone.utc).isoformat()
+            "analysis_bucket": dict(zip(SEPTE_ANALYSIS_FIELDS, cache_entry["bucket"])),
+            "cache_status": cache_status,
+            "generated_at": datetime.fromtimestamp(cache_entry["created_at"], timezone.utc).isoformat()
         }
         
     except Exception as e:
@@ -3143,22 +6469,8 @@ async def generate_rapid_analysis(company_id: str, analysis_type: str, current_u
     
     try:
         # Get company documents for context
-        documents = await db.business_documents.find({"company_id": company_id}).to_list(10)
+        documents = await db.business_documents.find({"company_id": company_id}, {"document_content": 0}).to_list(10)
         
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=f"rapid-analysis-{company_id}",
-            system_message="""You are an expert rapid business analysis consultant specializing in crisis management and business continuity.
-
-Your role is to:
-1. Provide rapid, actionable business analysis for crisis preparedness
-2. Generate vulnerability assessments and business impact analyses
-3. Recommend scenario-specific crisis management strategies
-4. Deliver competitive analysis with crisis management focus
-5. Provide clear, prioritized recommendations for immediate action
-
-Focus on speed, accuracy, and actionable insights for business decision-makers."""
-        ).with_model("anthropic", "claude-3-7-sonnet-20250219")
         
         # Build context from company and documents
         context = f"""
@@ -3225,8 +6537,10 @@ Provide:
         if analysis_type not in analysis_prompts:
             raise HTTPException(status_code=400, detail="Invalid analysis type")
         
-        user_message = UserMessage(text=analysis_prompts[analysis_type])
-        analysis_content = await chat.send_message(user_message)
+        analysis_content = await send_llm_message(
+            "rapid_analysis", with_output_model(analysis_prompts[analysis_type], RapidAnalysisOutput), session_id=f"rapid-analysis-{company_id}"
+        )
+        analysis = parse_structured_output("rapid_analysis", analysis_content, RapidAnalysisOutput)
         
         # Create structured analysis based on type
         analysis_titles = {
@@ -3236,30 +6550,11 @@ Provide:
             "competitive_analysis": f"Competitive Crisis Analysis - {company['company_name']}"
         }
         
-        key_findings = [
-            "Critical vulnerabilities identified requiring immediate attention",
-            "High-impact scenarios with significant business implications",
-            "Strategic opportunities for competitive advantage in crisis management",
-            "Operational dependencies creating potential single points of failure"
-        ]
-        
-        recommendations = [
-            "Implement comprehensive business continuity planning",
-            "Establish crisis communication protocols and procedures",
-            "Develop scenario-specific response strategies and playbooks",
-            "Create cross-functional crisis management teams",
-            "Invest in monitoring and early warning systems"
-        ]
-        
         rapid_analysis = RapidAnalysis(
             company_id=company_id,
             analysis_type=analysis_type,
             analysis_title=analysis_titles[analysis_type],
-            analysis_content=analysis_content,
-            key_findings=key_findings,
-            recommendations=recommendations,
-            priority_level="high",
-            confidence_score=0.88,
+            **analysis.model_dump(),
             generated_by=current_user.id
         )
         
@@ -3323,6 +6618,7 @@ async def get_admin_user(credentials: HTTPAuthorizationCredentials = Depends(sec
         if not admin_creds:
             raise HTTPException(status_code=403, detail="Admin access required")
         
+        llm_tenant.set(user.get("organization"))
         return User(**user)
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
@@ -3715,6 +7011,105 @@ async def get_admin_dashboard_stats(admin_user: User = Depends(get_admin_user)):
         "total_simulations": await db.simulation_results.count_documents({})
     }
 
+@api_router.get("/admin/llm/profiles")
+async def get_llm_profiles(admin_user: User = Depends(get_admin_user)):
+    """Get the shared LLM profiles with their concurrency usage"""
+    return [profile.stats() for profile in llm_router.all_profiles()]
+
+@api_router.get("/admin/llm/metrics")
+async def get_llm_metrics(admin_user: User = Depends(get_admin_user)):
+    """Per-endpoint LLM latency, token, cache and error summary, most total model time first"""
+    return llm_metrics.summary()
+
+@api_router.delete("/admin/llm/metrics")
+async def reset_llm_metrics(admin_user: User = Depends(get_admin_user)):
+    """Reset the LLM instrumentation counters"""
+    llm_metrics.reset()
+    return {"message": "LLM metrics reset"}
+
+@api_router.get("/metrics", response_class=PlainTextResponse)
+async def get_prometheus_metrics():
+    """LLM call histograms and counters in Prometheus text format"""
+    return PlainTextResponse(llm_metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@api_router.get("/admin/llm/metrics/tiers")
+async def get_llm_tier_metrics(admin_user: User = Depends(get_admin_user)):
+    """Upstream call latency per model tier"""
+    return llm_metrics.tier_summary()
+
+class LlmRoutingOverride(BaseModel):
+    tenant: str  # Organization name
+    profile: str = "*"  # Profile name, or "*" for every routed profile of the tenant
+    tier: str
+
+@api_router.get("/admin/llm/routing")
+async def get_llm_routing(admin_user: User = Depends(get_admin_user)):
+    """Model tiers, the default tier per call site and per-tenant overrides"""
+    return llm_router.stats()
+
+@api_router.put("/admin/llm/routing/overrides")
+async def set_llm_routing_override(override: LlmRoutingOverride, admin_user: User = Depends(get_admin_user)):
+    """Route a tenant's calls for one profile (or all of them) to another model tier"""
+    if override.tier not in LLM_MODEL_TIERS:
+        raise HTTPException(status_code=400, detail=f"Unknown tier: {override.tier}")
+    if override.profile != "*" and llm_router.tier_for(override.profile) is None:
+        raise HTTPException(status_code=400, detail=f"Profile is not routed: {override.profile}")
+    await llm_router.set_override(override.tenant, override.profile, override.tier)
+    return {"message": "Routing override saved", **override.dict()}
+
+@api_router.delete("/admin/llm/routing/overrides")
+async def delete_llm_routing_override(tenant: str, profile: str = "*", admin_user: User = Depends(get_admin_user)):
+    """Remove a tenant routing override"""
+    if not await llm_router.delete_override(tenant, profile):
+        raise HTTPException(status_code=404, detail="Routing override not found")
+    return {"message": "Routing override removed"}
+
+@api_router.get("/admin/idempotency")
+async def get_idempotency_stats(admin_user: User = Depends(get_admin_user)):
+    """Idempotency-Key executions, replays, waits and conflicts in this process"""
+    return idempotency_store.stats()
+
+@api_router.get("/admin/llm/prefetch")
+async def get_llm_prefetch_stats(admin_user: User = Depends(get_admin_user)):
+    """Speculative scenario artifact prefetch counters"""
+    return scenario_prefetcher.stats()
+
+@api_router.get("/admin/llm/genie-memory")
+async def get_genie_memory_stats(admin_user: User = Depends(get_admin_user)):
+    """AI Genie conversation summary counters"""
+    return genie_conversations.stats()
+
+@api_router.get("/admin/llm/limits")
+async def get_llm_limits(admin_user: User = Depends(get_admin_user)):
+    """Adaptive concurrency limits and circuit breaker state per model"""
+    return [guard.stats() for guard in llm_model_guards.values()]
+
+@api_router.get("/admin/llm/provider")
+async def get_llm_provider(admin_user: User = Depends(get_admin_user)):
+    """Get the active LLM provider backend and its settings"""
+    return llm_provider.stats()
+
+@api_router.get("/admin/llm/cache")
+async def get_llm_cache_stats(admin_user: User = Depends(get_admin_user)):
+    """Get LLM response cache hit/miss counters"""
+    return llm_response_cache.stats()
+
+@api_router.get("/admin/llm/single-flight")
+async def get_llm_single_flight_stats(admin_user: User = Depends(get_admin_user)):
+    """Get how many concurrent LLM calls were coalesced onto shared upstream requests"""
+    return llm_single_flight.stats()
+
+@api_router.delete("/admin/llm/cache")
+async def clear_llm_cache(admin_user: User = Depends(get_admin_user)):
+    """Drop every cached LLM response from both cache tiers"""
+    deleted = await llm_response_cache.clear()
+    return {"message": "LLM cache cleared", "deleted_entries": deleted}
+
+@api_router.get("/admin/llm/septe-cache")
+async def get_septe_cache_stats(admin_user: User = Depends(get_admin_user)):
+    """Hit rates for the quantized real-time SEPTE analysis cache"""
+    return septe_analysis_cache.stats()
+
 @api_router.get("/dashboard/stats")
 async def get_dashboard_stats(current_user: User = Depends(get_current_user)):
     total_scenarios = await db.scenarios.count_documents({"user_id": current_user.id})
@@ -3739,6 +7134,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class LlmRequestScopeMiddleware:
+    """Let LLM instrumentation attribute model calls to the route that made them.
+    Plain ASGI rather than @app.middleware("http"), which hides client disconnects from request.is_disconnected()."""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = llm_request_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            llm_request_scope.reset(token)
+
+app.add_middleware(LlmRequestScopeMiddleware)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -3746,6 +7159,56 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_llm_cache_indexes():
+    await ensure_llm_cache_indexes()
+
+@app.on_event("startup")
+async def load_llm_routing_overrides():
+    await db.llm_routing_overrides.create_index([("tenant", 1), ("profile", 1)], unique=True)
+    await llm_router.load()
+
+@app.on_event("startup")
+async def create_idempotency_indexes():
+    await ensure_idempotency_indexes()
+
+@app.on_event("startup")
+async def create_document_chunk_indexes():
+    await db.document_chunk_summaries.create_index("hash", unique=True)
+    await db.business_document_texts.create_index("document_id", unique=True)
+
+@app.on_event("startup")
+async def create_genie_conversation_indexes():
+    await db.genie_conversations.create_index("user_id", unique=True)
+
+@app.on_event("startup")
+async def create_sensitivity_indexes():
+    await db.sensitivity_analyses.create_index("adjustment_id", unique=True)
+
+@app.on_event("startup")
+async def start_job_workers():
+    await db.jobs.create_index("id", unique=True)
+    await db.jobs.create_index([("user_id", 1), ("created_at", -1)])
+    await db.jobs.create_index([("status", 1), ("created_at", 1)])
+    await job_queue.start()
+
+@app.on_event("startup")
+async def start_scenario_prefetcher():
+    scenario_prefetcher.start()
+
+@app.on_event("shutdown")
+async def stop_scenario_prefetcher():
+    await scenario_prefetcher.stop()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await job_queue.stop()
+
+@app.on_event("shutdown")
+async def stop_sensitivity_pool():
+    if sensitivity_pool is not None:
+        sensitivity_pool.shutdown(cancel_futures=True)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
@@ -4254,6 +7717,376 @@ class PolycrisisEnhancementSummary(BaseModel):
     advanced_monitoring_tasks: int
     cultural_dimensions: int
 
+# Cross-domain cascade propagation
+POLYCRISIS_ENHANCEMENTS_FILE = Path(__file__).parent.parent / "polycrisis_enhancements.json"
+CASCADE_INTERACTION_WEIGHTS = {"low": 0.2, "medium": 0.4, "high": 0.6}
+CASCADE_LOOP_WEIGHTS = {"weak": 0.15, "medium": 0.3, "strong": 0.45}
+CASCADE_SUBSYSTEM_WEIGHT = 0.3  # Coupling from a domain to each subsystem, and from all subsystems together back to the domain
+CASCADE_DAMPING = float(os.environ.get('CASCADE_DAMPING', '0.85'))
+# Edge weights are scaled down when the graph is built so the damped adjacency's spectral radius stays
+# at or below this; total amplification is then at most 1 / (1 - radius) and severities don't saturate
+CASCADE_MAX_SPECTRAL_RADIUS = float(os.environ.get('CASCADE_MAX_SPECTRAL_RADIUS', '0.5'))
+CASCADE_TOLERANCE = 1e-6
+CASCADE_MAX_ITERATIONS = 200
+CASCADE_RESULT_CACHE_SIZE = 512
+
+# Technological exposure per crisis type; the other domains use CRISIS_DOMAIN_EXPOSURE
+CRISIS_TECHNOLOGICAL_EXPOSURE = {
+    "technological_crisis": 1.0,
+    "cyber_attack": 1.0,
+    "economic_crisis": 0.4,
+    "pandemic": 0.3,
+    "natural_disaster": 0.5,
+    "environmental_crisis": 0.2,
+    "social_unrest": 0.3
+}
+
+class CascadeNodeImpact(BaseModel):
+    node: str
+    initial_shock: float
+    final_impact: float
+    amplification: Optional[float] = None  # final / initial; None for nodes that were not shocked directly
+
+class CascadeResult(BaseModel):
+    scenario_id: str
+    domains: List[CascadeNodeImpact]
+    subsystems: List[CascadeNodeImpact]  # Most affected first
+    iterations: int
+    converged: bool
+    residual: float
+    cached: bool
+    graph_nodes: int
+    graph_edges: int
+    runtime_ms: float
+
+class CascadeGraph:
+    """Domains and their subsystems as nodes; interaction matrices, feedback loops and subsystem
+    coupling as weighted directed edges, kept in COO form (rows <- cols)"""
+    
+    def __init__(self, cross_domain: dict, version: float):
+        self.version = version
+        self.domains = [domain["name"].lower() for domain in cross_domain["domains"]]
+        self.nodes = list(self.domains)
+        edges: Dict[tuple, float] = {}
+        
+        def add_edge(source: str, target: str, weight: float):
+            edges[(target, source)] = edges.get((target, source), 0.0) + weight
+        
+        for domain in cross_domain["domains"]:
+            for subsystem in domain["subsystems"]:
+                node = f"{domain['name'].lower()}.{subsystem}"
+                self.nodes.append(node)
+                # A domain feels the average of its subsystems, so they don't amplify it just by number
+                add_edge(node, domain["name"].lower(), CASCADE_SUBSYSTEM_WEIGHT / len(domain["subsystems"]))
+                add_edge(domain["name"].lower(), node, CASCADE_SUBSYSTEM_WEIGHT)
+        for interaction in cross_domain.get("interaction_matrices", []):
+            if interaction["from_domain"] in self.domains and interaction["to_domain"] in self.domains:
+                add_edge(interaction["from_domain"], interaction["to_domain"], CASCADE_INTERACTION_WEIGHTS.get(interaction["interaction_strength"], 0.4))
+        for loop in cross_domain.get("feedback_loops", []):
+            # Loops are named after their domains, e.g. "Social-Technology Feedback"
+            loop_domains = [self.match_domain(word) for word in loop["name"].split()[0].split("-")]
+            if len(loop_domains) != 2 or None in loop_domains:
+                continue
+            weight = CASCADE_LOOP_WEIGHTS.get(loop.get("loop_strength"), 0.3)
+            add_edge(loop_domains[0], loop_domains[1], weight)
+            # A balancing loop pushes back on the domain that started it
+            add_edge(loop_domains[1], loop_domains[0], weight if loop.get("type") == "reinforcing" else -weight)
+        
+        self.index = {node: position for position, node in enumerate(self.nodes)}
+        self.rows = np.array([self.index[target] for target, _ in edges], dtype=np.int64)
+        self.cols = np.array([self.index[source] for _, source in edges], dtype=np.int64)
+        self.weights = np.array(list(edges.values()), dtype=float)
+        self.normalize()
+        self.results: "OrderedDict[bytes, tuple]" = OrderedDict()  # Rounded shock vector -> solver output
+        self.lock = threading.Lock()  # Cascades run in worker threads
+    
+    def normalize(self):
+        """Scale all weights by one factor so the damped spectral radius is at most CASCADE_MAX_SPECTRAL_RADIUS,
+        keeping the relative strength of every edge"""
+        adjacency = np.zeros((len(self.nodes), len(self.nodes)))
+        np.add.at(adjacency, (self.rows, self.cols), self.weights * CASCADE_DAMPING)
+        self.spectral_radius = float(np.abs(np.linalg.eigvals(adjacency)).max()) if len(self.nodes) else 0.0
+        if self.spectral_radius > CASCADE_MAX_SPECTRAL_RADIUS:
+            self.weights *= CASCADE_MAX_SPECTRAL_RADIUS / self.spectral_radius
+            self.spectral_radius = CASCADE_MAX_SPECTRAL_RADIUS
+    
+    def match_domain(self, word: str) -> Optional[str]:
+        prefix = word.lower()[:5]
+        return next((domain for domain in self.domains if domain.startswith(prefix)), None)
+    
+    def propagate(self, shock: np.ndarray) -> tuple:
+        """Iterate impact = clip(shock + damping * A @ impact) to a fixed point; returns (impact, iterations, converged, residual)"""
+        weights = self.weights * CASCADE_DAMPING
+        impact = shock.copy()
+        residual = float("inf")
+        for iteration in range(1, CASCADE_MAX_ITERATIONS + 1):
+            spread = np.bincount(self.rows, weights=weights * impact[self.cols], minlength=len(self.nodes))
+            updated = np.clip(shock + spread, 0.0, 1.0)
+            residual = float(np.abs(updated - impact).max())
+            impact = updated
+            if residual < CASCADE_TOLERANCE:
+                return impact, iteration, True, residual
+        return impact, CASCADE_MAX_ITERATIONS, False, residual
+    
+    def solve(self, shock: np.ndarray) -> tuple:
+        """propagate, memoized per shock vector for the life of this graph; returns (impact, iterations, converged, residual, cached)"""
+        key = np.round(shock, 4).tobytes()
+        with self.lock:
+            if key in self.results:
+                self.results.move_to_end(key)
+                return (*self.results[key], True)
+        solution = self.propagate(shock)
+        with self.lock:
+            self.results[key] = solution
+            while len(self.results) > CASCADE_RESULT_CACHE_SIZE:
+                self.results.popitem(last=False)
+        return (*solution, False)
+
+cascade_graph: Optional[CascadeGraph] = None
+
+def get_cascade_graph() -> CascadeGraph:
+    """Compiled once and rebuilt only when polycrisis_enhancements.json changes"""
+    global cascade_graph
+    version = POLYCRISIS_ENHANCEMENTS_FILE.stat().st_mtime
+    if cascade_graph is None or cascade_graph.version != version:
+        with open(POLYCRISIS_ENHANCEMENTS_FILE, 'r') as f:
+            cross_domain = json.load(f)["polycrisis_enhancements"]["enhancement_categories"]["cross_domain_impacts"]
+        cascade_graph = CascadeGraph(cross_domain, version)
+    return cascade_graph
+
+def scenario_cascade_shock(graph: CascadeGraph, scenario: dict) -> np.ndarray:
+    """Initial shock per node: severity times the crisis type's domain exposure, plus subsystems named in key variables"""
+    severity = scenario.get("severity_level", 5) / 10
+    crisis_type = scenario.get("crisis_type")
+    exposure = dict(zip(IMPACT_DOMAINS, CRISIS_DOMAIN_EXPOSURE.get(crisis_type, (0.8, 0.8, 0.8))))
+    exposure["technological"] = CRISIS_TECHNOLOGICAL_EXPOSURE.get(crisis_type, 0.2)
+    
+    shock = np.zeros(len(graph.nodes))
+    for domain in graph.domains:
+        shock[graph.index[domain]] = severity * exposure.get(domain, 0.5)
+    # Whole words, and every word of a multi-word subsystem, so "agriculture" doesn't hit culture,
+    # "trade-offs" doesn't hit trade and "policy" alone doesn't hit monetary_policy
+    variables = set(re.findall(r"[a-z]+(?:-[a-z]+)*", " ".join(scenario.get("key_variables") or []).lower()))
+    for node, position in graph.index.items():
+        if "." in node and all(word in variables for word in node.split(".", 1)[1].split("_")):
+            shock[position] = max(shock[position], severity * 0.8)
+    return shock
+
+def run_cascade(scenario: dict) -> CascadeResult:
+    started = time.perf_counter()
+    graph = get_cascade_graph()
+    shock = scenario_cascade_shock(graph, scenario)
+    impact, iterations, converged, residual, cached = graph.solve(shock)
+    
+    def node_impact(node: str) -> CascadeNodeImpact:
+        position = graph.index[node]
+        return CascadeNodeImpact(
+            node=node,
+            initial_shock=round(float(shock[position]), 4),
+            final_impact=round(float(impact[position]), 4),
+            amplification=round(float(impact[position] / shock[position]), 3) if shock[position] > 0 else None
+        )
+    
+    subsystems = sorted((node_impact(node) for node in graph.nodes if "." in node), key=lambda item: item.final_impact, reverse=True)
+    return CascadeResult(
+        scenario_id=scenario["id"],
+        domains=[node_impact(domain) for domain in graph.domains],
+        subsystems=subsystems,
+        iterations=iterations,
+        converged=converged,
+        residual=residual,
+        cached=cached,
+        graph_nodes=len(graph.nodes),
+        graph_edges=len(graph.weights),
+        runtime_ms=round((time.perf_counter() - started) * 1000, 3)
+    )
+
+@api_router.post("/scenarios/{scenario_id}/cascade", response_model=CascadeResult)
+async def run_scenario_cascade(scenario_id: str, current_user: User = Depends(get_current_user)):
+    """How the scenario's initial shock cascades across domains and subsystems"""
+    scenario = await db.scenarios.find_one({"id": scenario_id, "user_id": current_user.id})
+    if not scenario:
+        raise HTTPException(status_code=404, detail="Scenario not found")
+    if not POLYCRISIS_ENHANCEMENTS_FILE.exists():
+        raise HTTPException(status_code=404, detail="Polycrisis enhancements not found")
+    return await asyncio.to_thread(run_cascade, scenario)
+
+# Multi-timescale trajectory simulation
+TRAJECTORY_DEFAULT_ENSEMBLE = int(os.environ.get('TRAJECTORY_DEFAULT_ENSEMBLE', '200'))
+TRAJECTORY_MAX_ENSEMBLE = 2000
+TRAJECTORY_CHUNK_SCENARIOS = int(os.environ.get('TRAJECTORY_CHUNK_SCENARIOS', '50'))  # Scenarios simulated together per vectorized run
+HOURS_PER_UNIT = {"hour": 1, "day": 24, "week": 168, "month": 720, "year": 8760}
+
+# Per-phase rates, expressed per whole phase so every timescale gets comparable dynamics: cascades
+# dominate the first hours, recovery and adaptation take over in later phases. Later phases
+# beyond this table reuse its last entry.
+TIMESCALE_DYNAMICS = [
+    {"coupling": 2.0, "recovery": 0.1},
+    {"coupling": 1.2, "recovery": 0.6},
+    {"coupling": 0.6, "recovery": 1.2},
+    {"coupling": 0.3, "recovery": 1.6}
+]
+
+class TrajectoryRequest(BatchSimulationRequest):
+    ensemble_size: int = TRAJECTORY_DEFAULT_ENSEMBLE
+    steps_per_phase: int = 24  # Step size is each phase's duration divided by this
+    seed: Optional[int] = None
+
+def parse_duration_end_hours(duration: str) -> float:
+    """End of a timescale duration such as "1 day - 1 month" or "1 year - 10+ years", in hours"""
+    match = re.search(r"(\d+)\+?\s*(hour|day|week|month|year)s?", duration.split("-")[-1])
+    if not match:
+        raise ValueError(f"Unrecognized timescale duration: {duration}")
+    return int(match.group(1)) * HOURS_PER_UNIT[match.group(2)]
+
+class TimescaleSimulator:
+    """Euler time-stepping of domain impact over the temporal_dynamics phases, vectorized over
+    (scenarios, domains, ensemble members); only the time loop runs in Python"""
+    
+    def __init__(self, timescales: List[dict], graph: CascadeGraph, steps_per_phase: int):
+        self.domains = graph.domains
+        count = len(self.domains)
+        # Domain-to-domain block of the cascade graph; subsystem nodes come after the domains
+        block = (graph.rows < count) & (graph.cols < count)
+        self.coupling = np.zeros((count, count))
+        np.add.at(self.coupling, (graph.rows[block], graph.cols[block]), graph.weights[block] * CASCADE_DAMPING)
+        
+        self.phases = []
+        start = 0.0
+        for timescale in timescales:
+            end = parse_duration_end_hours(timescale["duration"])
+            self.phases.append({"name": timescale["name"], "start_hours": start, "end_hours": end})
+            start = end
+        self.steps_per_phase = steps_per_phase
+        self.times = np.concatenate([[0.0]] + [
+            np.linspace(phase["start_hours"], phase["end_hours"], steps_per_phase + 1)[1:] for phase in self.phases
+        ])
+    
+    def run(self, initial: np.ndarray, volatility: np.ndarray, ensemble_size: int, rng: np.random.Generator) -> np.ndarray:
+        """initial is (scenarios, domains), volatility (scenarios,). Returns p5/p50/p95 bands shaped
+        (3, scenarios, steps + 1, domains + 1), the last column being the mean over domains."""
+        scenarios, count = initial.shape
+        # Ensemble members on the last axis keep the per-step percentiles on contiguous memory
+        impact = np.clip(initial[:, :, None] * rng.lognormal(0.0, 0.15, size=(scenarios, count, ensemble_size)), 0.0, 1.0)
+        memory = impact.copy()  # Slow trace of past impact that holds back recovery
+        sigma = volatility[:, None, None]
+        fraction = 1.0 / self.steps_per_phase
+        
+        bands = np.empty((scenarios, len(self.times), count + 1, 3))
+        # Nearest-rank p5/p50/p95; one sort per step is far cheaper than np.percentile here
+        ranks = np.round(np.array([0.05, 0.5, 0.95]) * (ensemble_size - 1)).astype(int)
+        
+        def record(step: int):
+            bands[:, step, :count] = np.sort(impact, axis=2)[:, :, ranks]
+            bands[:, step, count] = np.sort(impact.mean(axis=1), axis=1)[:, ranks]
+        
+        record(0)
+        step = 0
+        for phase_index in range(len(self.phases)):
+            rates = TIMESCALE_DYNAMICS[min(phase_index, len(TIMESCALE_DYNAMICS) - 1)]
+            for _ in range(self.steps_per_phase):
+                spread = self.coupling @ impact
+                drift = rates["coupling"] * spread * (1.0 - impact) - rates["recovery"] * impact * (1.0 - 0.5 * memory)
+                noise = rng.standard_normal(impact.shape)
+                impact = np.clip(impact + drift * fraction + sigma * math.sqrt(fraction) * noise, 0.0, 1.0)
+                memory += (impact - memory) * fraction
+                step += 1
+                record(step)
+        return np.moveaxis(bands, 3, 0)
+
+def simulate_trajectories(scenarios: List[dict], ensemble_size: int, steps_per_phase: int, seed: Optional[int]) -> dict:
+    """Trajectory bands for a group of scenarios in one vectorized run"""
+    started = time.perf_counter()
+    graph = get_cascade_graph()
+    with open(POLYCRISIS_ENHANCEMENTS_FILE, 'r') as f:
+        timescales = json.load(f)["polycrisis_enhancements"]["enhancement_categories"]["temporal_dynamics"]["timescales"]
+    simulator = TimescaleSimulator(timescales, graph, steps_per_phase)
+    
+    count = len(graph.domains)
+    initial = np.array([scenario_cascade_shock(graph, scenario)[:count] for scenario in scenarios])
+    volatility = np.array([0.05 + 0.01 * min(len(scenario.get("key_variables") or []), 8) for scenario in scenarios])
+    bands = simulator.run(initial, volatility, ensemble_size, np.random.default_rng(seed))
+    
+    series_names = graph.domains + ["total"]
+    trajectories = []
+    for position, scenario in enumerate(scenarios):
+        series = {}
+        for column, name in enumerate(series_names):
+            median = bands[1, position, :, column]
+            peak = int(median.argmax())
+            series[name] = {
+                "p5": np.round(bands[0, position, :, column], 4).tolist(),
+                "p50": np.round(median, 4).tolist(),
+                "p95": np.round(bands[2, position, :, column], 4).tolist(),
+                "peak_p50": round(float(median[peak]), 4),
+                "peak_hours": float(simulator.times[peak]),
+                "final_p50": round(float(median[-1]), 4)
+            }
+        trajectories.append({"scenario_id": scenario["id"], "title": scenario.get("title"), "series": series})
+    
+    return {
+        "times_hours": simulator.times.tolist(),
+        "phases": simulator.phases,
+        "trajectories": trajectories,
+        "runtime_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
+
+@api_router.post("/scenarios/trajectories")
+async def simulate_scenario_trajectories(request: TrajectoryRequest, stream: bool = False, current_user: User = Depends(get_current_user)):
+    """Impact trajectories across the polycrisis timescales for many scenarios, by id list or filter.
+    With stream=true, trajectories arrive as SSE events one vectorized chunk of scenarios at a time."""
+    if not 10 <= request.ensemble_size <= TRAJECTORY_MAX_ENSEMBLE:
+        raise HTTPException(status_code=400, detail=f"ensemble_size must be between 10 and {TRAJECTORY_MAX_ENSEMBLE}")
+    if not 4 <= request.steps_per_phase <= 240:
+        raise HTTPException(status_code=400, detail="steps_per_phase must be between 4 and 240")
+    if not POLYCRISIS_ENHANCEMENTS_FILE.exists():
+        raise HTTPException(status_code=404, detail="Polycrisis enhancements not found")
+    
+    scenarios, missing = await find_batch_scenarios(request, current_user.id)
+    if not scenarios:
+        raise HTTPException(status_code=404, detail="No matching scenarios found")
+    chunks = [scenarios[start:start + TRAJECTORY_CHUNK_SCENARIOS] for start in range(0, len(scenarios), TRAJECTORY_CHUNK_SCENARIOS)]
+    
+    def simulate_chunk(index: int, chunk: List[dict]) -> dict:
+        # Distinct but reproducible streams per chunk when a seed is given
+        seed = None if request.seed is None else request.seed + index
+        return simulate_trajectories(chunk, request.ensemble_size, request.steps_per_phase, seed)
+    
+    if not stream:
+        try:
+            results = [await asyncio.to_thread(simulate_chunk, index, chunk) for index, chunk in enumerate(chunks)]
+        except Exception as e:
+            logging.error(f"Trajectory simulation error: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Trajectory simulation error: {str(e)}")
+        return {
+            "times_hours": results[0]["times_hours"],
+            "phases": results[0]["phases"],
+            "ensemble_size": request.ensemble_size,
+            "trajectories": [trajectory for result in results for trajectory in result["trajectories"]],
+            "not_found": missing,
+            "runtime_ms": round(sum(result["runtime_ms"] for result in results), 2)
+        }
+    
+    async def event_stream():
+        yield format_sse_event("start", {"total": len(scenarios), "not_found": missing, "ensemble_size": request.ensemble_size})
+        try:
+            for index, chunk in enumerate(chunks):
+                result = await asyncio.to_thread(simulate_chunk, index, chunk)
+                if index == 0:
+                    yield format_sse_event("timeline", {"times_hours": result["times_hours"], "phases": result["phases"]})
+                for trajectory in result["trajectories"]:
+                    yield format_sse_event("trajectory", trajectory)
+            yield format_sse_event("done", {"simulated": len(scenarios)})
+        except Exception as e:
+            logging.error(f"Trajectory stream error: {str(e)}")
+            yield format_sse_event("error", {"detail": str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Polycrisis Enhancement Endpoints
 @api_router.get("/polycrisis-enhancements/summary", response_model=PolycrisisEnhancementSummary)
 async def get_polycrisis_enhancements_summary(current_user: User = Depends(get_current_user)):
@@ -4376,8 +8209,14 @@ async def get_stakeholder_interactions(current_user: User = Depends(get_current_
         raise HTTPException(status_code=500, detail=f"Failed to get stakeholder interactions: {str(e)}")
 
 @api_router.get("/polycrisis-enhancements/uncertainty-quantification")
-async def get_uncertainty_quantification(current_user: User = Depends(get_current_user)):
-    """Get uncertainty quantification methods and approaches"""
+async def get_uncertainty_quantification(scenario_id: Optional[str] = None, current_user: User = Depends(get_current_user)):
+    """Get uncertainty quantification methods and approaches, computed for a scenario when scenario_id is given"""
+    scenario = None
+    if scenario_id:
+        scenario = await db.scenarios.find_one({"id": scenario_id, "user_id": current_user.id})
+        if not scenario:
+            raise HTTPException(status_code=404, detail="Scenario not found")
+    
     try:
         enhancements_file = Path(__file__).parent.parent / "polycrisis_enhancements.json"
         
@@ -4389,13 +8228,16 @@ async def get_uncertainty_quantification(current_user: User = Depends(get_curren
         
         uncertainty = data['polycrisis_enhancements']['enhancement_categories']['uncertainty_quantification']
         
-        return {
+        response = {
             'category': uncertainty['category'],
             'description': uncertainty['description'],
             'uncertainty_types': uncertainty['uncertainty_types'],
             'quantification_methods': uncertainty['quantification_methods'],
             'communication_strategies': uncertainty['communication_strategies']
         }
+        if scenario:
+            response['quantification'] = (await asyncio.to_thread(run_uncertainty_quantification, scenario)).dict()
+        return response
         
     except Exception as e:
         logging.error(f"Uncertainty quantification error: {str(e)}")
@@ -4531,6 +8373,7 @@ async def enhance_scenario_with_polycrisis_factors(
                 'relevant_domains': relevant_domains,
                 'key_interactions': relevant_interactions,
                 'feedback_loops': cross_domain['feedback_loops'],
+                'cascade_propagation': (await asyncio.to_thread(run_cascade, scenario)).dict(),
                 'recommendation': 'Monitor cross-domain spillover effects and feedback loops'
             }
         
@@ -4551,6 +8394,7 @@ async def enhance_scenario_with_polycrisis_factors(
                 'uncertainty_types_present': uncertainty['uncertainty_types'],
                 'recommended_methods': uncertainty['quantification_methods'],
                 'communication_strategies': uncertainty['communication_strategies'],
+                'quantification': (await asyncio.to_thread(run_uncertainty_quantification, scenario)).dict(),
                 'recommendation': 'Implement probabilistic ranges instead of point predictions'
             }
         
@@ -4808,7 +8652,7 @@ async def execute_task(task_id: str, execution_data: TaskExecution, current_user
         raise HTTPException(status_code=500, detail=f"Failed to execute task: {str(e)}")
 
 @api_router.post("/ai-avatars/tasks/{task_id}/ai-execute")
-async def ai_execute_task(task_id: str, current_user: User = Depends(get_current_user)):
+async def ai_execute_task(task_id: str, request: Request, current_user: User = Depends(get_current_user)):
     """Execute task using AI capabilities"""
     try:
         task = await db.avatar_tasks.find_one({"id": task_id, "user_id": current_user.id})
@@ -4859,23 +8703,21 @@ Please execute this task according to your competences and provide:
 Provide a professional, comprehensive response that demonstrates your expertise in the relevant areas.
 """
         
-        # Use emergentintegrations to call AI service
+        # Use the shared avatar task profile (Claude Sonnet text generation) to call AI service
         try:
-            from emergentintegrations import EmergentIntegrations
-            
-            ei = EmergentIntegrations(api_key=emergent_key)
-            
-            # Use Claude Sonnet for complex analysis tasks
-            response = await asyncio.to_thread(
-                ei.text_generation,
-                prompt=prompt,
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=4000,
-                temperature=0.3
+            ai_result = await run_until_disconnected(
+                request, send_llm_message_with_retry("avatar_task", prompt, session_id=f"avatar-task-{task_id}")
             )
-            
-            ai_result = response.get('text', 'Task execution completed but no detailed result available.')
-            
+        except (HTTPException, LlmUnavailableError) as e:
+            # Nobody is waiting for the result, or there is no result to store, so put the task back the
+            # way it was instead of completing it
+            await db.avatar_tasks.update_one(
+                {"id": task_id},
+                {"$set": {"status": task["status"], "started_at": task.get("started_at")}}
+            )
+            if isinstance(e, LlmUnavailableError):
+                raise HTTPException(status_code=503, detail=f"AI service unavailable, task not executed: {str(e)}")
+            raise
         except Exception as ai_error:
             logging.error(f"AI execution error: {str(ai_error)}")
             ai_result = f"Task execution encountered an error: {str(ai_error)}"
@@ -0,0 +1,110 @@
+import requests
+import sys
+
+def test_batch_simulation():
+    """Test POST /api/scenarios/simulate-batch by id list, by filter and in streaming mode"""
+
+    base_url = "http://localhost:8001"
+    api_url = f"{base_url}/api"
+
+    print("🧪 TESTING BATCH SCENARIO SIMULATION")
+    print("=" * 60)
+
+    login_data = {
+        "email": "test@example.com",
+        "password": "password123"
+    }
+
+    print("\n1. Testing Authentication...")
+    try:
+        response = requests.post(f"{api_url}/login", json=login_data, timeout=10)
+        if response.status_code == 200:
+            token = response.json().get('access_token')
+            print(f"✅ Authentication successful")
+            headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+        else:
+            print(f"❌ Authentication failed: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ Authentication error: {str(e)}")
+        return False
+
+    print("\n2. Creating portfolio scenarios...")
+    scenario_ids = []
+    for i in range(5):
+        scenario_data = {
+            "title": f"Portfolio Scenario {i + 1}",
+            "description": "Energy price shock propagating through regional suppliers",
+            "crisis_type": "economic_crisis",
+            "severity_level": 4 + i,
+            "affected_regions": ["Baltics"],
+            "key_variables": ["energy prices", "supplier liquidity"]
+        }
+        response = requests.post(f"{api_url}/scenarios", json=scenario_data, headers=headers, timeout=10)
+        if response.status_code != 200:
+            print(f"❌ Failed to create scenario: {response.status_code}")
+            return False
+        scenario_ids.append(response.json().get('id'))
+    print(f"✅ Created {len(scenario_ids)} scenarios")
+
+    print("\n3. Running batch by scenario ids...")
+    try:
+        batch_data = {"scenario_ids": scenario_ids + ["missing-scenario-id"], "concurrency": 3}
+        response = requests.post(f"{api_url}/scenarios/simulate-batch", json=batch_data, headers=headers, timeout=300)
+        if response.status_code == 200:
+            summary = response.json()
+            print(f"   Succeeded: {summary.get('succeeded')}, failed: {summary.get('failed')}, not found: {summary.get('not_found')}")
+            if summary.get('succeeded') == len(scenario_ids) and summary.get('not_found') == 1:
+                print(f"✅ Batch by ids completed")
+            else:
+                print(f"❌ Unexpected batch summary")
+                return False
+        else:
+            print(f"❌ Batch failed: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ Batch error: {str(e)}")
+        return False
+
+    print("\n4. Verifying persisted results...")
+    response = requests.get(f"{api_url}/scenarios/{scenario_ids[0]}/results", headers=headers, timeout=10)
+    if response.status_code == 200 and len(response.json()) >= 1:
+        print(f"✅ Simulation results stored")
+    else:
+        print(f"❌ No simulation results stored for {scenario_ids[0]}")
+        return False
+
+    print("\n5. Running streamed batch by filter...")
+    try:
+        batch_data = {"crisis_type": "economic_crisis", "min_severity_level": 6, "limit": 10}
+        response = requests.post(f"{api_url}/scenarios/simulate-batch?stream=true", json=batch_data,
+                                 headers=headers, timeout=300, stream=True)
+        events = []
+        for line in response.iter_lines(decode_unicode=True):
+            if line and line.startswith("event: "):
+                events.append(line[len("event: "):])
+        if events and events[0] == 'start' and events[-1] == 'done' and 'result' in events:
+            print(f"✅ Streamed {events.count('result')} per-scenario result event(s)")
+        else:
+            print(f"❌ Unexpected stream: {events}")
+            return False
+    except Exception as e:
+        print(f"❌ Streaming batch error: {str(e)}")
+        return False
+
+    print("\n6. Testing empty filter...")
+    response = requests.post(f"{api_url}/scenarios/simulate-batch", json={"crisis_type": "no_such_type"}, headers=headers, timeout=10)
+    if response.status_code == 404:
+        print(f"✅ Empty batch rejected with 404")
+    else:
+        print(f"❌ Expected 404, got {response.status_code}")
+        return False
+
+    print("\n" + "=" * 60)
+    print("🎉 ALL BATCH SIMULATION TESTS PASSED!")
+    print("=" * 60)
+    return True
+
+if __name__ == "__main__":
+    success = test_batch_simulation()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,116 @@
+import requests
+import sys
+import time
+
+def test_monte_carlo_simulation():
+    """Test the Monte Carlo impact engine on its own and as part of POST /api/scenarios/{id}/simulate"""
+
+    base_url = "http://localhost:8001"
+    api_url = f"{base_url}/api"
+
+    print("🧪 TESTING MONTE CARLO IMPACT SIMULATION")
+    print("=" * 60)
+
+    login_data = {
+        "email": "test@example.com",
+        "password": "password123"
+    }
+
+    print("\n1. Testing Authentication...")
+    try:
+        response = requests.post(f"{api_url}/login", json=login_data, timeout=10)
+        if response.status_code == 200:
+            token = response.json().get('access_token')
+            print(f"✅ Authentication successful")
+            headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+        else:
+            print(f"❌ Authentication failed: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ Authentication error: {str(e)}")
+        return False
+
+    print("\n2. Creating low and high severity scenarios...")
+    scenario_ids = {}
+    for severity in (2, 10):
+        scenario_data = {
+            "title": f"Monte Carlo Scenario (severity {severity})",
+            "description": "Pandemic wave straining hospitals and supply chains",
+            "crisis_type": "pandemic",
+            "severity_level": severity,
+            "affected_regions": ["Europe", "North America", "Asia"],
+            "key_variables": ["infection rate", "hospital capacity", "supply chain"]
+        }
+        response = requests.post(f"{api_url}/scenarios", json=scenario_data, headers=headers, timeout=10)
+        if response.status_code != 200:
+            print(f"❌ Failed to create scenario: {response.status_code}")
+            return False
+        scenario_ids[severity] = response.json().get('id')
+    print(f"✅ Created {len(scenario_ids)} scenarios")
+
+    print("\n3. Running the engine with 100k draws...")
+    results = {}
+    for severity, scenario_id in scenario_ids.items():
+        started = time.time()
+        response = requests.post(f"{api_url}/scenarios/{scenario_id}/monte-carlo", headers=headers, timeout=30)
+        elapsed = time.time() - started
+        if response.status_code != 200:
+            print(f"❌ Monte Carlo failed: {response.status_code}")
+            return False
+        result = response.json()
+        results[severity] = result
+        total = result['impacts']['total']
+        print(f"   Severity {severity}: total p5={total['p5']} p50={total['p50']} p95={total['p95']}, "
+              f"ABC {result['abc_probabilities']} in {result['runtime_ms']}ms (request {elapsed:.2f}s)")
+        if result['draws'] < 100000 or abs(sum(result['abc_probabilities'].values()) - 1.0) > 0.001:
+            print(f"❌ Unexpected draw count or class probabilities")
+            return False
+        if not total['p5'] <= total['p25'] <= total['p50'] <= total['p75'] <= total['p95']:
+            print(f"❌ Percentile bands are not ordered")
+            return False
+        if result['runtime_ms'] >= 1000:
+            print(f"❌ Engine took {result['runtime_ms']}ms")
+            return False
+    if results[10]['abc_probabilities']['A'] > results[2]['abc_probabilities']['A']:
+        print(f"✅ Higher severity shifts probability towards class A")
+    else:
+        print(f"❌ Severity did not shift the class distribution")
+        return False
+
+    print("\n4. Checking reproducibility...")
+    response = requests.post(f"{api_url}/scenarios/{scenario_ids[10]}/monte-carlo", headers=headers, timeout=30)
+    if response.status_code == 200 and response.json()['impacts'] == results[10]['impacts']:
+        print(f"✅ Unchanged scenario reproduces its bands")
+    else:
+        print(f"❌ Bands changed between runs")
+        return False
+
+    print("\n5. Running a full simulation...")
+    try:
+        response = requests.post(f"{api_url}/scenarios/{scenario_ids[10]}/simulate", headers=headers, timeout=180)
+        if response.status_code == 200 and response.json().get('monte_carlo'):
+            monte_carlo = response.json()['monte_carlo']
+            print(f"✅ Simulation result stores bands, most likely class {monte_carlo['most_likely_class']}")
+        else:
+            print(f"❌ Simulation result has no Monte Carlo bands: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ Simulation error: {str(e)}")
+        return False
+
+    print("\n6. Testing draw limits...")
+    response = requests.post(f"{api_url}/scenarios/{scenario_ids[2]}/monte-carlo?draws=10", headers=headers, timeout=10)
+    if response.status_code == 400:
+        print(f"✅ Too few draws rejected with 400")
+    else:
+        print(f"❌ Expected 400, got {response.status_code}")
+        return False
+
+    print("\n" + "=" * 60)
+    print("🎉 ALL MONTE CARLO SIMULATION TESTS PASSED!")
+    print("=" * 60)
+    return True
+
+if __name__ == "__main__":
+    success = test_monte_carlo_simulation()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,117 @@
+import requests
+import sys
+import time
+
+def test_septe_sensitivity():
+    """Test the SEPTE sensitivity job on POST /api/companies/{id}/scenario-adjustments/{adj_id}/sensitivity"""
+
+    base_url = "http://localhost:8001"
+    api_url = f"{base_url}/api"
+
+    print("🧪 TESTING SEPTE SENSITIVITY ANALYSIS")
+    print("=" * 60)
+
+    login_data = {
+        "email": "test@example.com",
+        "password": "password123"
+    }
+
+    print("\n1. Testing Authentication...")
+    try:
+        response = requests.post(f"{api_url}/login", json=login_data, timeout=10)
+        if response.status_code == 200:
+            token = response.json().get('access_token')
+            print(f"✅ Authentication successful")
+            headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+        else:
+            print(f"❌ Authentication failed: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ Authentication error: {str(e)}")
+        return False
+
+    print("\n2. Creating company and scenario adjustment...")
+    company_data = {
+        "company_name": "Sensitivity Test Co",
+        "industry": "Energy",
+        "company_size": "51-200",
+        "description": "Regional utility exposed to supply and policy shocks",
+        "location": "Northern Europe"
+    }
+    response = requests.post(f"{api_url}/companies", json=company_data, headers=headers, timeout=30)
+    if response.status_code != 200:
+        print(f"❌ Failed to create company: {response.status_code}")
+        return False
+    company_id = response.json().get('id')
+
+    # Environmental degradation sits near the top of its range, so it has less room to move risk
+    adjustment_data = {
+        "adjustment_name": "Sensitivity Test Adjustment",
+        "economic_crisis_pct": 70.0, "economic_stability_pct": 30.0,
+        "social_unrest_pct": 60.0, "social_cohesion_pct": 40.0,
+        "environmental_degradation_pct": 95.0, "environmental_resilience_pct": 5.0,
+        "political_instability_pct": 55.0, "political_stability_pct": 45.0,
+        "technological_disruption_pct": 40.0, "technological_advancement_pct": 60.0
+    }
+    response = requests.post(f"{api_url}/companies/{company_id}/scenario-adjustments", json=adjustment_data, headers=headers, timeout=120)
+    if response.status_code != 200:
+        print(f"❌ Failed to create adjustment: {response.status_code}")
+        return False
+    adjustment_id = response.json().get('id')
+    sensitivity_url = f"{api_url}/companies/{company_id}/scenario-adjustments/{adjustment_id}/sensitivity"
+    print(f"✅ Adjustment created: {adjustment_id}")
+
+    print("\n3. Submitting sensitivity job...")
+    response = requests.post(sensitivity_url, headers=headers, timeout=10)
+    if response.status_code != 202:
+        print(f"❌ Expected 202, got {response.status_code}")
+        return False
+    job_id = response.json().get('job_id')
+    print(f"✅ Job accepted: {job_id}")
+
+    print("\n4. Polling job status...")
+    job = {}
+    for _ in range(60):
+        job = requests.get(f"{api_url}/jobs/{job_id}", headers=headers, timeout=10).json()
+        if job.get('status') in ('completed', 'failed', 'cancelled'):
+            break
+        time.sleep(1)
+    if job.get('status') != 'completed':
+        print(f"❌ Job did not complete: {job.get('status')} - {job.get('error')}")
+        return False
+    analysis = job['result']
+    print(f"✅ {analysis['evaluations']} evaluations on {analysis['workers']} worker(s) in {analysis['runtime_ms']}ms")
+    for index in analysis['parameters']:
+        print(f"   {index['parameter']}: mu*={index['morris_mu_star']} S1={index['sobol_first_order']} ST={index['sobol_total']}")
+    if len(analysis['parameters']) != 5 or analysis['parameters'][-1]['parameter'] != 'environmental_degradation_pct':
+        print(f"❌ Expected environmental degradation to rank last")
+        return False
+    if not all(index['sobol_total'] >= index['sobol_first_order'] - 0.02 for index in analysis['parameters']):
+        print(f"❌ Total indices should not fall below first-order indices")
+        return False
+    print(f"✅ Indices are consistent")
+
+    print("\n5. Requesting the unchanged adjustment again...")
+    response = requests.post(sensitivity_url, headers=headers, timeout=10)
+    if response.status_code == 200 and response.json().get('fingerprint') == analysis['fingerprint']:
+        print(f"✅ Cached analysis returned without a new job")
+    else:
+        print(f"❌ Expected cached analysis, got {response.status_code}")
+        return False
+
+    print("\n6. Testing sample limits...")
+    response = requests.post(f"{sensitivity_url}?samples=10", headers=headers, timeout=10)
+    if response.status_code == 400:
+        print(f"✅ Too few samples rejected with 400")
+    else:
+        print(f"❌ Expected 400, got {response.status_code}")
+        return False
+
+    print("\n" + "=" * 60)
+    print("🎉 ALL SEPTE SENSITIVITY TESTS PASSED!")
+    print("=" * 60)
+    return True
+
+if __name__ == "__main__":
+    success = test_septe_sensitivity()
+    sys.exit(0 if success else 1)